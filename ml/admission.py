@@ -0,0 +1,333 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Mapping, Optional
+
+from fastapi import HTTPException
+
+from concurrency import AdaptiveConcurrencyLimiter, upstream_limiter
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLIENT_CLASS = "interactive"
+DEFAULT_CLASS_WEIGHTS = {"interactive": 4.0, "internal": 2.0, "partner": 1.0}
+
+
+def _parse_mapping(raw: Optional[str]) -> Dict[str, str]:
+    """Parse 'a:b,c:d' style environment values"""
+    result = {}
+    for item in (raw or "").split(","):
+        if ":" in item:
+            key, value = item.rsplit(":", 1)
+            if key.strip() and value.strip():
+                result[key.strip()] = value.strip()
+    return result
+
+
+class LoadShedError(HTTPException):
+    """
+    Raised when the upstream queue cannot admit a request in time
+    """
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(
+            status_code=503,
+            detail="Service is busy. Please try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class ClientIdentity:
+    key: str
+    client_class: str = DEFAULT_CLIENT_CLASS
+    budget: float = 30.0
+
+
+class SlotOutcome:
+    """Outcome of an upstream call made while holding a slot"""
+
+    __slots__ = ("status", "retry_after")
+
+    def __init__(self):
+        self.status = "ok"
+        self.retry_after: Optional[float] = None
+
+    def rate_limited(self, retry_after: Optional[float] = None):
+        self.status = "rate_limited"
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client", "tag", "future", "enqueued_at")
+
+    def __init__(self, client: ClientIdentity, tag: float, future: asyncio.Future):
+        self.client = client
+        self.tag = tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionScheduler:
+    """
+    Weighted fair admission in front of the upstream LLM.
+
+    Each client gets its own FIFO queue; queued requests are stamped with a
+    start-time fair queuing tag so clients are served in proportion to the
+    weight of their class. Total queue depth is capped and requests whose
+    estimated wait exceeds their budget are shed with a 503.
+
+    When a limiter is attached, the number of concurrent upstream calls
+    follows its adaptive limit, with `max_concurrency` as a hard ceiling.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        max_queue_depth: int = 64,
+        class_weights: Optional[Dict[str, float]] = None,
+        api_keys: Optional[Dict[str, str]] = None,
+        default_budget: float = 30.0,
+        initial_service_time: float = 2.0,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self.class_weights = dict(class_weights or DEFAULT_CLASS_WEIGHTS)
+        self.api_keys = dict(api_keys or {})
+        self.default_budget = default_budget
+        self.limiter = limiter
+
+        self.in_flight = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._last_tag: Dict[str, float] = {}
+        self._class_depth: Dict[str, int] = {}
+        self._depth = 0
+        self._virtual_time = 0.0
+        self._avg_service = initial_service_time
+        self._wakeup = None
+
+    @classmethod
+    def from_env(cls) -> "AdmissionScheduler":
+        weights = dict(DEFAULT_CLASS_WEIGHTS)
+        for name, value in _parse_mapping(os.getenv("ADMISSION_CLASS_WEIGHTS")).items():
+            try:
+                weights[name] = max(0.01, float(value))
+            except ValueError:
+                logger.warning(f"Ignoring invalid admission weight for {name}: {value}")
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64")),
+            max_queue_depth=int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "64")),
+            class_weights=weights,
+            api_keys=_parse_mapping(os.getenv("ADMISSION_API_KEYS")),
+            default_budget=float(os.getenv("ADMISSION_DEFAULT_BUDGET_SECONDS", "30")),
+            limiter=upstream_limiter,
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def identify(self, headers: Mapping[str, str], client_ip: str) -> ClientIdentity:
+        """
+        Build the client identity from an API key (if known) or the client IP
+        """
+        budget = self.default_budget
+        raw_budget = headers.get("x-request-budget-ms")
+        if raw_budget:
+            try:
+                budget = min(self.default_budget, max(0.0, float(raw_budget) / 1000.0))
+            except ValueError:
+                pass
+
+        api_key = headers.get("x-api-key")
+        if api_key:
+            digest = hashlib.sha256(api_key.encode()).hexdigest()[:12]
+            client_class = self.api_keys.get(api_key, DEFAULT_CLIENT_CLASS)
+            return ClientIdentity(key=f"key:{digest}", client_class=client_class, budget=budget)
+
+        return ClientIdentity(key=f"ip:{client_ip}", client_class=DEFAULT_CLIENT_CLASS, budget=budget)
+
+    def capacity(self) -> int:
+        """Current number of upstream calls allowed in flight"""
+        if self.limiter is None:
+            return self.max_concurrency
+        return min(self.max_concurrency, self.limiter.allowed())
+
+    def weight_for(self, client_class: str) -> float:
+        return self.class_weights.get(client_class, 1.0)
+
+    def estimate_wait(self, ahead: int) -> float:
+        """Estimated seconds until a request with `ahead` waiters before it is admitted"""
+        capacity = self.capacity()
+        if ahead == 0 and self.in_flight < capacity:
+            return 0.0
+        blocked = self.limiter.blocked_for() if self.limiter else 0.0
+        return blocked + (ahead + 1) / max(1, capacity) * self._avg_service
+
+    @asynccontextmanager
+    async def slot(self, client: Optional[ClientIdentity] = None, acquired: bool = False):
+        """
+        Hold one upstream slot for the duration of the block.
+
+        The block receives a SlotOutcome; call `rate_limited()` on it when the
+        upstream answers 429 so the limiter can back off. Pass `acquired` when
+        the slot was already taken with `try_acquire`.
+        """
+        client = client or current_client.get()
+        if not acquired:
+            await self.acquire(client)
+        started = time.monotonic()
+        outcome = SlotOutcome()
+        try:
+            yield outcome
+        except BaseException:
+            if outcome.status == "ok":
+                outcome.status = "error"
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            if self.limiter is not None:
+                self.limiter.record(outcome.status, elapsed, self.in_flight - 1, outcome.retry_after)
+            self.release(elapsed, observe=outcome.status == "ok")
+
+    def try_acquire(self, client: Optional[ClientIdentity] = None) -> bool:
+        """Take a slot only if one is free right now, without queueing behind anyone"""
+        if self.in_flight < self.capacity() and self._depth == 0:
+            self.in_flight += 1
+            self._record_admitted(client or current_client.get(), 0.0)
+            return True
+        return False
+
+    async def acquire(self, client: ClientIdentity):
+        if self.try_acquire(client):
+            return
+
+        weight = self.weight_for(client.client_class)
+        tag = max(self._virtual_time, self._last_tag.get(client.key, 0.0)) + 1.0 / weight
+        ahead = sum(1 for queue in self._queues.values() for w in queue if w.tag <= tag)
+        estimated_wait = self.estimate_wait(ahead)
+
+        if estimated_wait > client.budget:
+            self._shed(client, "budget", estimated_wait)
+
+        if self._depth >= self.max_queue_depth:
+            victim = self._push_out_candidate(client)
+            if victim is None:
+                self._shed(client, "queue_full", estimated_wait)
+            self._remove(victim)
+            metrics.inc("admission_shed_total", client_class=victim.client.client_class, reason="pushed_out")
+            victim.future.set_exception(LoadShedError(estimated_wait, "pushed_out"))
+
+        waiter = _Waiter(client, tag, asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        if self.in_flight == 0:
+            # Nothing in flight will release a slot; dispatch now or arm the back-off timer
+            self._dispatch()
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=client.budget)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(0.0, observe=False)
+            else:
+                self._remove(waiter)
+                waiter.future.cancel()
+            raise
+
+        if not waiter.future.done():
+            self._remove(waiter)
+            waiter.future.cancel()
+            self._shed(client, "timeout", self._avg_service)
+
+        # Propagates LoadShedError for pushed-out waiters
+        waiter.future.result()
+        self._record_admitted(client, time.monotonic() - waiter.enqueued_at)
+
+    def release(self, service_time: float, observe: bool = True):
+        self.in_flight = max(0, self.in_flight - 1)
+        if observe and service_time > 0:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * service_time
+        self._dispatch()
+        metrics.set_gauge("admission_in_flight", self.in_flight)
+
+    def _dispatch(self):
+        self._wakeup = None
+        while self.in_flight < self.capacity() and self._depth > 0:
+            key = min(self._queues, key=lambda k: self._queues[k][0].tag)
+            waiter = self._queues[key][0]
+            self._remove(waiter)
+            if waiter.future.done():
+                continue
+            self._virtual_time = waiter.tag
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+        if self._depth > 0 and self.in_flight == 0 and self._wakeup is None and self.limiter is not None:
+            # Upstream asked us to back off; resume dispatching once the hint expires
+            delay = self.limiter.blocked_for()
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _enqueue(self, waiter: _Waiter):
+        key = waiter.client.key
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._last_tag[key] = waiter.tag
+        self._depth += 1
+        client_class = waiter.client.client_class
+        self._class_depth[client_class] = self._class_depth.get(client_class, 0) + 1
+        metrics.set_gauge("admission_queue_depth", self._class_depth[client_class], client_class=client_class)
+
+    def _remove(self, waiter: _Waiter):
+        key = waiter.client.key
+        queue = self._queues.get(key)
+        if not queue or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._depth -= 1
+        client_class = waiter.client.client_class
+        self._class_depth[client_class] -= 1
+        metrics.set_gauge("admission_queue_depth", self._class_depth[client_class], client_class=client_class)
+        if not queue:
+            del self._queues[key]
+            if self._last_tag.get(key, 0.0) <= self._virtual_time:
+                self._last_tag.pop(key, None)
+
+    def _push_out_candidate(self, client: ClientIdentity) -> Optional[_Waiter]:
+        """Newest waiter of the longest queue, if it is longer than the arriving client's"""
+        if not self._queues:
+            return None
+        key = max(self._queues, key=lambda k: len(self._queues[k]))
+        own_length = len(self._queues.get(client.key, ()))
+        if key == client.key or len(self._queues[key]) <= own_length + 1:
+            return None
+        return self._queues[key][-1]
+
+    def _shed(self, client: ClientIdentity, reason: str, retry_after: float):
+        metrics.inc("admission_shed_total", client_class=client.client_class, reason=reason)
+        logger.warning(f"Shedding upstream request for {client.client_class} client ({reason})")
+        raise LoadShedError(retry_after, reason)
+
+    def _record_admitted(self, client: ClientIdentity, waited: float):
+        metrics.inc("admission_admitted_total", client_class=client.client_class)
+        metrics.observe("admission_wait_seconds", waited, client_class=client.client_class)
+        metrics.set_gauge("admission_in_flight", self.in_flight)
+
+
+# Identity of the client behind the current request, set by the HTTP middleware
+current_client: contextvars.ContextVar[ClientIdentity] = contextvars.ContextVar(
+    "current_client", default=ClientIdentity(key="unknown")
+)
+
+# Global admission scheduler instance
+admission_scheduler = AdmissionScheduler.from_env()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# (label, model answer) for one analyzed piece of a regimen
+Part = Tuple[str, Dict[str, Any]]
+
+
+@dataclass
+class StoredAnalysis:
+    analysis_id: str
+    scope: Hashable
+    query: str
+    regimen: Tuple[str, ...]
+    parts: List[Part]
+    stored_at: float = field(default_factory=time.time)
+
+
+class AnalysisStore:
+    """
+    Recent regimen analyses, addressable by the `analysisId` returned with
+    each response, so a regimen that grows by one medication can be
+    re-analyzed incrementally.
+
+    Each analysis is kept as the model answers it was built from (before
+    local dose and interaction findings are attached): the full analysis
+    first, then one part per medication added since. An extension is only
+    offered while the scope (knowledge/prompt versions, pet bucket) and the
+    question are unchanged and the regimen has at most `max_parts` parts.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 86400.0, max_parts: int = 4, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_parts = max_parts
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, StoredAnalysis]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "AnalysisStore":
+        return cls(
+            max_entries=int(os.getenv("ANALYSIS_STORE_MAX_ENTRIES", "5000")),
+            ttl=float(os.getenv("ANALYSIS_STORE_TTL", "86400")),
+            max_parts=int(os.getenv("INCREMENTAL_MAX_PARTS", "4")),
+            enabled=os.getenv("INCREMENTAL_ANALYSIS_ENABLED", "true").lower() == "true",
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def fingerprint(scope: Hashable, query: str, regimen: Sequence[str]) -> str:
+        """Stable id for an analysis of `regimen` within `scope`"""
+        payload = json.dumps([repr(scope), query, sorted(regimen)])
+        return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+    def store(self, scope: Hashable, query: str, regimen: Sequence[str], parts: List[Part]) -> Optional[str]:
+        if not self.enabled or self.max_entries <= 0:
+            return None
+        regimen = tuple(sorted(regimen))
+        analysis_id = self.fingerprint(scope, query, regimen)
+        with self._lock:
+            self._entries[analysis_id] = StoredAnalysis(analysis_id, scope, query, regimen, list(parts))
+            self._entries.move_to_end(analysis_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("analysis_store_entries", len(self._entries))
+        return analysis_id
+
+    def get(self, analysis_id: str) -> Optional[StoredAnalysis]:
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is None:
+                return None
+            if time.time() - entry.stored_at > self.ttl:
+                del self._entries[analysis_id]
+                return None
+            self._entries.move_to_end(analysis_id)
+            return entry
+
+    def extension(self, analysis_id: str, scope: Hashable, query: str,
+                  entries: Sequence[str]) -> Optional[Tuple[StoredAnalysis, int]]:
+        """
+        The stored analysis and the index in `entries` of the one medication
+        added to it, when `entries` (canonical 'drug@dose' per medication)
+        is that analysis plus exactly one medication. None otherwise.
+        """
+        if not self.enabled:
+            return None
+        base = self.get(analysis_id)
+        if base is None:
+            metrics.inc("incremental_analyses_total", result="unknown_id")
+            return None
+        added = Counter(entries) - Counter(base.regimen)
+        if base.scope != scope or base.query != query or sum(added.values()) != 1 \
+                or Counter(base.regimen) - Counter(entries):
+            metrics.inc("incremental_analyses_total", result="mismatch")
+            return None
+        if len(base.parts) >= self.max_parts:
+            metrics.inc("incremental_analyses_total", result="too_many_parts")
+            return None
+        metrics.inc("incremental_analyses_total", result="applied")
+        return base, list(entries).index(next(iter(added)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        metrics.set_gauge("analysis_store_entries", 0)
+
+
+# Global store of recent analyses for incremental re-analysis
+analysis_store = AnalysisStore.from_env()
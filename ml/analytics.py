@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Buffered, append-only analytics sink for per-request outcome records.
+
+Each answered AI request yields one record (canonical.request_record plus
+its source, risk level, per-stage latency and upstream tokens). `record()`
+only puts the dict on a bounded in-memory queue; a background writer
+thread drains it in batches and appends them to compressed binary files in
+ANALYTICS_DIR. When the writer falls behind, records are dropped and
+counted instead of growing memory or slowing the request.
+
+File layout (little-endian):
+
+    header   magic "PAWRXAN\\0", format version
+    block*   compressed length, record count, crc32 of the compressed bytes,
+             then zlib(record*), each record a u32 length + MessagePack map
+
+Files rotate by size and age and the oldest are pruned past ANALYTICS_MAX_FILES.
+A crash can only leave a truncated last block, which the reader skips.
+
+    python analytics.py /var/lib/pawrx/analytics --summary
+    python analytics.py /var/lib/pawrx/analytics | python cache_simulator.py -
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import queue
+import statistics
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import msgpack
+
+from metrics import metrics
+from serialization import MSGPACK_MEDIA_TYPE, encode
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PAWRXAN\x00"
+FORMAT_VERSION = 1
+FILE_SUFFIX = ".pxa"
+_HEADER = struct.Struct("<8sI")  # magic, format version
+_BLOCK = struct.Struct("<III")  # compressed length, record count, crc32
+_LENGTH = struct.Struct("<I")
+
+_STOP = object()
+
+
+class AnalyticsFormatError(ValueError):
+    """The file is not an analytics file this version can read"""
+
+
+class AnalyticsSink:
+    """
+    In-process buffer in front of rotating analytics files. Disabled unless
+    a directory is set; `record()` never blocks and never raises.
+    """
+
+    def __init__(self, directory: Optional[str] = None, queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, max_file_bytes: int = 64 * 1024 * 1024,
+                 rotate_seconds: float = 3600.0, max_files: int = 168, compression_level: int = 6):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self.compression_level = compression_level
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = 0.0
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> "AnalyticsSink":
+        return cls(
+            directory=os.getenv("ANALYTICS_DIR") or None,
+            queue_size=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("ANALYTICS_FLUSH_SECONDS", "1.0")),
+            max_file_bytes=int(float(os.getenv("ANALYTICS_FILE_MB", "64")) * 1024 * 1024),
+            rotate_seconds=float(os.getenv("ANALYTICS_ROTATE_SECONDS", "3600")),
+            max_files=int(os.getenv("ANALYTICS_MAX_FILES", "168")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def record(self, entry: Dict[str, Any]):
+        """Queue one record for the writer; dropped and counted if the buffer is full"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(entry)
+            metrics.inc("analytics_records_total", endpoint=entry.get("endpoint", "unknown"))
+        except queue.Full:
+            metrics.inc("analytics_dropped_total", reason="overflow")
+
+    def close(self):
+        """Write out buffered records, close the current file and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    # Writer thread
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                try:
+                    self._write_block(records)
+                except Exception as e:
+                    logger.error(f"Analytics write failed, dropping {len(records)} records: {e}")
+                    metrics.inc("analytics_dropped_total", value=len(records), reason="write_error")
+                    self._close_file()
+            metrics.set_gauge("analytics_buffered_records", self._queue.qsize())
+        self._close_file()
+
+    def _write_block(self, records: List[Dict[str, Any]]):
+        payload = bytearray()
+        count = 0
+        for record in records:
+            try:
+                packed = encode(record, MSGPACK_MEDIA_TYPE)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Unserializable analytics record dropped: {e}")
+                metrics.inc("analytics_dropped_total", reason="encode_error")
+                continue
+            payload += _LENGTH.pack(len(packed))
+            payload += packed
+            count += 1
+        if not count:
+            return
+        compressed = zlib.compress(bytes(payload), self.compression_level)
+        f = self._current_file()
+        f.write(_BLOCK.pack(len(compressed), count, zlib.crc32(compressed)))
+        f.write(compressed)
+        f.flush()
+        metrics.inc("analytics_batches_total")
+        metrics.inc("analytics_bytes_written_total", value=_BLOCK.size + len(compressed))
+
+    def _current_file(self):
+        if self._file is not None and (self._file.tell() >= self.max_file_bytes
+                                       or time.time() - self._opened_at >= self.rotate_seconds):
+            self._close_file()
+        if self._file is None:
+            self._opened_at = time.time()
+            self._sequence += 1
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(self._opened_at))
+            path = os.path.join(self.directory, f"analytics-{stamp}-{os.getpid()}-{self._sequence:04d}{FILE_SUFFIX}")
+            self._file = open(path, "ab")
+            if self._file.tell() == 0:
+                self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+            self._prune()
+        return self._file
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError as e:
+                logger.warning(f"Closing analytics file failed: {e}")
+            self._file = None
+
+    def _prune(self):
+        """Delete the oldest files beyond max_files (0 keeps everything)"""
+        if self.max_files <= 0:
+            return
+        for path in analytics_files(self.directory)[:-self.max_files]:
+            try:
+                os.remove(path)
+                metrics.inc("analytics_files_pruned_total")
+            except OSError as e:
+                logger.warning(f"Could not prune analytics file {path}: {e}")
+
+
+# Reader
+
+def analytics_files(directory: str) -> List[str]:
+    """Analytics files in a directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, f"*{FILE_SUFFIX}")), key=lambda p: (os.path.getmtime(p), p))
+
+
+def read_file(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the records of one file, one block in memory at a time"""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        magic, version = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise AnalyticsFormatError(f"{path} is not an analytics file")
+        if version != FORMAT_VERSION:
+            raise AnalyticsFormatError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+        while True:
+            head = f.read(_BLOCK.size)
+            if len(head) < _BLOCK.size:
+                return
+            length, count, crc = _BLOCK.unpack(head)
+            compressed = f.read(length)
+            if len(compressed) < length or zlib.crc32(compressed) != crc:
+                # Only the block being written when the process died can be incomplete
+                logger.warning(f"Skipping truncated block at the end of {path}")
+                return
+            payload = memoryview(zlib.decompress(compressed))
+            offset = 0
+            for _ in range(count):
+                (size,) = _LENGTH.unpack_from(payload, offset)
+                offset += _LENGTH.size
+                yield msgpack.unpackb(payload[offset:offset + size], raw=False)
+                offset += size
+
+
+def read_records(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Stream records from files and directories, in write order"""
+    for path in paths:
+        files = analytics_files(path) if os.path.isdir(path) else [path]
+        for file in files:
+            yield from read_file(file)
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint counts, sources, risk levels, tokens and stage latency percentiles"""
+    totals: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+        "requests": 0, "sources": Counter(), "risk_levels": Counter(), "upstream_calls": 0, "tokens": 0,
+        "stages": defaultdict(list),
+    })
+    for record in records:
+        total = totals[record.get("endpoint", "unknown")]
+        total["requests"] += 1
+        total["sources"][record.get("source", "unknown")] += 1
+        total["risk_levels"][record.get("risk_level") or "none"] += 1
+        total["upstream_calls"] += record.get("upstream_calls", 0)
+        total["tokens"] += record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+        for stage, seconds in (record.get("stages") or {}).items():
+            total["stages"][stage].append(seconds)
+
+    summary = {}
+    for endpoint, total in totals.items():
+        stages = {}
+        for stage, samples in total["stages"].items():
+            samples.sort()
+            stages[stage] = {"p50_ms": statistics.median(samples) * 1000,
+                             "p95_ms": samples[int(len(samples) * 0.95)] * 1000}
+        summary[endpoint] = {**total, "sources": dict(total["sources"]), "risk_levels": dict(total["risk_levels"]),
+                             "stages": stages}
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Stream analytics records back as JSON lines")
+    parser.add_argument("paths", nargs="+", help="analytics files or directories (ANALYTICS_DIR)")
+    parser.add_argument("--endpoint", action="append", default=[], help="only these endpoints")
+    parser.add_argument("--summary", action="store_true", help="print per-endpoint aggregates instead")
+    args = parser.parse_args(argv)
+
+    records = (r for r in read_records(args.paths) if not args.endpoint or r.get("endpoint") in args.endpoint)
+    if args.summary:
+        json.dump(summarize(records), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    for record in records:
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+
+
+# Global analytics sink (ANALYTICS_DIR, ANALYTICS_QUEUE_SIZE, ANALYTICS_BATCH_SIZE, ANALYTICS_FLUSH_SECONDS,
+# ANALYTICS_FILE_MB, ANALYTICS_ROTATE_SECONDS, ANALYTICS_MAX_FILES)
+analytics_sink = AnalyticsSink.from_env()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: analytics sink cost on the request path, and bytes on disk.
+
+Builds RECORDS outcome records the way the service does (request_record
+over brand/generic regimens, plus source, risk level, stage latencies and
+tokens) and writes them:
+
+  sync json   json.dumps + write + flush in the caller, one line per record
+  sink        AnalyticsSink.record, the background writer does the rest
+
+Reports per-record latency seen by the caller, bytes per record on disk,
+and how many records a burst BURST times the buffer size drops.
+
+    python bench_analytics.py
+"""
+
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from analytics import AnalyticsSink, analytics_files, read_records
+from canonical import request_record
+from metrics import metrics
+
+RECORDS = 20000
+BURST = 5
+SEED = 7
+
+NAMES = {"Rimadyl": "carprofen", "carprofen": "carprofen", "Neurontin": "gabapentin", "gabapentin": "gabapentin",
+         "prednisone": "prednisone", "Apoquel": "oclacitinib", "tramadol": "tramadol", "Metacam": "meloxicam"}
+DOSES = ["75 mg", "100mg", "10 mg", "16 mg", "50 mg"]
+FREQUENCIES = ["twice daily", "BID", "once daily", "SID", "three times daily"]
+
+
+def outcome_records(n: int):
+    rng = random.Random(SEED)
+    records = []
+    for i in range(n):
+        medications = [{"name": rng.choice(list(NAMES)), "dosage": rng.choice(DOSES),
+                        "frequency": rng.choice(FREQUENCIES)} for _ in range(rng.choice([1, 2, 3]))]
+        record = request_record("analyze_medications", medications, rng.choice(["dog", "cat"]),
+                                rng.choice([4.5, 12, 24, 30]), "kg", rng.randint(1, 14), "years",
+                                resolve=lambda name: NAMES.get(name))
+        source = rng.choices(["model", "cache", "knowledge_base"], [6, 3, 1])[0]
+        record.update({
+            "ts": round(1.7e9 + i * 0.05, 3),
+            "source": source,
+            "risk_level": rng.choice(["Low", "Medium", "High", "Critical"]),
+            "stages": {"rate_limit": 2e-6, "scan": rng.uniform(1e-4, 5e-4), "cache": rng.uniform(1e-4, 1e-3),
+                       **({"upstream": rng.uniform(0.5, 3.0), "parse": rng.uniform(1e-4, 1e-3)}
+                          if source == "model" else {})},
+            "upstream_calls": int(source == "model"),
+            "prompt_tokens": rng.randint(400, 900) if source == "model" else 0,
+            "completion_tokens": rng.randint(80, 250) if source == "model" else 0,
+            "response_bytes": rng.randint(600, 1500),
+            "seconds": rng.uniform(1e-3, 3.0),
+        })
+        records.append(record)
+    return records
+
+
+def timed(write, records):
+    samples = []
+    for record in records:
+        started = time.perf_counter()
+        write(record)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def bench():
+    print("📊 Analytics sink: request-path cost and bytes on disk")
+    print("=" * 50)
+    logging.disable(logging.CRITICAL)
+    records = outcome_records(RECORDS)
+    print(f"{RECORDS} outcome records\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sync.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            def write_sync(record):
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+            p50, p99 = timed(write_sync, records)
+        print(f"{'sync json':10} | p50 {p50:6.1f} µs | p99 {p99:7.1f} µs | {os.path.getsize(path) / RECORDS:6.1f} B/record")
+
+        directory = os.path.join(tmp, "analytics")
+        sink = AnalyticsSink(directory, queue_size=RECORDS)
+        p50, p99 = timed(sink.record, records)
+        sink.close()
+        size = sum(os.path.getsize(p) for p in analytics_files(directory))
+        assert sum(1 for _ in read_records([directory])) == RECORDS
+        print(f"{'sink':10} | p50 {p50:6.1f} µs | p99 {p99:7.1f} µs | {size / RECORDS:6.1f} B/record")
+
+        started = time.perf_counter()
+        sum(1 for _ in read_records([directory]))
+        print(f"\nreader: {RECORDS / (time.perf_counter() - started):,.0f} records/s")
+
+        burst = AnalyticsSink(os.path.join(tmp, "burst"), queue_size=RECORDS // BURST)
+        dropped = metrics.counter("analytics_dropped_total", reason="overflow")
+        for _ in range(BURST):
+            for record in records:
+                burst.record(record)
+        burst.close()
+        dropped = metrics.counter("analytics_dropped_total", reason="overflow") - dropped
+        print(f"burst of {BURST * RECORDS} records into a {RECORDS // BURST}-record buffer: "
+              f"{dropped:.0f} dropped, the rest written")
+
+
+if __name__ == "__main__":
+    bench()
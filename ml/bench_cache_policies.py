@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cache policies replayed from a request log written by the service.
+
+Posts REQUESTS /analyze-medications requests through the full service (fake
+upstream, request log enabled). Regimens are drawn Zipf-like from a pool
+of 60 and written the way owners type them: brand or generic names,
+'75 mg' or '75mg', 'twice daily' or 'BID', in any order. The pet comes from
+a handful of households, and the question is one of a few phrasings or none.
+The log is then replayed with cache_simulator.py under every key
+canonicalization, LRU and LFU, two capacities, and with or without a TTL
+(one second, as the whole log spans only a few seconds).
+
+    python bench_cache_policies.py
+"""
+
+import asyncio
+import logging
+import os
+import random
+import tempfile
+
+import httpx
+from openai import AsyncOpenAI
+
+import cache_simulator
+import main
+from fake_upstream import FakeUpstream, create_app
+from request_log import RequestLog
+
+REQUESTS = 3000
+SEED = 7
+# Zipf exponent for regimen popularity
+SKEW = 1.1
+
+# Each drug as it might be typed: (names, doses, frequencies)
+DRUGS = {
+    "carprofen": (["carprofen", "Rimadyl", "Carprofen"], ["75 mg", "75mg"], ["twice daily", "BID", "every 12 hours"]),
+    "gabapentin": (["gabapentin", "Neurontin"], ["100 mg", "100mg"], ["three times daily", "TID"]),
+    "prednisone": (["prednisone", "Prednisone"], ["10 mg", "10mg"], ["once daily", "SID"]),
+    "trazodone": (["trazodone", "Desyrel"], ["50 mg"], ["as needed", "once daily"]),
+    "omeprazole": (["omeprazole", "Prilosec"], ["20 mg", "20mg"], ["once daily"]),
+    "apoquel": (["oclacitinib", "Apoquel"], ["16 mg", "16mg"], ["twice daily", "BID"]),
+    "meloxicam": (["meloxicam", "Metacam"], ["1.5 mg"], ["once daily", "SID"]),
+    "tramadol": (["tramadol", "Ultram"], ["50 mg", "50mg"], ["twice daily", "q12h"]),
+}
+QUESTIONS = [None, None, "Is it safe to give these medications together?", "What side effects should I watch for?",
+             "are these safe to combine", "Can I give these with food?"]
+HOUSEHOLDS = [("dog", 12, 4, "Beagle"), ("dog", 30, 9, "Labrador"), ("dog", 24, 3, "Border Collie"),
+              ("cat", 4.5, 12, None), ("dog", 8, 1, None), ("cat", 5, 6, "Siamese")]
+
+
+def regimens(rng: random.Random):
+    drugs = sorted(DRUGS)
+    pool = set()
+    while len(pool) < 60:
+        pool.add(tuple(sorted(rng.sample(drugs, rng.choice([1, 2, 2, 3])))))
+    return sorted(pool)
+
+
+def request_body(rng: random.Random, pool, weights):
+    regimen = list(rng.choices(pool, weights)[0])
+    rng.shuffle(regimen)
+    species, weight, age, breed = HOUSEHOLDS[pool.index(tuple(sorted(regimen))) % len(HOUSEHOLDS)]
+    medications = []
+    for drug in regimen:
+        names, doses, frequencies = DRUGS[drug]
+        medications.append({"name": rng.choice(names), "dosage": rng.choice(doses), "frequency": rng.choice(frequencies)})
+    body = {"pet": {"species": species, "weight": weight, "weightUnit": "kg", "age": age, "ageUnit": "years"},
+            "medications": medications}
+    if breed:
+        body["pet"]["breed"] = breed
+    query = rng.choice(QUESTIONS)
+    if query:
+        body["query"] = query
+    return body
+
+
+async def write_log(path: str):
+    upstream = FakeUpstream(base_latency=0.0, capacity=64, rate_limit_threshold=10 ** 6)
+    main.openai_client = AsyncOpenAI(api_key="bench", base_url="http://upstream/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream))))
+    main.request_log = RequestLog(path)
+    rng = random.Random(SEED)
+    pool = regimens(rng)
+    weights = [1 / (rank + 1) ** SKEW for rank in range(len(pool))]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for _ in range(REQUESTS):
+            await client.post("/analyze-medications", json=request_body(rng, pool, weights))
+    main.request_log.close()
+    return upstream.calls
+
+
+def bench():
+    print("🗃️ Cache policies replayed from the request log")
+    print("=" * 50)
+    logging.disable(logging.CRITICAL)
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "requests.jsonl")
+        calls = asyncio.run(write_log(path))
+        print(f"{REQUESTS} requests logged, {calls} upstream calls with the production semantic cache\n")
+        cache_simulator.main([path, "--keys", ",".join(cache_simulator.KEY_CANONICALIZATIONS),
+                              "--policies", "lru,lfu", "--capacities", "10,100", "--ttls", "0,1"])
+
+
+if __name__ == "__main__":
+    bench()
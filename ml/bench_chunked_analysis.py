@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-prompt versus chunked analysis of large regimens.
+
+Runs /analyze-medications end to end against the in-process fake upstream,
+whose answers grow with the regimen (a paragraph per drug and a note per
+drug pair), are generated at DECODE_LATENCY per token and are cut off at
+max_tokens like the real API. Reports latency, how many upstream answers
+were truncated, and how many responses were unparseable fallbacks or came
+back incomplete.
+
+    python bench_chunked_analysis.py
+"""
+
+import asyncio
+import json
+import logging
+import statistics
+import time
+from itertools import combinations
+
+import httpx
+from openai import AsyncOpenAI
+
+import main
+from fake_upstream import FakeUpstream, create_app
+
+REGIMEN_SIZES = [4, 6, 8, 10, 12, 16]
+REQUESTS_PER_SIZE = 5
+DECODE_LATENCY = 0.001  # seconds per generated token
+DRUGS = ["carprofen", "prednisone", "meloxicam", "tramadol", "fluoxetine", "trazodone", "furosemide", "enalapril",
+         "gabapentin", "amoxicillin", "clopidogrel", "maropitant", "omeprazole", "phenobarbital", "ketoconazole",
+         "cyclosporine"]
+
+
+def respond(messages) -> str:
+    """An answer whose length grows with the number of drugs and drug pairs in the prompt"""
+    drugs = [line[2:] for line in messages[-1]["content"].splitlines() if line.startswith("- ")]
+    analysis = " ".join(f"{drug.title()} is generally well tolerated at labelled doses; monitor appetite, "
+                        f"hydration and energy, and report vomiting or lethargy to your veterinarian." for drug in drugs)
+    pairs = [f"{a} with {b}: no clinically significant interaction expected; monitor as usual."
+             for a, b in combinations(drugs, 2)]
+    return json.dumps({
+        "analysis": analysis + " " + " ".join(pairs),
+        "riskLevel": "Medium" if len(drugs) > 3 else "Low",
+        "recommendations": [f"Give {drug} exactly as prescribed" for drug in drugs] + ["Keep a medication log"],
+        "alternatives": [],
+        "warnings": [f"Watch for side effects of {drug}" for drug in drugs],
+        "sources": ["Plumb's Veterinary Drug Handbook"],
+    })
+
+
+async def run(label: str, chunk_threshold: int):
+    upstream = FakeUpstream(base_latency=0.05, capacity=64, rate_limit_threshold=256,
+                            responder=respond, decode_latency=DECODE_LATENCY)
+    truncated = []
+    original = upstream.complete
+
+    async def counting_complete(messages, **params):
+        completion = await original(messages, **params)
+        truncated.append(completion.finish_reason == "length")
+        return completion
+
+    upstream.complete = counting_complete
+    main.openai_client = AsyncOpenAI(api_key="bench", base_url="http://upstream/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream))))
+    main.ANALYSIS_CHUNK_THRESHOLD = chunk_threshold
+
+    print(f"\n{label}")
+    print(f"  {'drugs':>5} {'mean ms':>8} {'calls':>6} {'truncated':>10} {'fallback':>9}")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for size in REGIMEN_SIZES:
+            truncated.clear()
+            latencies, fallbacks = [], 0
+            for i in range(REQUESTS_PER_SIZE):
+                body = {
+                    "pet": {"species": "dog", "weight": 20 + i, "weightUnit": "kg", "age": 6, "ageUnit": "years"},
+                    "medications": [{"name": drug, "dosage": "10 mg", "frequency": "once daily"} for drug in DRUGS[:size]],
+                }
+                started = time.perf_counter()
+                result = (await client.post("/analyze-medications", json=body)).json()
+                latencies.append(time.perf_counter() - started)
+                # Local interaction findings may still raise the risk level of a fallback answer
+                warnings = " ".join(result.get("warnings") or [])
+                fallbacks += "Unable to parse" in warnings or "unavailable for part" in warnings
+            print(f"  {size:>5} {statistics.mean(latencies) * 1000:>8.0f} {len(truncated) / REQUESTS_PER_SIZE:>6.1f} "
+                  f"{sum(truncated) / len(truncated):>10.0%} {fallbacks / REQUESTS_PER_SIZE:>9.0%}")
+
+
+async def bench():
+    print("🧩 Large regimens: single prompt vs parallel chunks")
+    print("=" * 50)
+    print(f"max_tokens 1000, {DECODE_LATENCY * 1000:g} ms per generated token, "
+          f"chunks of {main.ANALYSIS_CHUNK_SIZE} with overlap {main.ANALYSIS_CHUNK_OVERLAP}")
+    logging.disable(logging.CRITICAL)
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    main.semantic_cache.enabled = False
+    threshold = main.ANALYSIS_CHUNK_THRESHOLD
+    await run("single prompt", 10 ** 6)
+    await run(f"chunked above {threshold} drugs", threshold)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: adaptive vs static upstream concurrency limits.
+
+Drives the production admission scheduler against the in-process fake
+upstream through a quiet period, a 429 storm and a latency spike, and
+reports goodput (requests answered within their budget per second).
+
+    python bench_concurrency.py
+"""
+
+import asyncio
+import logging
+import time
+
+from admission import AdmissionScheduler, ClientIdentity, LoadShedError
+from concurrency import AdaptiveConcurrencyLimiter
+from fake_upstream import FakeRateLimitError, FakeUpstream, Phase
+
+ARRIVAL_RATE = 400  # requests per second
+BUDGET = 1.0  # seconds per request
+RETRIES = 2
+PHASES = [
+    Phase(duration=2.0),  # quiet: plenty of capacity
+    Phase(duration=2.0, rate_limit_threshold=8),  # 429 storm
+    Phase(duration=2.0, latency_multiplier=4.0),  # latency spike
+    Phase(duration=2.0),  # recovery
+]
+MESSAGES = [{"role": "user", "content": "Analyze carprofen and prednisone for a dog"}]
+
+
+async def one_request(scheduler: AdmissionScheduler, upstream: FakeUpstream, stats: dict):
+    client = ClientIdentity(key="ip:bench", budget=BUDGET)
+    started = time.monotonic()
+    for attempt in range(RETRIES + 1):
+        try:
+            async with scheduler.slot(client) as slot:
+                try:
+                    await upstream.complete(MESSAGES)
+                except FakeRateLimitError as e:
+                    slot.rate_limited(e.retry_after)
+                    raise
+        except FakeRateLimitError:
+            continue
+        except LoadShedError:
+            stats["shed"] += 1
+            return
+        if time.monotonic() - started <= BUDGET:
+            stats["good"] += 1
+        else:
+            stats["late"] += 1
+        return
+    stats["rate_limited"] += 1
+
+
+async def run(label: str, limiter=None, static_limit: int = 64):
+    upstream = FakeUpstream(base_latency=0.05, capacity=32, rate_limit_threshold=48, phases=PHASES)
+    scheduler = AdmissionScheduler(max_concurrency=static_limit, max_queue_depth=400,
+                                   initial_service_time=0.05, limiter=limiter)
+    stats = {"good": 0, "late": 0, "shed": 0, "rate_limited": 0}
+    duration = sum(p.duration for p in PHASES)
+    tasks = []
+    started = time.monotonic()
+    sent = 0
+    while time.monotonic() - started < duration:
+        due = int((time.monotonic() - started) * ARRIVAL_RATE)
+        while sent < due:
+            tasks.append(asyncio.create_task(one_request(scheduler, upstream, stats)))
+            sent += 1
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    final_limit = f"{limiter.limit:.1f}" if limiter else str(static_limit)
+    print(f"{label:22} | goodput {stats['good'] / elapsed:7.1f} req/s | ok {stats['good']:5} | "
+          f"late {stats['late']:4} | shed {stats['shed']:4} | 429 {stats['rate_limited']:4} | "
+          f"upstream 429s {upstream.rate_limited:5} | final limit {final_limit}")
+    return stats["good"] / elapsed
+
+
+def main():
+    logging.getLogger("admission").setLevel(logging.ERROR)
+    print("⚙️  Adaptive concurrency benchmark")
+    print(f"Arrival rate {ARRIVAL_RATE} req/s, budget {BUDGET}s, phases: quiet → 429 storm → latency spike → recovery")
+    print("=" * 50)
+    results = {}
+    for limit in (4, 8, 16, 48):
+        results[f"static {limit}"] = asyncio.run(run(f"static limit {limit}", static_limit=limit))
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, max_limit=64, decrease_cooldown=0.1)
+    results["adaptive"] = asyncio.run(run("adaptive (AIMD)", limiter=limiter))
+
+    best_static = max(v for k, v in results.items() if k.startswith("static"))
+    print("=" * 50)
+    print(f"Adaptive goodput vs best static: {results['adaptive'] / best_static:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
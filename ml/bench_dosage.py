@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: throughput of the weight-normalized dose checker over large
+synthetic regimens, vectorized (check_regimen) vs a per-medication loop.
+
+    python bench_dosage.py
+"""
+
+import random
+import time
+
+from dosage import (OVERDOSE_MARGIN, UNDERDOSE_MARGIN, DoseReferenceTable, build_finding, check_regimen,
+                    normalize_species, parse_dosage, parse_frequency, weight_in_kg)
+
+NAMES = ["carprofen", "Rimadyl", "tramadol", "Apoquel", "amoxicillin", "prednisone",
+         "meloxicam", "unknownamide", "Vetprofen 75mg chewable"]
+DOSAGES = ["25mg", "75 mg", "100mg", "0.5 mg/kg", "2 mg/kg", "1/2 tablet", "250 mcg", "5mg"]
+FREQUENCIES = ["once daily", "twice daily", "BID", "every 8 hours", "q12h", "as needed", "3 times a day"]
+TABLE = DoseReferenceTable.load()
+
+
+# Mostly in-range regimens for a 30 kg dog, with the occasional out-of-range entry
+TYPICAL = [
+    ("carprofen", "75mg", "twice daily"), ("Rimadyl", "100 mg", "BID"), ("tramadol", "100mg", "every 8 hours"),
+    ("Apoquel", "16mg", "twice daily"), ("amoxicillin", "500 mg", "twice daily"), ("prednisone", "20mg", "once daily"),
+    ("meloxicam", "0.1 mg/kg", "once daily"), ("unknownamide", "5mg", "daily"),
+]
+
+
+def synthetic_regimen(size: int, seed: int = 1, outlier_rate: float = 0.05):
+    rng = random.Random(seed)
+    regimen = []
+    for _ in range(size):
+        if rng.random() < outlier_rate:
+            regimen.append({"name": rng.choice(NAMES), "dosage": rng.choice(DOSAGES),
+                            "frequency": rng.choice(FREQUENCIES)})
+        else:
+            name, dosage, frequency = rng.choice(TYPICAL)
+            regimen.append({"name": name, "dosage": dosage, "frequency": frequency})
+    return regimen
+
+
+def check_regimen_loop(species, weight, weight_unit, medications):
+    """Scalar reference implementation of the same check"""
+    weight_kg = weight_in_kg(weight, weight_unit)
+    findings = []
+    for med in medications:
+        reference = TABLE.lookup(species, med["name"])
+        dose = parse_dosage(med["dosage"])
+        per_day = parse_frequency(med["frequency"])
+        if not reference or not dose or dose.amount_mg is None or not per_day:
+            continue
+        daily = (dose.amount_mg if dose.per_kg else dose.amount_mg / weight_kg) * per_day
+        if daily > reference[1] * OVERDOSE_MARGIN or daily < reference[0] * UNDERDOSE_MARGIN:
+            findings.append(build_finding(med["name"], reference[2], daily, reference[0], reference[1],
+                                          normalize_species(species)))
+    return findings
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    print("💊 Dose checker throughput benchmark")
+    print("=" * 50)
+    for size in (10, 1_000, 10_000, 100_000):
+        regimen = synthetic_regimen(size)
+        vec_time, vec_findings = timed(check_regimen, "dog", 30, "kg", regimen, TABLE)
+        loop_time, loop_findings = timed(check_regimen_loop, "dog", 30, "kg", regimen)
+        assert vec_findings == loop_findings
+        print(f"{size:7} meds | vectorized {size / vec_time:12,.0f} meds/s ({vec_time * 1000:8.2f} ms) | "
+              f"loop {size / loop_time:12,.0f} meds/s ({loop_time * 1000:8.2f} ms) | findings {len(vec_findings)}")
+    print("Every check above ran locally; none needed an upstream model call.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: hedged upstream requests against a heavy-tailed upstream.
+
+CLIENTS concurrent clients post REQUESTS /analyze-medications requests
+through the full service against the in-process fake upstream, whose
+latency is BASE_LATENCY times a Pareto(TAIL_SHAPE) sample, so a few
+percent of completions take ten times the median or more. Compares
+latency percentiles and upstream calls with hedging off and on.
+
+    python bench_hedging.py
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+import main
+from concurrency import RequestHedger
+from fake_upstream import FakeUpstream, create_app
+from metrics import metrics
+
+CLIENTS = 8
+REQUESTS = 800
+BASE_LATENCY = 0.02
+TAIL_SHAPE = 1.5
+
+
+def body(i: int):
+    return {
+        "pet": {"species": "dog", "weight": 10 + i % 30, "weightUnit": "kg", "age": 5, "ageUnit": "years"},
+        "medications": [{"name": "carprofen", "dosage": "75 mg", "frequency": "twice daily"},
+                        {"name": "gabapentin", "dosage": "100 mg", "frequency": "twice daily"}],
+    }
+
+
+async def run(label: str, hedger: RequestHedger):
+    upstream = FakeUpstream(base_latency=BASE_LATENCY, capacity=64, rate_limit_threshold=256,
+                            latency_tail_shape=TAIL_SHAPE)
+    main.openai_client = AsyncOpenAI(api_key="bench", base_url="http://upstream/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream))))
+    main.upstream_hedger = hedger
+    fired, won = metrics.counter("upstream_hedges_fired_total"), metrics.counter("upstream_hedges_won_total")
+
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(i)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                started = time.perf_counter()
+                await client.post("/analyze-medications", json=body(i))
+                latencies.append(time.perf_counter() - started)
+        await asyncio.gather(*(worker() for _ in range(CLIENTS)))
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    fired = metrics.counter("upstream_hedges_fired_total") - fired
+    won = metrics.counter("upstream_hedges_won_total") - won
+    print(f"{label:22} | p50 {statistics.median(latencies) * 1000:6.0f} ms | p95 {pick(0.95):6.0f} ms | "
+          f"p99 {pick(0.99):6.0f} ms | max {latencies[-1] * 1000:6.0f} ms | upstream calls {upstream.calls:4} | "
+          f"hedges {fired:3.0f} fired, {won:3.0f} won")
+
+
+async def bench():
+    print("🪞 Hedged upstream requests (heavy-tailed upstream)")
+    print("=" * 50)
+    print(f"{REQUESTS} requests from {CLIENTS} clients, latency {BASE_LATENCY * 1000:g} ms x Pareto({TAIL_SHAPE:g})\n")
+    logging.disable(logging.CRITICAL)
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    main.semantic_cache.enabled = False
+    await run("no hedging", RequestHedger(enabled=False))
+    for percentile, rate in ((0.95, 0.05), (0.90, 0.10)):
+        await run(f"hedge at p{percentile * 100:g}, <= {rate:.0%}", RequestHedger(enabled=True, percentile=percentile,
+                                                                                  max_hedge_rate=rate, min_delay=0.0))
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
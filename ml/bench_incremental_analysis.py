@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full re-analysis versus incremental re-analysis as a regimen
+grows one medication at a time.
+
+Each pet starts on START_SIZE drugs and gains one drug per step up to
+FINAL_SIZE. "Full" posts the whole regimen to /analyze-medications every
+time; "incremental" also sends the previous response's analysisId, so only
+the new drug and its pairs go to the model. The in-process fake upstream
+answers with a paragraph per drug it is asked about and a note per drug
+pair, at DECODE_LATENCY per generated token and PREFILL_LATENCY per
+uncached prompt token. Reports latency and upstream tokens per step.
+
+    python bench_incremental_analysis.py
+"""
+
+import asyncio
+import json
+import logging
+import statistics
+import time
+from itertools import combinations
+
+import httpx
+from openai import AsyncOpenAI
+
+import main
+from fake_upstream import FakeUpstream, create_app
+
+PETS = 5
+START_SIZE = 2
+FINAL_SIZE = 6
+DECODE_LATENCY = 0.001  # seconds per generated token
+PREFILL_LATENCY = 0.0001  # seconds per uncached prompt token
+DRUGS = ["carprofen", "gabapentin", "tramadol", "omeprazole", "maropitant", "amoxicillin", "prednisone", "trazodone"]
+
+
+def respond(messages) -> str:
+    """Answers about every listed drug, or only about the new one and its pairs for an addition"""
+    lines = messages[-1]["content"].splitlines()
+    listed = [line[2:] for line in lines if line.startswith("- ")]
+    added = [line.split(": ", 1)[1] for line in lines if line.startswith("New medication: ")]
+    drugs = added or listed
+    pairs = [(drug, other) for drug in added for other in listed] if added else list(combinations(listed, 2))
+    return json.dumps({
+        "analysis": " ".join(f"{drug.title()} is generally well tolerated at labelled doses; monitor appetite, "
+                             f"hydration and energy, and report vomiting or lethargy." for drug in drugs)
+                    + " " + " ".join(f"{a} with {b}: no clinically significant interaction expected." for a, b in pairs),
+        "riskLevel": "Low",
+        "recommendations": [f"Give {drug} exactly as prescribed" for drug in drugs],
+        "alternatives": [],
+        "warnings": [f"Watch for side effects of {drug}" for drug in drugs],
+        "sources": ["Plumb's Veterinary Drug Handbook"],
+    })
+
+
+async def run(label: str, incremental: bool):
+    upstream = FakeUpstream(base_latency=0.05, capacity=64, rate_limit_threshold=256, prefix_cache=True,
+                            prefill_latency=PREFILL_LATENCY, responder=respond, decode_latency=DECODE_LATENCY)
+    usage = []
+    original = upstream.complete
+
+    async def counting_complete(messages, **params):
+        completion = await original(messages, **params)
+        usage.append(completion.usage)
+        return completion
+
+    upstream.complete = counting_complete
+    main.openai_client = AsyncOpenAI(api_key="bench", base_url="http://upstream/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream))))
+    main.analysis_store.clear()
+
+    print(f"\n{label}")
+    print(f"  {'drugs':>5} {'mean ms':>8} {'prompt tok':>11} {'uncached':>9} {'output tok':>11}")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        previous = [None] * PETS
+        for size in range(START_SIZE, FINAL_SIZE + 1):
+            usage.clear()
+            latencies = []
+            for pet in range(PETS):
+                body = {
+                    "pet": {"species": "dog", "weight": 8 * (pet + 1), "weightUnit": "kg", "age": 6, "ageUnit": "years"},
+                    "medications": [{"name": drug, "dosage": "10 mg", "frequency": "once daily"} for drug in DRUGS[:size]],
+                }
+                if incremental and previous[pet]:
+                    body["previousAnalysisId"] = previous[pet]
+                started = time.perf_counter()
+                result = (await client.post("/analyze-medications", json=body)).json()
+                latencies.append(time.perf_counter() - started)
+                previous[pet] = result.get("analysisId")
+            prompt = sum(u["prompt_tokens"] for u in usage) / PETS
+            uncached = sum(u["prompt_tokens"] - u["prompt_tokens_details"]["cached_tokens"] for u in usage) / PETS
+            output = sum(u["completion_tokens"] for u in usage) / PETS
+            print(f"  {size:>5} {statistics.mean(latencies) * 1000:>8.0f} {prompt:>11.0f} {uncached:>9.0f} {output:>11.0f}")
+
+
+async def bench():
+    print("➕ Growing regimens: full vs incremental re-analysis")
+    print("=" * 50)
+    print(f"{PETS} pets, {START_SIZE} -> {FINAL_SIZE} drugs, {DECODE_LATENCY * 1000:g} ms per generated token, "
+          f"at most {main.analysis_store.max_parts} parts before a full re-analysis")
+    logging.disable(logging.CRITICAL)
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    main.semantic_cache.enabled = False
+    await run("full re-analysis", incremental=False)
+    await run("incremental", incremental=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
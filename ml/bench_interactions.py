@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: regimen interaction checks with the drug-class bitsets versus
+enumerating every medication pair and looking up each class combination.
+
+Runs on the curated ontology and on a synthetic one sized like a full
+formulary (thousands of drugs, hundreds of class rules).
+
+    python bench_interactions.py
+"""
+
+import itertools
+import random
+import time
+
+from drug_classes import DrugOntology
+
+SIZES = [2, 5, 10, 20, 50]
+REGIMENS = 300
+
+
+def pairwise(ontology: DrugOntology, species: str, drugs):
+    """Baseline: every pair, every class combination"""
+    found = {}
+    for a, b in itertools.combinations(drugs, 2):
+        for own in ontology._drugs[a].bits:
+            for other in ontology._drugs[b].bits:
+                for rule in ontology._rules.get((min(own, other), max(own, other)), ()):
+                    if species in rule.species:
+                        current = found.get((a, b))
+                        if current is None or rule.outranks(current):
+                            found[(a, b)] = rule
+    return found
+
+
+def synthetic_ontology(seed: int = 11) -> DrugOntology:
+    rng = random.Random(seed)
+    ontology = DrugOntology()
+    classes = [f"class{i}" for i in range(120)]
+    for class_id in classes:
+        ontology.add_class(class_id, class_id)
+    for i in range(3000):
+        ontology.add_drug(f"drug{i}", rng.sample(classes, rng.randint(1, 3)))
+    for _ in range(400):
+        ontology.add_rule(rng.choice(classes), rng.choice(classes), "moderate", "medium", "synthetic class rule")
+    for _ in range(600):
+        ontology.add_rule(f"drug{rng.randrange(3000)}", f"drug{rng.randrange(3000)}", "major", "high", "synthetic drug rule")
+    return ontology.finalize()
+
+
+def time_per_regimen(fn, regimens) -> float:
+    started = time.perf_counter()
+    for regimen in regimens:
+        fn(regimen)
+    return (time.perf_counter() - started) / len(regimens) * 1e6
+
+
+def run(label: str, ontology: DrugOntology):
+    rng = random.Random(3)
+    names = sorted(ontology._drugs)
+    print(f"\n{label}: {len(names)} drugs, {ontology.rule_count} rules")
+    print("=" * 50)
+    for size in SIZES:
+        if size > len(names):
+            continue
+        regimens = [tuple(sorted(rng.sample(names, size))) for _ in range(REGIMENS)]
+        for regimen in regimens[:20]:
+            expected = {frozenset(pair) for pair in pairwise(ontology, "dog", regimen)}
+            assert expected == {frozenset((a, b)) for a, b, _ in ontology._match("dog", regimen)}
+        bitset = time_per_regimen(lambda r: ontology._match("dog", r), regimens)
+        naive = time_per_regimen(lambda r: pairwise(ontology, "dog", r), regimens)
+        print(f"{size:3} drugs | pairwise {naive:9.1f} µs | bitset {bitset:8.1f} µs | {naive / bitset:5.1f}x")
+
+
+def main():
+    print("💊 Regimen interaction check benchmark")
+    run("Curated ontology", DrugOntology.load())
+    run("Synthetic formulary", synthetic_ontology())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark: knowledge-base startup time and memory, JSON indexes versus the
+memory-mapped compiled file, at 1x, 100x and 1000x the curated data size.
+
+Each measurement runs in a fresh interpreter. RssAnon is private memory each
+worker pays for; RssFile is page cache shared by every worker mapping the
+same compiled file. "worker import" is everything a service worker loads
+at import with KNOWLEDGE_COMPILED_PATH set.
+
+    python bench_knowledge_load.py
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCALES = [1, 100, 1000]
+LOOKUPS = 2000
+
+
+def suffixed(name: str, k: int) -> str:
+    return name if k == 0 else f"{name} {k}"
+
+
+def scale_sources(factor: int, directory: str) -> dict:
+    """Write copies of the knowledge files with every drug, class and toxin repeated `factor` times"""
+    # Imported here: the child process must import the knowledge modules under its own measurement
+    from knowledge_store import KNOWLEDGE_SOURCES
+
+    data = {}
+    for name, path in KNOWLEDGE_SOURCES.items():
+        with open(path) as f:
+            data[name] = json.load(f)
+
+    def scale_items(items, *fields):
+        scaled = []
+        for k in range(factor):
+            for item in items:
+                copy = dict(item)
+                for field in fields:
+                    value = copy.get(field)
+                    if isinstance(value, list):
+                        copy[field] = [suffixed(v, k) for v in value]
+                    elif isinstance(value, str):
+                        copy[field] = suffixed(value, k)
+                scaled.append(copy)
+        return scaled
+
+    toxic, common, classes, interactions = data["toxic"], data["common"], data["classes"], data["interactions"]
+    for species, items in toxic["toxic_medications"].items():
+        toxic["toxic_medications"][species] = scale_items(items, "name", "brand_names")
+    toxic["drug_interactions"] = scale_items(toxic["drug_interactions"], "drug1", "drug2")
+    for species, items in common["common_medications"].items():
+        common["common_medications"][species] = scale_items(items, "name", "brand_names")
+    classes["drug_classes"] = {
+        suffixed(class_id, k).replace(" ", "_"): {
+            "name": suffixed(spec["name"], k),
+            "aliases": [suffixed(a, k) for a in spec.get("aliases", [])],
+            "members": [suffixed(m, k) for m in spec["members"]],
+        }
+        for k in range(factor) for class_id, spec in classes["drug_classes"].items()
+    }
+    classes["class_interactions"] = [
+        {**rule, "class1": suffixed(rule["class1"], k).replace(" ", "_"),
+         "class2": suffixed(rule["class2"], k).replace(" ", "_")}
+        for k in range(factor) for rule in classes["class_interactions"]
+    ]
+    interactions["drug_interactions"] = scale_items(interactions["drug_interactions"], "drug1", "drug2")
+
+    sources = {}
+    for name, path in KNOWLEDGE_SOURCES.items():
+        sources[name] = os.path.join(directory, os.path.basename(path))
+        with open(sources[name], "w") as f:
+            json.dump(data[name], f)
+    return sources
+
+
+def rss_kb() -> dict:
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def child(mode: str, sources_json: str, compiled_path: str):
+    """Runs in a fresh interpreter: load the knowledge base and report cost"""
+    import numpy  # noqa: F401  (needed by every mode, not part of the knowledge cost)
+
+    sources = json.loads(sources_json)
+    if mode != "worker":
+        from compiled_knowledge import CompiledKnowledge
+        from knowledge_store import KnowledgeStore
+    before = rss_kb()
+    started = time.perf_counter()
+    if mode == "worker":
+        # Everything a service worker loads at import, with the compiled file configured
+        os.environ.update(KNOWLEDGE_DATA_DIR=os.path.dirname(sources["toxic"]),
+                          KNOWLEDGE_INTERACTIONS_PATH=sources["interactions"], KNOWLEDGE_COMPILED_PATH=compiled_path)
+        import dosage, drug_classes, knowledge, medication_index  # noqa: F401,E401
+        from knowledge_store import knowledge_store
+        snapshot = knowledge_store.current
+        toxins, interactions = snapshot.toxins, snapshot.interactions
+    elif mode == "json":
+        snapshot = KnowledgeStore(sources=sources, poll_interval=0).current
+        toxins, interactions = snapshot.toxins, snapshot.interactions
+    elif mode == "compiled-store":
+        snapshot = KnowledgeStore(sources=sources, poll_interval=0, compiled_path=compiled_path).current
+        toxins, interactions = snapshot.toxins, snapshot.interactions
+    else:
+        kb = CompiledKnowledge(compiled_path)
+        toxins, interactions = kb.toxins, kb.interactions
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(5)
+    names = ["carprofen", "prednisone", "meloxicam", "tramadol", "fluoxetine", "furosemide", "enalapril", "xylitol"]
+    started = time.perf_counter()
+    for _ in range(LOOKUPS):
+        k = rng.randrange(int(os.environ["BENCH_SCALE"]))
+        regimen = [suffixed(n, k) for n in rng.sample(names, 4)]
+        interactions.find_interactions("dog", regimen)
+        toxins.lookup("dog", regimen[0])
+    lookup_us = (time.perf_counter() - started) / LOOKUPS * 1e6
+
+    after = rss_kb()
+    print(json.dumps({
+        "load_ms": load_seconds * 1000,
+        "lookup_us": lookup_us,
+        "anon_mb": (after["RssAnon"] - before["RssAnon"]) / 1024,
+        "file_mb": (after["RssFile"] - before["RssFile"]) / 1024,
+    }))
+
+
+def measure(mode: str, sources: dict, compiled_path: str, scale: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, json.dumps(sources), compiled_path],
+        capture_output=True, text=True, check=True,
+        env={**os.environ, "BENCH_SCALE": str(scale), "LOG_LEVEL": "ERROR"},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    print("📚 Knowledge base load benchmark (JSON indexes vs mmap'd compiled file)")
+    print("=" * 50)
+    for scale in SCALES:
+        with tempfile.TemporaryDirectory() as tmp:
+            sources = scale_sources(scale, tmp)
+            json_kb = sum(os.path.getsize(p) for p in sources.values()) / 1024
+            compiled_path = os.path.join(tmp, "knowledge.kb")
+            # Compile once up front, as a deploy step or the first worker would
+            measure("compiled-store", sources, compiled_path, scale)
+            print(f"\n{scale}x: JSON {json_kb:,.0f} KB, compiled {os.path.getsize(compiled_path) / 1024:,.0f} KB")
+            for label, mode in (("json indexes", "json"), ("compiled, fresh check", "compiled-store"),
+                                ("compiled, open only", "compiled"), ("worker import", "worker")):
+                r = measure(mode, sources, compiled_path, scale)
+                print(f"{label:22} | load {r['load_ms']:8.1f} ms | private {r['anon_mb']:7.1f} MB | "
+                      f"shared {r['file_mb']:6.1f} MB | check {r['lookup_us']:6.1f} µs")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+    else:
+        main()
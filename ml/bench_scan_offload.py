@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: small-request latency while large security scans are in flight.
+
+A client sends small /safety-check requests (answered from the knowledge
+base) one after another, while LARGE_CLIENTS clients keep posting
+/analyze-medications requests with LARGE_QUERY_CHARS-character queries.
+Compares scanning everything inline on the event loop with offloading
+large scans to the process pool.
+
+    python bench_scan_offload.py
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+
+import main
+from prompt_security import SecurityScanPool
+
+DURATION = 5.0
+LARGE_CLIENTS = 4
+LARGE_QUERY_CHARS = 30000
+SMALL = {"medication": "xylitol", "species": "dog", "weight": 10, "age": 3}
+
+
+def large_body(i: int):
+    query = (f"My dog has been on these for {i} weeks, is it safe to continue with food and what side effects "
+             "should we watch for? ") * (LARGE_QUERY_CHARS // 100)
+    return {
+        "pet": {"species": "dog", "weight": 25, "weightUnit": "kg", "age": 6, "ageUnit": "years"},
+        "medications": [{"name": "carprofen", "dosage": "75 mg", "frequency": "twice daily"}],
+        "query": query[:LARGE_QUERY_CHARS],
+    }
+
+
+async def measure(client: httpx.AsyncClient):
+    stop = time.perf_counter() + DURATION
+    small, large = [], 0
+
+    async def small_client():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            await client.post("/safety-check", params=SMALL)
+            small.append(time.perf_counter() - started)
+
+    async def large_client(n: int):
+        nonlocal large
+        i = n
+        while time.perf_counter() < stop:
+            await client.post("/analyze-medications", json=large_body(i))
+            large += 1
+            i += LARGE_CLIENTS
+
+    await asyncio.gather(small_client(), *(large_client(n) for n in range(LARGE_CLIENTS)))
+    return small, large
+
+
+async def run(label: str, workers: int):
+    # The service's own pool, so every scan call site picks up the setting
+    pool = main.scan_pool
+    pool.workers, pool.max_pending = workers, workers * 4
+    await pool.start()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        small, large = await measure(client)
+    pool.shutdown()
+    small.sort()
+    print(f"{label:22} | small p50 {statistics.median(small) * 1000:6.2f} ms | "
+          f"p99 {small[int(len(small) * 0.99)] * 1000:7.2f} ms | small req {len(small):5} | large req {large:4}")
+
+
+async def bench():
+    print("🧵 Security scans: inline vs process pool")
+    print("=" * 50)
+    workers = SecurityScanPool.from_env().workers
+    print(f"{LARGE_CLIENTS} clients sending {LARGE_QUERY_CHARS}-char queries, {DURATION:g}s per run, {workers} workers\n")
+    logging.disable(logging.CRITICAL)
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    main.semantic_cache.enabled = False
+    await run("inline", 0)
+    await run(f"process pool ({workers})", workers)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
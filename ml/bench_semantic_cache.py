@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark: semantic cache hit rate and lookup latency.
+
+Seeds one regimen's scope with the first phrasing of each cached question,
+then asks every other phrasing plus questions that were never cached:
+
+  hit rate     paraphrases answered with the answer to their own question
+  false hits   paraphrases or new questions answered with a different one
+  contrast     the second question of a near-identical pair that differs
+               only in the drug or condition, answered with the first
+
+Lookup latency is measured against scopes of growing size.
+
+    python bench_semantic_cache.py
+"""
+
+import random
+import statistics
+import time
+
+from medication_index import MedicationIndex
+from semantic_cache import SemanticCache
+
+THRESHOLDS = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+SCOPE_SIZES = [10, 100, 1000]
+LOOKUPS = 2000
+SCOPE = ("bench", "dog|w14|adult", ("carprofen@75mg x2/d", "prednisone@10mg x1/d"))
+
+# Question -> phrasings; the first phrasing is cached, the rest are asked
+PARAPHRASES = {
+    "combine": [
+        "Is it safe to give these medications together?",
+        "are these safe to combine",
+        "Can I give both of these at the same time?",
+        "is this combination ok?",
+        "Is it okay to mix these two drugs?",
+        "are these meds safe together",
+    ],
+    "side_effects": [
+        "What side effects should I watch for?",
+        "what are the side effects",
+        "Which adverse reactions should I look out for?",
+        "side effects to watch for with these?",
+        "what side effects can these medications cause",
+    ],
+    "dose": [
+        "Is this dose right for my dog?",
+        "is the dosage correct for his weight",
+        "Is this the right dose?",
+        "is this amount appropriate for my dog",
+        "is the dosing ok for her size",
+    ],
+    "food": [
+        "Should these be given with food?",
+        "should I give these with food",
+        "do these need to be taken with a meal",
+        "give with food?",
+    ],
+    "missed_dose": [
+        "What should I do if I miss a dose?",
+        "I missed a dose, what now?",
+        "what if I forget to give a dose",
+        "missed dose what do I do",
+    ],
+    "overdose": [
+        "What are the signs of an overdose?",
+        "signs of overdose to watch for",
+        "how would I know if he got too much",
+        "what does an overdose look like",
+    ],
+    "without_food": [
+        "Can these be given without food?",
+        "is it fine to give these on an empty stomach without food",
+        "can I give these without a meal",
+    ],
+    "comprehensive": [
+        "Provide a comprehensive safety analysis of these medications",
+        "give me a full safety analysis of these medications",
+        "comprehensive safety review of these meds",
+        "analyze the safety of these medications",
+    ],
+}
+
+# Questions about the same regimen that were never cached
+NEW_QUESTIONS = [
+    "How long until the medication starts working?",
+    "Can I stop prednisone suddenly?",
+    "How should I store these tablets?",
+    "Will these make him sleepy?",
+    "Can she get vaccinated while on these?",
+    "is it safe to give 150 mg instead?",
+    "Does carprofen affect the liver?",
+    "Can I split the tablets?",
+    "how long should the course last",
+    "what happens if he vomits after a dose",
+]
+
+# (cached question, question that must not reuse its answer)
+CONTRASTS = [
+    ("Is it safe to give with carprofen?", "Is it safe to give with prednisone?"),
+    ("Is it safe for kidney disease?", "Is it safe for liver disease?"),
+    ("Can she have it while pregnant?", "Can she have it while nursing?"),
+    ("Can I give this with Rimadyl?", "Can I give this with gabapentin?"),
+    ("Is this safe for a dog with heart disease?", "Is this safe for a dog with diabetes?"),
+]
+
+FILLER_WORDS = ["dose", "food", "safe", "liver", "kidney", "vomit", "sleepy", "store", "tablet", "course",
+                "week", "morning", "evening", "walk", "water", "blood", "test", "weight", "appetite", "thirst"]
+
+
+def accuracy(threshold: float, mentions):
+    cache = SemanticCache(threshold=threshold, mentions=mentions)
+    for intent, phrasings in PARAPHRASES.items():
+        cache.store(SCOPE, phrasings[0], intent)
+
+    asked = hits = false_hits = 0
+    for intent, phrasings in PARAPHRASES.items():
+        for phrasing in phrasings[1:]:
+            asked += 1
+            result = cache.lookup(SCOPE, phrasing)
+            hits += result is not None and result[0] == intent
+            false_hits += result is not None and result[0] != intent
+    new_false_hits = sum(cache.lookup(SCOPE, question) is not None for question in NEW_QUESTIONS)
+
+    contrast_hits = 0
+    for cached, asked_instead in CONTRASTS:
+        cache = SemanticCache(threshold=threshold, mentions=mentions)
+        cache.store(SCOPE, cached, cached)
+        contrast_hits += cache.lookup(SCOPE, asked_instead) is not None
+    return hits / asked, false_hits / asked, new_false_hits / len(NEW_QUESTIONS), contrast_hits / len(CONTRASTS)
+
+
+def latency(entries: int, mentions):
+    rng = random.Random(entries)
+    cache = SemanticCache(threshold=0.6, max_entries=entries, mentions=mentions)
+    for i in range(entries):
+        cache.store(SCOPE, " ".join(rng.sample(FILLER_WORDS, 5)) + f" question {i}", i)
+    queries = [" ".join(rng.sample(FILLER_WORDS, 6)) for _ in range(LOOKUPS)]
+
+    started = time.perf_counter()
+    for query in queries:
+        cache.embedder.embed(query)
+    embed_us = (time.perf_counter() - started) / LOOKUPS * 1e6
+
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        cache.lookup(SCOPE, query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return embed_us, statistics.mean(timings), timings[int(len(timings) * 0.99)]
+
+
+def main():
+    print("🔎 Semantic cache: paraphrase hit rate and lookup latency")
+    print("=" * 50)
+    paraphrases = sum(len(p) - 1 for p in PARAPHRASES.values())
+    print(f"{len(PARAPHRASES)} cached questions, {paraphrases} paraphrases, {len(NEW_QUESTIONS)} new questions, "
+          f"{len(CONTRASTS)} contrast pairs\n")
+    mentions = MedicationIndex.load().mentions
+
+    print(f"{'threshold':>9} {'hit rate':>9} {'false hits':>11} {'new q. false hits':>18} {'contrast hits':>14}")
+    for threshold in THRESHOLDS:
+        hit_rate, false_rate, new_false_rate, contrast_rate = accuracy(threshold, mentions)
+        print(f"{threshold:>9.2f} {hit_rate:>9.0%} {false_rate:>11.0%} {new_false_rate:>18.0%} {contrast_rate:>14.0%}")
+
+    print(f"\n{'entries':>9} {'embed µs':>9} {'lookup µs':>10} {'p99 µs':>8}")
+    for entries in SCOPE_SIZES:
+        embed_us, mean_us, p99_us = latency(entries, mentions)
+        print(f"{entries:>9} {embed_us:>9.1f} {mean_us:>10.1f} {p99_us:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: response serialization cost.
+
+Compares, for one analysis response and for a large batch payload:
+
+  fastapi        the previous path: response_model dump + re-validation,
+                 jsonable_encoder and json.dumps (JSONResponse)
+  orjson         negotiated_response's default JSON encoding, no re-validation
+  msgpack        the same payload as MessagePack (Accept: application/msgpack)
+
+plus the cost of rebuilding a semantic-cache hit with and without
+validation (VALIDATE_CACHED_RESPONSES).
+
+    python bench_serialization.py
+"""
+
+import asyncio
+import statistics
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from main import AIAnalysisResponse
+from serialization import MSGPACK_MEDIA_TYPE, encode
+
+SINGLE_ROUNDS = 20000
+BATCH_ROUNDS = 50
+BATCH_SIZE = 1000
+
+
+def sample_response(i: int = 0) -> AIAnalysisResponse:
+    return AIAnalysisResponse(
+        analysis=f"Carprofen and prednisone together raise the risk of gastrointestinal ulceration ({i}). " * 4,
+        riskLevel="High",
+        recommendations=["Avoid combining an NSAID with a corticosteroid",
+                         "Ask your veterinarian about a washout period",
+                         "Give with food and watch for vomiting or dark stools"],
+        alternatives=["Gabapentin for pain while on prednisone", "Omeprazole as gastroprotection"],
+        warnings=["NSAID + corticosteroid: high risk of GI ulceration"],
+        sources=["Plumb's Veterinary Drug Handbook"],
+        dosageFindings=[{"medication": "carprofen", "finding": "within_range", "severity": "low",
+                         "dose_mg_per_kg": 2.2, "range": [2.0, 4.4]}],
+        knownInteractions=[{"drugs": ["carprofen", "prednisone"], "riskLevel": "high",
+                            "message": "NSAID + corticosteroid", "classes": ["nsaid", "corticosteroid"]}],
+    )
+
+
+def timed(fn, rounds: int):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.mean(timings)
+
+
+def fastapi_encoder(field):
+    loop = asyncio.new_event_loop()
+
+    def run(payload):
+        content = loop.run_until_complete(serialize_response(field=field, response_content=payload))
+        return JSONResponse(content).body
+
+    return run
+
+
+def report(label: str, payload, field, rounds: int, unit: str, scale: float):
+    baseline_encode = fastapi_encoder(field)
+    rows = [
+        ("fastapi", lambda: baseline_encode(payload), baseline_encode(payload)),
+        ("orjson", lambda: encode(payload), encode(payload)),
+        ("msgpack", lambda: encode(payload, MSGPACK_MEDIA_TYPE), encode(payload, MSGPACK_MEDIA_TYPE)),
+    ]
+    print(f"\n{label}")
+    baseline = None
+    for name, fn, body in rows:
+        mean = timed(fn, rounds)
+        baseline = baseline or mean
+        print(f"  {name:<8} {mean * scale:>9.1f} {unit}   {len(body):>9,} bytes   {baseline / mean:>5.1f}x")
+
+
+def main():
+    print("📦 Response serialization cost")
+    print("=" * 50)
+    single = sample_response()
+    batch = [sample_response(i) for i in range(BATCH_SIZE)]
+    report("one analysis response", single, create_response_field("response", AIAnalysisResponse),
+           SINGLE_ROUNDS, "µs", 1e6)
+    report(f"batch of {BATCH_SIZE} responses", batch, create_response_field("response", list[AIAnalysisResponse]),
+           BATCH_ROUNDS, "ms", 1e3)
+
+    validated = timed(lambda: AIAnalysisResponse.model_validate(single.model_dump()), SINGLE_ROUNDS)
+    copied = timed(lambda: single.model_copy(), SINGLE_ROUNDS)
+    print("\nrebuilding a cached analysis")
+    print(f"  validate {validated * 1e6:>9.1f} µs")
+    print(f"  copy     {copied * 1e6:>9.1f} µs   {validated / copied:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
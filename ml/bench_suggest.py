@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: medication autocomplete under keystroke replay.
+
+Types each medication name one character at a time (as the React
+MedicationAutocomplete does) and times every prefix three ways: the bare
+prefix-index lookup, GET /medications/suggest inside the ASGI app
+(server side, middleware included) and as seen by an in-process client.
+Also checks that the typed medication reaches the top suggestion.
+
+    python bench_suggest.py
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+
+import main
+
+ROUNDS = 50
+TYPED = [("carprofen", "dog"), ("rimadyl", "dog"), ("meloxicam", "cat"), ("metacam", "cat"),
+         ("tramadol", "dog"), ("apoquel", "dog"), ("xylitol", "dog"), ("tylenol", "cat"),
+         ("permethrin", "cat"), ("gabapentin", "cat"), ("chocolate", "dog"), ("raisins", "dog")]
+
+
+def keystrokes():
+    for word, species in TYPED:
+        for end in range(1, len(word) + 1):
+            yield word[:end], species, word
+
+
+def timed(app, samples):
+    """ASGI wrapper recording time from request start to the last response chunk"""
+    async def wrapper(scope, receive, send):
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                samples.append(time.perf_counter() - started)
+        await app(scope, receive, timed_send)
+    return wrapper
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+async def bench():
+    print("🔎 Medication autocomplete: keystroke replay")
+    print("=" * 50)
+    logging.disable(logging.CRITICAL)
+    index = main.knowledge_store.current.suggestions
+    strokes = list(keystrokes())
+    print(f"{index.size} indexed names, {len(strokes)} keystrokes x {ROUNDS} rounds\n")
+
+    lookups = []
+    for _ in range(ROUNDS):
+        for prefix, species, _ in strokes:
+            started = time.perf_counter()
+            index.search(prefix, species, 8, main.medication_usage)
+            lookups.append(time.perf_counter() - started)
+
+    server, requests, found = [], [], 0
+    transport = httpx.ASGITransport(app=timed(main.app, server))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Far more requests than the analysis rate limit would allow
+        for _ in range(ROUNDS):
+            for prefix, species, word in strokes:
+                started = time.perf_counter()
+                response = await client.get("/medications/suggest", params={"q": prefix, "species": species})
+                requests.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.status_code
+                top = response.json()["suggestions"][:1]
+                found += prefix == word and bool(top) and word in f"{top[0]['name']} {top[0]['matched']}".lower()
+
+    for label, samples in (("index lookup", lookups), ("server side", server), ("client round trip", requests)):
+        p50, p99 = percentiles(samples)
+        print(f"{label:26} | p50 {p50 * 1e6:8.1f} µs | p99 {p99 * 1e6:8.1f} µs")
+    print(f"\nFully typed name ranked first: {found / ROUNDS:.0f}/{len(TYPED)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
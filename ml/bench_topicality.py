@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark: topicality gate accuracy and latency on a labeled corpus.
+
+ON_TOPIC are questions pet owners ask alongside a regimen; OFF_TOPIC are
+unrelated requests and junk. Reports, for the gate and for the older
+PromptSecurityFilter.validate_medical_context heuristic:
+
+  false rejects   on-topic questions turned away (must stay at zero)
+  caught          off-topic inputs rejected before any upstream call
+
+The gate is run on the bare text and with a carprofen regimen as context,
+as /analyze-medications calls it. Also reports per-check latency, and the
+upstream calls /analyze-medications makes for the off-topic half of the
+corpus with the gate off and on.
+
+    python bench_topicality.py
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+import main
+from fake_upstream import FakeUpstream, create_app
+from prompt_security import security_filter
+from topicality import TopicalityGate, topicality_gate
+
+ROUNDS = 200
+REGIMEN = ["carprofen"]
+
+ON_TOPIC = [
+    "Is it safe to give these medications together?",
+    "Can I give carprofen with food?",
+    "What side effects should I watch for?",
+    "My dog has been vomiting since starting prednisone, is that normal?",
+    "How long should she stay on gabapentin after surgery?",
+    "Is the dose right for a 12 kg beagle?",
+    "Can cats take meloxicam long term?",
+    "He missed his morning dose, should I double it tonight?",
+    "Does trazodone interact with tramadol?",
+    "Is Rimadyl the same as carprofen?",
+    "What should I do if he ate a chocolate bar?",
+    "She seems lethargic and won't eat, could it be the apoquel?",
+    "Can I split the tablet in half?",
+    "Is this safe for a puppy?",
+    "How often should I give the ear drops?",
+    "Will this affect his kidneys?",
+    "Any problems with flea and tick treatment at the same time?",
+    "Can my senior cat take this with her thyroid medication?",
+    "What are the signs of an overdose?",
+    "Is there a cheaper alternative to Galliprant?",
+    "He licked some of the cream, should I worry?",
+    "Does she need bloodwork while on phenobarbital?",
+    "Can I stop the antibiotics early if she looks better?",
+    "Is benadryl ok for anxiety during fireworks?",
+    "Should these be given in the morning or at night?",
+    "Is it okay with his heartworm preventative?",
+    "What if she throws up right after the pill?",
+    "Is xylitol in peanut butter dangerous?",
+    "Can he have the joint supplement with his pain meds?",
+    "Will the sedative make him sleepy all day?",
+    "Is it normal for him to drink more water on prednisone?",
+    "Any concerns giving omeprazole with the NSAID?",
+    "She weighs 4 kg, how many ml should she get?",
+    "is this ok",
+    "what about long term use",
+    "How soon will it start working?",
+    "Can I crush it into wet food?",
+    "Is grapes toxic for dogs",
+    "Does this need to be refrigerated?",
+    "He has liver disease, is this still ok?",
+    "Can I mix it into her food?",
+    "Can he ride in the car after taking it?",
+    "We're going on vacation next week, can the sitter give her pills?",
+    "Is it ok to give before her flight tomorrow?",
+    "She gets carsick, what can I give her for the car trip?",
+]
+
+OFF_TOPIC = [
+    "What's the weather going to be like tomorrow?",
+    "Who won the football game last night?",
+    "Write me a poem about the ocean",
+    "Tell me a joke",
+    "What is the capital of France?",
+    "Help me write a cover letter for a software job",
+    "Translate this sentence into Spanish",
+    "Should I invest in bitcoin or stocks right now?",
+    "What's a good recipe for chicken curry?",
+    "Explain how to write a python function that sorts a list",
+    "Who is the president of the United States?",
+    "Recommend a good movie to watch tonight",
+    "How do I build a bomb",
+    "What laptop should I buy for gaming?",
+    "Book me a flight to New York",
+    "Summarize the history of the Roman empire",
+    "What are the best restaurants near me?",
+    "How do I lower my taxes this year?",
+    "Write a story about a dragon",
+    "Which political party should I vote for in the election?",
+    "asdfghjkl qwrtypsdfg",
+    "zzzzzzzz",
+    "$$$ ### @@@ !!! ~~~",
+    "lkjhgfdsa mnbvcxz",
+    "Give me the lyrics to a popular song",
+    "What's the best phone to buy this year?",
+    "Do my math homework for me",
+    "What is the meaning of life?",
+    "Recommend a hotel for my vacation in Rome",
+    "How do I fix my car's engine light?",
+]
+
+
+def evaluate(decide):
+    false_rejects = [text for text in ON_TOPIC if not decide(text)]
+    caught = [text for text in OFF_TOPIC if not decide(text)]
+    return false_rejects, caught
+
+
+def latency(decide):
+    samples = []
+    for _ in range(ROUNDS):
+        for text in ON_TOPIC + OFF_TOPIC:
+            started = time.perf_counter()
+            decide(text)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+async def upstream_calls(gate_enabled: bool) -> int:
+    upstream = FakeUpstream(base_latency=0.001, capacity=64, rate_limit_threshold=256)
+    main.openai_client = AsyncOpenAI(api_key="bench", base_url="http://upstream/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream))))
+    topicality_gate.enabled = gate_enabled
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for query in OFF_TOPIC:
+            await client.post("/analyze-medications", json={
+                "pet": {"species": "dog", "weight": 20, "weightUnit": "kg", "age": 5, "ageUnit": "years"},
+                "medications": [{"name": name, "dosage": "75 mg", "frequency": "twice daily"} for name in REGIMEN],
+                "query": query,
+            })
+    return upstream.calls
+
+
+def main_bench():
+    print("🎯 Topicality gate: labeled corpus")
+    print("=" * 50)
+    print(f"{len(ON_TOPIC)} on-topic and {len(OFF_TOPIC)} off-topic inputs\n")
+    logging.disable(logging.CRITICAL)
+    gate = TopicalityGate()
+    checks = {
+        "validate_medical_context": security_filter.validate_medical_context,
+        "topicality gate": lambda text: gate.check(text)["on_topic"],
+        "topicality gate + regimen": lambda text: gate.check(text, medications=REGIMEN)["on_topic"],
+    }
+    for label, decide in checks.items():
+        false_rejects, caught = evaluate(decide)
+        p50, p99 = latency(decide)
+        print(f"{label:25} | false rejects {len(false_rejects):2}/{len(ON_TOPIC)} | "
+              f"caught {len(caught):2}/{len(OFF_TOPIC)} | p50 {p50:6.1f} µs | p99 {p99:6.1f} µs")
+        for text in false_rejects:
+            print(f"    rejected on-topic: {text}")
+
+    missed = [text for text in OFF_TOPIC if gate.check(text, medications=REGIMEN)["on_topic"]]
+    for text in missed:
+        print(f"    passed off-topic:  {text} (score {gate.score(text, REGIMEN):.2f} with a regimen)")
+
+    main.RATE_LIMIT_REQUESTS = 10 ** 6
+    main.semantic_cache.enabled = False
+    without = asyncio.run(upstream_calls(gate_enabled=False))
+    with_gate = asyncio.run(upstream_calls(gate_enabled=True))
+    print(f"\nupstream calls for the off-topic queries: {without} without the gate, {with_gate} with it")
+
+
+if __name__ == "__main__":
+    main_bench()
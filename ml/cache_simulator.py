@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Cache-policy simulator over a replayed request log.
+
+Replays the records the service writes to REQUEST_LOG_PATH (request_log.py)
+or ANALYTICS_DIR (analytics.py) against each combination of key
+canonicalization (canonical.py, the same code the service keys its caches
+on), eviction policy, capacity and TTL, and reports:
+
+  hit rate     requests that would have been answered from the cache
+  peak memory  largest footprint reached (keys, answers, per-entry overhead)
+  upstream     model calls still made, and calls and tokens saved
+
+Requests answered from the knowledge base never reach the model and are
+left out. A request the production cache answered has no upstream cost of
+its own; it is charged the mean cost of model-answered requests to the
+same endpoint.
+
+    python cache_simulator.py requests.jsonl --keys canonical,exact \\
+        --policies lru,lfu --capacities 100,1000 --ttls 0,3600
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from analytics import FILE_SUFFIX, read_records
+from canonical import KEY_CANONICALIZATIONS, Resolver, request_key
+
+# The semantic cache keeps a 1024-dim float32 query embedding per entry, plus bookkeeping
+ENTRY_OVERHEAD_BYTES = 4096 + 256
+
+
+class SimulatedCache:
+    """
+    Entry bookkeeping shared by the policies: sizes, expiry after `ttl`
+    seconds of log time (0 = never) and eviction down to `capacity`
+    entries. Subclasses choose the victim and react to hits.
+    """
+
+    name = "base"
+
+    def __init__(self, capacity: int, ttl: float = 0.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.bytes = 0
+        self.peak_bytes = 0
+        self._entries: Dict[Hashable, Tuple[int, float]] = {}
+
+    def lookup(self, key: Hashable, now: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if self.ttl and now - entry[1] > self.ttl:
+            self._remove(key)
+            return False
+        self._hit(key)
+        return True
+
+    def insert(self, key: Hashable, size: int, now: float):
+        if self.capacity <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        while len(self._entries) >= self.capacity:
+            self._remove(self._victim())
+        self._entries[key] = (size, now)
+        self._added(key)
+        self.bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+    def _remove(self, key: Hashable):
+        size, _ = self._entries.pop(key)
+        self.bytes -= size
+        self._removed(key)
+
+    def _added(self, key: Hashable):
+        pass
+
+    def _hit(self, key: Hashable):
+        pass
+
+    def _removed(self, key: Hashable):
+        pass
+
+    def _victim(self) -> Hashable:
+        raise NotImplementedError
+
+
+class FIFOCache(SimulatedCache):
+    name = "fifo"
+
+    def __init__(self, capacity: int, ttl: float = 0.0):
+        super().__init__(capacity, ttl)
+        self._order: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def _added(self, key: Hashable):
+        self._order[key] = None
+
+    def _removed(self, key: Hashable):
+        del self._order[key]
+
+    def _victim(self) -> Hashable:
+        return next(iter(self._order))
+
+
+class LRUCache(FIFOCache):
+    """Least recently used goes first (what the service's caches do)"""
+
+    name = "lru"
+
+    def _hit(self, key: Hashable):
+        self._order.move_to_end(key)
+
+
+class LFUCache(SimulatedCache):
+    """Least frequently used goes first, oldest first among equals"""
+
+    name = "lfu"
+
+    def __init__(self, capacity: int, ttl: float = 0.0):
+        super().__init__(capacity, ttl)
+        self._counts: Dict[Hashable, Tuple[int, int]] = {}
+        self._heap: List[Tuple[int, int, Any]] = []
+        self._seq = 0
+
+    def _push(self, key: Hashable, count: int):
+        self._seq += 1
+        self._counts[key] = (count, self._seq)
+        heapq.heappush(self._heap, (count, self._seq, key))
+
+    def _added(self, key: Hashable):
+        self._push(key, 1)
+
+    def _hit(self, key: Hashable):
+        self._push(key, self._counts[key][0] + 1)
+
+    def _removed(self, key: Hashable):
+        del self._counts[key]
+
+    def _victim(self) -> Hashable:
+        # Heap entries are superseded on every hit; skip the stale ones
+        while True:
+            count, seq, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == (count, seq):
+                return key
+
+
+POLICIES = {cls.name: cls for cls in (LRUCache, LFUCache, FIFOCache)}
+
+
+@dataclass
+class SimulationResult:
+    canonicalization: str
+    policy: str
+    capacity: int
+    ttl: float
+    requests: int = 0
+    hits: int = 0
+    peak_bytes: int = 0
+    upstream_calls: float = 0.0
+    calls_saved: float = 0.0
+    tokens_saved: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+
+def read_log(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Request records from a request log, skipping blank or foreign lines"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict) and "endpoint" in record and "medications" in record:
+            yield record
+
+
+def model_costs(records: Sequence[Dict[str, Any]]) -> Dict[str, Tuple[float, float]]:
+    """Mean (upstream calls, tokens) of model-answered requests per endpoint"""
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for record in records:
+        if record.get("source") == "model":
+            total = totals[record["endpoint"]]
+            total[0] += 1
+            total[1] += record.get("upstream_calls", 0)
+            total[2] += record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+    return {endpoint: (calls / n, tokens / n) for endpoint, (n, calls, tokens) in totals.items()}
+
+
+def simulate(records: Sequence[Dict[str, Any]], canonicalization: str = "canonical", policy: str = "lru",
+             capacity: int = 2000, ttl: float = 0.0, resolve: Optional[Resolver] = None,
+             entry_overhead: int = ENTRY_OVERHEAD_BYTES) -> SimulationResult:
+    """Replay `records` (in log order) through one cache configuration"""
+    cache = POLICIES[policy](capacity, ttl)
+    result = SimulationResult(canonicalization, policy, capacity, ttl)
+    means = model_costs(records)
+    for record in records:
+        if record.get("source") == "knowledge_base":
+            continue
+        if record.get("source") == "model":
+            calls = record.get("upstream_calls", 0)
+            tokens = record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+        else:
+            calls, tokens = means.get(record["endpoint"], (1.0, 0.0))
+        key = request_key(record, canonicalization, resolve)
+        now = record.get("ts", 0.0)
+        result.requests += 1
+        if cache.lookup(key, now):
+            result.hits += 1
+            result.calls_saved += calls
+            result.tokens_saved += tokens
+        else:
+            result.upstream_calls += calls
+            cache.insert(key, len(repr(key)) + record.get("response_bytes", 0) + entry_overhead, now)
+    result.peak_bytes = cache.peak_bytes
+    return result
+
+
+def _list(value: str, cast=str) -> List[Any]:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay a request log against cache policies")
+    parser.add_argument("log", help="request log written by the service (REQUEST_LOG_PATH), '-' for stdin, "
+                                    "or an analytics file or directory (ANALYTICS_DIR)")
+    parser.add_argument("--keys", default="canonical", type=_list,
+                        help=f"key canonicalizations ({', '.join(KEY_CANONICALIZATIONS)})")
+    parser.add_argument("--policies", default="lru,lfu", type=_list, help=f"eviction policies ({', '.join(POLICIES)})")
+    parser.add_argument("--capacities", default="100,1000,10000", type=lambda v: _list(v, int),
+                        help="cache sizes in entries")
+    parser.add_argument("--ttls", default="0,3600", type=lambda v: _list(v, float), help="entry lifetimes in seconds, 0 = none")
+    parser.add_argument("--endpoints", default="", type=_list, help="only replay these endpoints")
+    parser.add_argument("--entry-overhead", default=ENTRY_OVERHEAD_BYTES, type=int, help="bytes per entry besides key and answer")
+    args = parser.parse_args(argv)
+
+    for name in args.keys:
+        if name not in KEY_CANONICALIZATIONS:
+            parser.error(f"unknown key canonicalization: {name}")
+    for name in args.policies:
+        if name not in POLICIES:
+            parser.error(f"unknown policy: {name}")
+
+    if os.path.isdir(args.log) or args.log.endswith(FILE_SUFFIX):
+        records = [r for r in read_records([args.log]) if "medications" in r]
+    else:
+        with (sys.stdin if args.log == "-" else open(args.log)) as f:
+            records = list(read_log(f))
+    records = [r for r in records if not args.endpoints or r["endpoint"] in args.endpoints]
+    resolve = None
+    if "drugs_only" in args.keys or any("regimen" not in r for r in records):
+        from knowledge_store import knowledge_store
+        resolve = knowledge_store.current.interactions.resolve
+
+    local = sum(1 for r in records if r.get("source") == "knowledge_base")
+    print(f"{len(records)} requests ({local} answered from the knowledge base, not replayed)")
+    print(f"{'key':20} {'policy':6} {'capacity':>8} {'ttl':>6} | {'hit rate':>8} {'peak MB':>8} | "
+          f"{'upstream':>8} {'saved':>7} {'tokens saved':>12}")
+    for name in args.keys:
+        for policy in args.policies:
+            for capacity in args.capacities:
+                for ttl in args.ttls:
+                    r = simulate(records, name, policy, capacity, ttl, resolve, args.entry_overhead)
+                    print(f"{name:20} {policy:6} {capacity:>8} {ttl:>6g} | {r.hit_rate:>8.1%} "
+                          f"{r.peak_bytes / 1e6:>8.2f} | {r.upstream_calls:>8.0f} {r.calls_saved:>7.0f} "
+                          f"{r.tokens_saved:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
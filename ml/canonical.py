@@ -0,0 +1,169 @@
+import math
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from dosage import parse_dosage, parse_frequency, weight_in_kg
+from knowledge import normalize_name, normalize_species
+
+# Canonical forms of a request, used wherever two requests must count as
+# "the same regimen for the same kind of pet" (caching, analytics).
+
+# Neighbouring weights share a bucket; each bucket spans a factor of 1.25
+WEIGHT_BUCKET_RATIO = 1.25
+
+AGE_UNITS_YEARS = {
+    "year": 1.0, "years": 1.0, "yr": 1.0, "yrs": 1.0, "y": 1.0,
+    "month": 1 / 12, "months": 1 / 12, "mo": 1 / 12,
+    "week": 7 / 365, "weeks": 7 / 365, "wk": 7 / 365, "wks": 7 / 365,
+    "day": 1 / 365, "days": 1 / 365,
+}
+
+# Age (in years) at which each species counts as senior
+SENIOR_AGE_YEARS = {"dog": 7.0, "cat": 11.0}
+DEFAULT_SENIOR_AGE_YEARS = 8.0
+
+# Breeds commonly carrying the MDR1 (ABCB1) mutation change the safe answer
+# for several drugs, so they never share a bucket with other breeds
+MDR1_BREEDS = {
+    "collie", "rough collie", "smooth collie", "border collie", "australian shepherd",
+    "miniature australian shepherd", "shetland sheepdog", "sheltie", "old english sheepdog",
+    "english shepherd", "german shepherd", "long haired whippet", "silken windhound", "mcnab",
+}
+
+Resolver = Callable[[str], Optional[str]]
+
+
+def canonical_medication(name: str, resolve: Optional[Resolver] = None) -> str:
+    """Curated canonical drug name when the resolver knows it, else the normalized text"""
+    return (resolve(name) if resolve else None) or normalize_name(name)
+
+
+def canonical_dose(dosage: Optional[str], frequency: Optional[str]) -> str:
+    """'75 mg' + 'twice daily' and '75mg' + 'BID' both become '75mg x2/d'"""
+    parsed = parse_dosage(dosage or "")
+    per_day = parse_frequency(frequency or "")
+    amount = f"{parsed.amount:g}{parsed.unit}{'/kg' if parsed.per_kg else ''}" if parsed else normalize_name(dosage or "")
+    times = f"x{per_day:g}/d" if per_day else normalize_name(frequency or "")
+    return " ".join(part for part in (amount, times) if part)
+
+
+def canonical_regimen(medications: Sequence[Dict[str, Any]], resolve: Optional[Resolver] = None) -> Tuple[str, ...]:
+    """Order-independent regimen key: sorted 'drug@dose' entries"""
+    entries = []
+    for med in medications:
+        name = canonical_medication(med.get("name", ""), resolve)
+        dose = canonical_dose(med.get("dosage"), med.get("frequency"))
+        entries.append(f"{name}@{dose}" if dose else name)
+    return tuple(sorted(entries))
+
+
+def weight_bucket(weight: Optional[float], unit: Optional[str] = "kg") -> str:
+    kg = weight_in_kg(weight, unit) if weight is not None else None
+    if not kg:
+        return "w?"
+    return f"w{round(math.log(kg) / math.log(WEIGHT_BUCKET_RATIO))}"
+
+
+def life_stage(species: str, age: Optional[float], unit: Optional[str] = "years") -> str:
+    scale = AGE_UNITS_YEARS.get((unit or "years").strip().lower())
+    if age is None or scale is None or age < 0:
+        return "unknown"
+    years = age * scale
+    if years < 1:
+        return "juvenile"
+    if years >= SENIOR_AGE_YEARS.get(normalize_species(species), DEFAULT_SENIOR_AGE_YEARS):
+        return "senior"
+    return "adult"
+
+
+def pet_bucket(species: str, weight: Optional[float] = None, weight_unit: Optional[str] = "kg",
+               age: Optional[float] = None, age_unit: Optional[str] = "years", breed: Optional[str] = None) -> str:
+    """Species, weight band, life stage and MDR1 flag, e.g. 'dog|w14|senior|mdr1'"""
+    parts = [normalize_species(species) or "unknown", weight_bucket(weight, weight_unit),
+             life_stage(species, age, age_unit)]
+    if breed and normalize_name(breed) in MDR1_BREEDS:
+        parts.append("mdr1")
+    return "|".join(parts)
+
+
+def request_record(endpoint: str, medications: Sequence[Dict[str, Any]], species: str,
+                   weight: Optional[float] = None, weight_unit: Optional[str] = "kg",
+                   age: Optional[float] = None, age_unit: Optional[str] = "years",
+                   breed: Optional[str] = None, query: Optional[str] = None,
+                   resolve: Optional[Resolver] = None) -> Dict[str, Any]:
+    """
+    Loggable description of one request: its inputs as sent plus the
+    canonical regimen and pet bucket the service keys caches on. Replayed
+    by cache_simulator.py under other canonicalizations (request_key).
+    """
+    medications = [{"name": med.get("name", ""), "dosage": med.get("dosage"), "frequency": med.get("frequency")}
+                   for med in medications]
+    return {
+        "endpoint": endpoint,
+        "species": species,
+        "weight": weight,
+        "weight_unit": weight_unit,
+        "age": age,
+        "age_unit": age_unit,
+        "breed": breed,
+        "medications": medications,
+        "query": query,
+        "pet_bucket": pet_bucket(species, weight, weight_unit, age, age_unit, breed),
+        "regimen": list(canonical_regimen(medications, resolve)),
+    }
+
+
+def _regimen(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple[str, ...]:
+    return canonical_regimen(record.get("medications") or [], resolve)
+
+
+def _pet(record: Dict[str, Any]) -> str:
+    return pet_bucket(record.get("species", ""), record.get("weight"), record.get("weight_unit"),
+                      record.get("age"), record.get("age_unit"), record.get("breed"))
+
+
+def _exact_key(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple:
+    """Inputs exactly as sent, medication order included"""
+    medications = tuple((med.get("name"), med.get("dosage"), med.get("frequency"))
+                        for med in record.get("medications") or [])
+    return (record["endpoint"], record.get("species"), record.get("weight"), record.get("weight_unit"),
+            record.get("age"), record.get("age_unit"), record.get("breed"), medications, record.get("query"))
+
+
+def _normalized_key(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple:
+    """Normalized text and doses, but brand and generic names stay distinct"""
+    return record["endpoint"], _pet(record), _regimen(record, None), normalize_name(record.get("query") or "")
+
+
+def _canonical_key(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple:
+    """The regimen and pet bucket the service logged, plus the normalized question"""
+    return _canonical_any_query_key(record, resolve) + (normalize_name(record.get("query") or ""),)
+
+
+def _canonical_any_query_key(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple:
+    """As canonical, but any question about the regimen counts (upper bound for the semantic cache)"""
+    regimen = tuple(record["regimen"]) if "regimen" in record else _regimen(record, resolve)
+    return record["endpoint"], record.get("pet_bucket") or _pet(record), regimen
+
+
+def _drugs_only_key(record: Dict[str, Any], resolve: Optional[Resolver]) -> Tuple:
+    """Drugs and species only, ignoring doses and the pet's size and age"""
+    drugs = {canonical_medication(med.get("name", ""), resolve) for med in record.get("medications") or []}
+    return record["endpoint"], normalize_species(record.get("species", "")), tuple(sorted(drugs))
+
+
+# Ways to decide that two logged requests ask the same thing, finest first.
+# "canonical" is what the service keys its caches on; it uses the logged
+# regimen and bucket, so it matches the knowledge version in use at the time.
+KEY_CANONICALIZATIONS: Dict[str, Callable[[Dict[str, Any], Optional[Resolver]], Tuple]] = {
+    "exact": _exact_key,
+    "normalized": _normalized_key,
+    "canonical": _canonical_key,
+    "canonical_any_query": _canonical_any_query_key,
+    "drugs_only": _drugs_only_key,
+}
+
+
+def request_key(record: Dict[str, Any], canonicalization: str = "canonical",
+                resolve: Optional[Resolver] = None) -> Tuple:
+    """Cache key for a logged request under one of KEY_CANONICALIZATIONS"""
+    return KEY_CANONICALIZATIONS[canonicalization](record, resolve)
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from openai.types.chat import ChatCompletion
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODES = (MODE_OFF, MODE_RECORD, MODE_REPLAY)
+
+
+def prompt_hash(messages: List[Dict[str, str]]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    """Cassette key: the prompt hash plus every other request parameter"""
+    canonical = {k: v for k, v in params.items() if k != "messages"}
+    canonical["prompt_hash"] = prompt_hash(params.get("messages", []))
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class CassetteMissError(HTTPException):
+    """
+    Raised in replay mode when no response was recorded for a request
+    """
+
+    def __init__(self, key: str, prompt: str):
+        super().__init__(status_code=500, detail=f"No recorded upstream response for request {key} "
+                                                 f"(prompt {prompt[:12]}); re-record the cassette")
+        self.key = key
+
+
+class UpstreamCassette:
+    """
+    Record/replay store for upstream chat completions.
+
+    In record mode each successful call is saved under a key derived from
+    the prompt hash and request parameters, with the response body and the
+    observed latency, as one JSON file per key in `directory`. In replay
+    mode those responses are served in recorded order (cycling when a
+    request repeats more often than it was recorded), optionally after the
+    recorded latency; a request that was never recorded raises
+    CassetteMissError instead of reaching the network.
+    """
+
+    def __init__(self, mode: str = MODE_OFF, directory: str = "cassettes", replay_latency: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.directory = directory
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "UpstreamCassette":
+        return cls(
+            mode=os.getenv("UPSTREAM_CASSETTE_MODE", MODE_OFF).lower(),
+            directory=os.getenv("UPSTREAM_CASSETTE_DIR", "cassettes"),
+            replay_latency=os.getenv("UPSTREAM_CASSETTE_REPLAY_LATENCY", "false").lower() == "true",
+        )
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    async def complete(self, create: Optional[Callable[..., Awaitable[Any]]], **params) -> Any:
+        """Run `create(**params)`, recording or replaying it according to the mode"""
+        if self.mode == MODE_REPLAY:
+            return await self._replay(params)
+        started = time.perf_counter()
+        response = await create(**params)
+        if self.mode == MODE_RECORD:
+            self._record(params, response, time.perf_counter() - started)
+        return response
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _cassette(self, key: str) -> Optional[Dict[str, Any]]:
+        if key not in self._loaded:
+            try:
+                with open(self._path(key)) as f:
+                    self._loaded[key] = json.load(f)
+            except FileNotFoundError:
+                self._loaded[key] = None
+        return self._loaded[key]
+
+    async def _replay(self, params: Dict[str, Any]) -> ChatCompletion:
+        key = request_key(params)
+        with self._lock:
+            cassette = self._cassette(key)
+            if not cassette or not cassette["interactions"]:
+                metrics.inc("upstream_cassette_requests_total", result="miss")
+                logger.error(f"Upstream cassette miss for request {key} in {self.directory}")
+                raise CassetteMissError(key, prompt_hash(params.get("messages", [])))
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            interaction = cassette["interactions"][position % len(cassette["interactions"])]
+        metrics.inc("upstream_cassette_requests_total", result="hit")
+        if self.replay_latency:
+            await asyncio.sleep(interaction["latency"])
+        return ChatCompletion.model_validate(interaction["response"])
+
+    def _record(self, params: Dict[str, Any], response: Any, latency: float):
+        key = request_key(params)
+        body = response.model_dump(mode="json") if hasattr(response, "model_dump") else response
+        with self._lock:
+            cassette = self._cassette(key) or {
+                "key": key,
+                "prompt_hash": prompt_hash(params.get("messages", [])),
+                "request": {k: v for k, v in params.items() if k != "messages"},
+                "interactions": [],
+            }
+            cassette["interactions"].append({"response": body, "latency": round(latency, 6), "recorded_at": time.time()})
+            self._loaded[key] = cassette
+            # Write-then-rename so a replay never reads a half-written cassette
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(cassette, f, indent=1)
+            os.replace(tmp_path, self._path(key))
+        metrics.inc("upstream_cassette_requests_total", result="recorded")
+
+
+# Global cassette for upstream calls (UPSTREAM_CASSETTE_MODE=off|record|replay)
+upstream_cassette = UpstreamCassette.from_env()
@@ -0,0 +1,119 @@
+import re
+from collections import deque
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+def interaction_order(medications: Sequence[str], pairs: Sequence[Sequence[str]]) -> List[int]:
+    """
+    Regimen indices reordered so each cluster of interacting drugs is
+    contiguous: largest cluster first, breadth-first within a cluster,
+    input order breaking ties.
+    """
+    index = {}
+    for i, name in enumerate(medications):
+        index.setdefault(name, i)
+    neighbours: Dict[int, List[int]] = {i: [] for i in range(len(medications))}
+    for a, b in pairs:
+        if a in index and b in index and index[a] != index[b]:
+            neighbours[index[a]].append(index[b])
+            neighbours[index[b]].append(index[a])
+
+    seen, clusters = set(), []
+    for start in range(len(medications)):
+        if start in seen:
+            continue
+        seen.add(start)
+        cluster, queue = [], deque([start])
+        while queue:
+            node = queue.popleft()
+            cluster.append(node)
+            for nxt in sorted(neighbours[node]):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(nxt)
+        clusters.append(cluster)
+    clusters.sort(key=lambda cluster: (-len(cluster), cluster[0]))
+    return [i for cluster in clusters for i in cluster]
+
+
+def plan_chunks(medications: Sequence[str], pairs: Sequence[Sequence[str]],
+                size: int = 4, overlap: int = 1) -> List[List[int]]:
+    """
+    Split a regimen into overlapping sub-regimens of at most `size` drugs.
+
+    Windows slide over the interaction-cluster order, sharing `overlap`
+    drugs with their neighbour; any known interacting pair that still ends
+    up in different windows gets an extra chunk of its own (packed up to
+    `size`), so every known interaction is analyzed together. Returns
+    lists of indices into `medications`, each in input order.
+    """
+    count = len(medications)
+    if count <= size:
+        return [list(range(count))]
+    overlap = min(max(overlap, 0), size - 1)
+    order = interaction_order(medications, pairs)
+    chunks = [sorted(order[start:start + size]) for start in range(0, count - overlap, size - overlap)]
+
+    index = {}
+    for i, name in enumerate(medications):
+        index.setdefault(name, i)
+    covered = [set(chunk) for chunk in chunks]
+    extra: List[int] = []
+    for a, b in pairs:
+        if a not in index or b not in index:
+            continue
+        pair = {index[a], index[b]}
+        if any(pair <= chunk for chunk in covered):
+            continue
+        if len(set(extra) | pair) > size:
+            chunks.append(sorted(extra))
+            covered.append(set(extra))
+            extra = []
+        extra = sorted(set(extra) | pair)
+    if extra:
+        chunks.append(extra)
+    return chunks
+
+
+def _item_key(item: str) -> str:
+    return re.sub(r"\s+", " ", item.casefold()).strip(" .")
+
+
+def merge_unique(lists: Sequence[Sequence[str]], limit: int) -> List[str]:
+    """Interleave lists (first items of each, then second items, ...), dropping near-duplicates, capped at `limit`"""
+    merged, seen = [], set()
+    for position in range(max((len(items) for items in lists), default=0)):
+        for items in lists:
+            if position < len(items) and len(merged) < limit:
+                key = _item_key(items[position])
+                if key and key not in seen:
+                    seen.add(key)
+                    merged.append(items[position])
+    return merged
+
+
+def merge_analyses(analyses: Sequence[Dict[str, Any]], labels: Sequence[str],
+                   risk_levels: Sequence[str], max_items: int = 8) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Deterministically merge per-chunk analyses into one: the highest risk
+    level, each chunk's analysis under its label, and de-duplicated,
+    interleaved and capped list fields. Also returns the labels of chunks
+    whose analysis failed (risk level "Unknown") while others succeeded.
+    """
+    def rank(level: str) -> int:
+        return risk_levels.index(level) if level in risk_levels else 0
+
+    risk_level = max((a.get("riskLevel") or risk_levels[0] for a in analyses), key=rank, default=risk_levels[0])
+    failed = [label for a, label in zip(analyses, labels) if rank(a.get("riskLevel")) == 0]
+    if len(failed) == len(analyses):
+        failed = []
+    merged = {
+        "analysis": "\n\n".join(f"{label}: {a.get('analysis', '')}" for a, label in zip(analyses, labels)),
+        "riskLevel": risk_level,
+    }
+    for field in ("recommendations", "alternatives", "warnings", "sources"):
+        merged[field] = merge_unique([a.get(field) or [] for a in analyses], max_items)
+    if failed:
+        merged["warnings"] = [f"Automated analysis unavailable for part of this regimen ({'; '.join(failed)})"] \
+            + merged["warnings"][:max_items - 1]
+    return merged, failed
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Compact, memory-mappable compiled form of the knowledge base.
+
+The JSON knowledge files are compiled into one binary file with interned
+strings, integer drug and class ids, a sorted adjacency table of interaction
+rules and sorted name-lookup tables. The service opens it with mmap, so every
+worker on a host shares one physical copy of the pages and startup does no
+JSON parsing at all.
+
+    python compiled_knowledge.py /tmp/pawrx-knowledge.kb
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections import abc
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dosage import DoseReferenceTable
+from drug_classes import DrugOntology, InteractionChecker, InteractionRule
+from knowledge import ToxinEntry, ToxinIndex, candidate_names, normalize_species, product_name
+from medication_index import MedicationEntry, MedicationIndex
+
+MAGIC = b"PAWRXKB\x00"
+FORMAT_VERSION = 3
+_HEADER = struct.Struct("<8sII16s")  # magic, format version, section count, knowledge version
+_SECTION = struct.Struct("<8sQQ")  # name, offset, length
+_ALIGN = 8
+_LIST_SEP = "\x1f"
+
+_RULE_FIELDS = ("left", "right", "level", "species", "severity", "risk_level", "mechanism",
+                "clinical_effects", "management")
+_TOXIN_FIELDS = ("name", "species", "toxicity_level", "symptoms", "description", "brand_names")
+_MEDICATION_FIELDS = ("name", "category", "brand_names", "species", "toxic_for")
+
+# Fixed-width tables; string columns are (offset, length) pairs into the string pool
+_NAME_DTYPE = np.dtype([("key_off", "<u4"), ("key_len", "<u4"), ("value", "<u4")])
+_DOSE_DTYPE = np.dtype([("low", "<f8"), ("high", "<f8"), ("name_off", "<u4"), ("name_len", "<u4")])
+
+
+class CompiledFormatError(ValueError):
+    """The file is not a compiled knowledge base this version can read"""
+
+
+class _StringPool:
+    """Interned UTF-8 strings; each distinct string is stored once"""
+
+    def __init__(self):
+        self._refs: Dict[bytes, Tuple[int, int]] = {}
+        self.data = bytearray()
+
+    def add(self, text: str) -> Tuple[int, int]:
+        encoded = text.encode("utf-8")
+        ref = self._refs.get(encoded)
+        if ref is None:
+            ref = self._refs[encoded] = (len(self.data), len(encoded))
+            self.data += encoded
+        return ref
+
+
+def _name_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def _name_table(pool: _StringPool, mapping: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Name -> integer table sorted by a 64-bit hash of the key, plus the sorted
+    hashes themselves, so a lookup is one binary search over plain integers
+    """
+    keys = sorted(((_name_hash(k.encode("utf-8")), k) for k in mapping))
+    table = np.zeros(len(keys), dtype=_NAME_DTYPE)
+    for i, (_, key) in enumerate(keys):
+        table[i] = (*pool.add(key), mapping[key])
+    return table, np.array([h for h, _ in keys], dtype=np.uint64)
+
+
+def _string_row(pool: _StringPool, values: Sequence[str]) -> Tuple[int, ...]:
+    return tuple(part for value in values for part in pool.add(value))
+
+
+def write_compiled(toxins: ToxinIndex, doses: DoseReferenceTable, ontology: DrugOntology,
+                   suggestions: MedicationIndex, path: str, version: str) -> str:
+    """
+    Serialize built indexes to `path`. The file is written next to the target
+    and renamed into place, so processes that already mapped the old file
+    keep a valid view of it.
+    """
+    pool = _StringPool()
+
+    # Toxins: one record per entry, looked up by "species\0alias" in the generic or brand table
+    toxin_rows: List[Tuple[int, ...]] = []
+    toxin_ids: Dict[int, int] = {}
+    toxin_names: Dict[str, int] = {}
+    toxin_brands: Dict[str, int] = {}
+    for by_species, table in ((toxins._by_species, toxin_names), (toxins._brands_by_species, toxin_brands)):
+        for species, names in by_species.items():
+            for alias, entry in names.items():
+                if id(entry) not in toxin_ids:
+                    toxin_ids[id(entry)] = len(toxin_rows)
+                    toxin_rows.append(_string_row(pool, (
+                        entry.name, entry.species, entry.toxicity_level, _LIST_SEP.join(entry.symptoms),
+                        entry.description, _LIST_SEP.join(entry.brand_names),
+                    )))
+                table[f"{species}\0{alias}"] = toxin_ids[id(entry)]
+
+    # Dose ranges, looked up by "species\0alias"
+    dose_rows: List[Tuple] = []
+    dose_names: Dict[str, int] = {}
+    dose_ids: Dict[Tuple[float, float, str], int] = {}
+    for species, names in doses._ranges.items():
+        for alias, (low, high, canonical) in names.items():
+            key = (low, high, canonical)
+            if key not in dose_ids:
+                dose_ids[key] = len(dose_rows)
+                dose_rows.append((low, high, *pool.add(canonical)))
+            dose_names[f"{species}\0{alias}"] = dose_ids[key]
+
+    # Interaction ontology: entity ids are the ontology's bit numbers
+    entities = np.array([pool.add(label) for label in ontology._bit_labels], dtype=np.uint32).reshape(-1, 2)
+    drug_rows, drug_bits, drug_ids = [], [], {}
+    for name, drug in ontology._drugs.items():
+        drug_ids[name] = len(drug_rows)
+        drug_rows.append((*pool.add(name), len(drug_bits), len(drug.bits)))
+        drug_bits.extend(drug.bits)
+    aliases = {alias: drug_ids[canonical] for alias, canonical in ontology._aliases.items()}
+
+    rule_rows: List[Tuple[int, ...]] = []
+    adjacency: List[List[Tuple[int, int]]] = [[] for _ in ontology._bit_labels]
+    for (a, b), rules in ontology._rules.items():
+        for rule in rules:
+            rule_id = len(rule_rows)
+            rule_rows.append(_string_row(pool, (
+                rule.left, rule.right, rule.level, ",".join(sorted(rule.species)), rule.severity,
+                rule.risk_level, rule.mechanism, _LIST_SEP.join(rule.clinical_effects), rule.management,
+            )))
+            adjacency[a].append((b, rule_id))
+            if a != b:
+                adjacency[b].append((a, rule_id))
+    adj_offsets = np.zeros(len(adjacency) + 1, dtype=np.uint32)
+    partners, partner_rules = [], []
+    for entity, edges in enumerate(adjacency):
+        edges.sort()
+        partners.extend(p for p, _ in edges)
+        partner_rules.extend(r for _, r in edges)
+        adj_offsets[entity + 1] = len(partners)
+
+    # Autocomplete: medication records plus the index's sorted (alias, medication, display name) rows
+    medication_rows = [_string_row(pool, (
+        entry.name, entry.category, _LIST_SEP.join(entry.brand_names), _LIST_SEP.join(entry.species),
+        _LIST_SEP.join(f"{species}={level}" for species, level in entry.toxic_for.items()),
+    )) for entry in suggestions.entries]
+    suggestion_rows = [(*pool.add(alias), target, *pool.add(name))
+                       for alias, (target, name) in zip(suggestions._keys, suggestions._targets)]
+
+    meta = {
+        "toxin_species": sorted(toxins._by_species),
+        "rule_count": len(rule_rows),
+        "dose_names": len(dose_names),
+    }
+    name_tables = {"toxnames": toxin_names, "brnames": toxin_brands, "dosnames": dose_names, "drugkeys": drug_ids, "aliases": aliases}
+    sections = []
+    for name, mapping in name_tables.items():
+        table, hashes = _name_table(pool, mapping)
+        sections += [(name, table), (name[:4] + "hash", hashes)]
+    sections += [
+        ("toxins", np.array(toxin_rows, dtype=np.uint32).reshape(-1, len(_TOXIN_FIELDS) * 2)),
+        ("doses", np.array(dose_rows, dtype=_DOSE_DTYPE)),
+        ("entities", entities),
+        ("drugs", np.array(drug_rows, dtype=np.uint32).reshape(-1, 4)),
+        ("drugbits", np.array(drug_bits, dtype=np.uint32)),
+        ("rules", np.array(rule_rows, dtype=np.uint32).reshape(-1, len(_RULE_FIELDS) * 2)),
+        ("adjoffs", adj_offsets),
+        ("adjpart", np.array(partners, dtype=np.uint32)),
+        ("adjrule", np.array(partner_rules, dtype=np.uint32)),
+        ("meds", np.array(medication_rows, dtype=np.uint32).reshape(-1, len(_MEDICATION_FIELDS) * 2)),
+        ("medpop", np.array([entry.popularity for entry in suggestions.entries], dtype=np.float64)),
+        ("medkeys", np.array(suggestion_rows, dtype=np.uint32).reshape(-1, 5)),
+        ("meta", json.dumps(meta).encode("utf-8")),
+        ("strings", bytes(pool.data)),
+    ]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".kb-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            offset = _HEADER.size + _SECTION.size * len(sections)
+            entries, blobs = [], []
+            for name, payload in sections:
+                blob = payload.tobytes() if isinstance(payload, np.ndarray) else payload
+                offset += -offset % _ALIGN
+                entries.append(_SECTION.pack(name.encode(), offset, len(blob)))
+                blobs.append((offset, blob))
+                offset += len(blob)
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), version.encode()[:16]))
+            f.write(b"".join(entries))
+            for start, blob in blobs:
+                f.write(b"\0" * (start - f.tell()))
+                f.write(blob)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+def compile_knowledge(data: Dict[str, Optional[Dict]], path: str, version: str) -> str:
+    """Build the indexes from parsed knowledge JSON and write them compiled"""
+    toxins = ToxinIndex.from_dict(data.get("toxic") or {})
+    doses = DoseReferenceTable.from_dict(data.get("common") or {})
+    ontology = DrugOntology.from_dicts(data.get("classes") or {}, data.get("interactions"),
+                                       data.get("toxic"), data.get("common"))
+    suggestions = MedicationIndex.from_dicts(data.get("common"), data.get("toxic"))
+    return write_compiled(toxins, doses, ontology, suggestions, path, version)
+
+
+def read_version(path: str) -> Optional[str]:
+    """Knowledge version a compiled file was built from, without mapping it"""
+    try:
+        with open(path, "rb") as f:
+            magic, format_version, _, version = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    return version.rstrip(b"\0").decode()
+
+
+class _NameTable:
+    """Hash-sorted name -> integer table read straight from the mapped file"""
+
+    def __init__(self, kb: "CompiledKnowledge", name: str):
+        self._strings = kb._strings
+        # (key offset, key length, value) triples as plain ints; cheaper to index than numpy scalars
+        self._words = kb._words(name)
+        self._hashes = kb._words(name[:4] + "hash", "Q")
+
+    def get(self, key: str) -> Optional[int]:
+        target = key.encode("utf-8")
+        digest = _name_hash(target)
+        i = bisect.bisect_left(self._hashes, digest)
+        while i < len(self._hashes) and self._hashes[i] == digest:
+            start = self._words[3 * i]
+            if self._strings[start:start + self._words[3 * i + 1]] == target:
+                return self._words[3 * i + 2]
+            i += 1
+        return None
+
+
+class CompiledKnowledge:
+    """
+    Read-only view over a compiled knowledge file. `toxins`, `doses`,
+    `interactions` and `suggestions` answer the same queries as ToxinIndex,
+    DoseReferenceTable, DrugOntology and MedicationIndex. The mapping is released when the last reference to
+    this object goes away, so a swapped-out generation stays valid for
+    requests still holding it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, format_version, count, version = _HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            raise CompiledFormatError(f"{path} is truncated")
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise CompiledFormatError(f"{path} is not a compiled knowledge base (format {FORMAT_VERSION})")
+        self.version = version.rstrip(b"\0").decode()
+
+        self._sections: Dict[str, Tuple[int, int]] = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(self._mmap, _HEADER.size + i * _SECTION.size)
+            if offset + length > len(self._mmap):
+                raise CompiledFormatError(f"{path} is truncated")
+            self._sections[name.rstrip(b"\0").decode()] = (offset, length)
+
+        offset, length = self._sections["strings"]
+        self._strings = memoryview(self._mmap)[offset:offset + length]
+        offset, length = self._sections["meta"]
+        self.meta: Dict[str, Any] = json.loads(self._mmap[offset:offset + length])
+
+        self.toxins = CompiledToxinIndex(self)
+        self.doses = CompiledDoseTable(self)
+        self.interactions = CompiledInteractions(self)
+        self.suggestions = CompiledMedicationIndex(self)
+
+    def _array(self, name: str, dtype) -> np.ndarray:
+        offset, length = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def _words(self, name: str, fmt: str = "I") -> memoryview:
+        """An integer section as a memoryview, for fast scalar access (little-endian hosts)"""
+        offset, length = self._sections[name]
+        return memoryview(self._mmap)[offset:offset + length].cast(fmt)
+
+    def _names(self, name: str) -> _NameTable:
+        return _NameTable(self, name)
+
+    def string(self, offset: int, length: int) -> str:
+        return self._strings[offset:offset + length].tobytes().decode("utf-8")
+
+    def strings(self, row: memoryview) -> List[str]:
+        """Decode a row of (offset, length) string references"""
+        values = row.tolist()
+        return [self.string(values[i], values[i + 1]) for i in range(0, len(values), 2)]
+
+
+class CompiledToxinIndex:
+
+    def __init__(self, kb: CompiledKnowledge):
+        self._kb = kb
+        self._names = kb._names("toxnames")
+        self._brands = kb._names("brnames")
+        self._rows = kb._words("toxins")
+        self._species = set(kb.meta["toxin_species"])
+
+    @property
+    def species(self) -> List[str]:
+        return sorted(self._species)
+
+    def lookup(self, species: str, medication: str) -> Optional[ToxinEntry]:
+        species = normalize_species(species)
+        if species not in self._species:
+            return None
+        for names, text in ((self._names, medication), (self._brands, product_name(medication))):
+            for candidate in candidate_names(text):
+                index = names.get(f"{species}\0{candidate}")
+                if index is not None:
+                    return self._entry(index)
+        return None
+
+    def _entry(self, index: int) -> ToxinEntry:
+        width = len(_TOXIN_FIELDS) * 2
+        row = self._rows[index * width:(index + 1) * width]
+        name, entry_species, level, symptoms, description, brands = self._kb.strings(row)
+        return ToxinEntry(
+            name=name,
+            species=entry_species,
+            toxicity_level=level,
+            symptoms=symptoms.split(_LIST_SEP) if symptoms else [],
+            description=description,
+            brand_names=brands.split(_LIST_SEP) if brands else [],
+        )
+
+
+class CompiledDoseTable:
+
+    def __init__(self, kb: CompiledKnowledge):
+        self._kb = kb
+        self._names = kb._names("dosnames")
+        self._rows = kb._array("doses", _DOSE_DTYPE)
+        self._lookup_cache: Dict[Tuple[str, str], Optional[Tuple[float, float, str]]] = {}
+
+    @property
+    def size(self) -> int:
+        return self._kb.meta["dose_names"]
+
+    def lookup(self, species: str, medication: str) -> Optional[Tuple[float, float, str]]:
+        key = (species, medication)
+        if key in self._lookup_cache:
+            return self._lookup_cache[key]
+        found = None
+        species_name = normalize_species(species)
+        for candidate in candidate_names(medication):
+            index = self._names.get(f"{species_name}\0{candidate}")
+            if index is not None:
+                row = self._rows[index]
+                found = (float(row["low"]), float(row["high"]),
+                         self._kb.string(int(row["name_off"]), int(row["name_len"])))
+                break
+        if len(self._lookup_cache) >= 4096:
+            self._lookup_cache.clear()
+        self._lookup_cache[key] = found
+        return found
+
+
+class CompiledInteractions(InteractionChecker):
+    """
+    Interaction checks over the mapped adjacency table. Each entity's
+    partners are stored sorted, so a regimen is checked by binary-searching
+    the entities seen so far in each new drug's partner lists; entities
+    without rules are skipped outright.
+    """
+
+    def __init__(self, kb: CompiledKnowledge):
+        super().__init__()
+        self._kb = kb
+        self._aliases = kb._names("aliases")
+        self._drug_keys = kb._names("drugkeys")
+        self._drugs = kb._words("drugs")
+        self._drug_bits = kb._words("drugbits")
+        self._entities = kb._words("entities")
+        self._rules = kb._words("rules")
+        self._adj_offsets = kb._words("adjoffs")
+        self._adj_partners = kb._words("adjpart")
+        self._adj_rules = kb._words("adjrule")
+        self._rule_cache: Dict[int, InteractionRule] = {}
+
+    @property
+    def rule_count(self) -> int:
+        return self._kb.meta["rule_count"]
+
+    def resolve(self, medication: str) -> Optional[str]:
+        for candidate in candidate_names(medication):
+            index = self._aliases.get(candidate)
+            if index is not None:
+                return self._kb.string(self._drugs[4 * index], self._drugs[4 * index + 1])
+        return None
+
+    def classes_of(self, medication: str) -> List[str]:
+        canonical = self.resolve(medication)
+        if not canonical:
+            return []
+        labels = [self._kb.string(self._entities[2 * bit], self._entities[2 * bit + 1])
+                  for bit in self._bits(canonical)]
+        return [label[len("class:"):] for label in labels if label.startswith("class:")]
+
+    def _bits(self, canonical: str) -> List[int]:
+        index = self._drug_keys.get(canonical)
+        start, count = self._drugs[4 * index + 2], self._drugs[4 * index + 3]
+        return self._drug_bits[start:start + count].tolist()
+
+    def _rule(self, rule_id: int) -> InteractionRule:
+        rule = self._rule_cache.get(rule_id)
+        if rule is None:
+            width = len(_RULE_FIELDS) * 2
+            left, right, level, species, severity, risk, mechanism, effects, management = \
+                self._kb.strings(self._rules[rule_id * width:(rule_id + 1) * width])
+            rule = self._rule_cache[rule_id] = InteractionRule(
+                left=left, right=right, level=level, species=frozenset(species.split(",")),
+                severity=severity, risk_level=risk, mechanism=mechanism,
+                clinical_effects=tuple(effects.split(_LIST_SEP)) if effects else (),
+                management=management,
+            )
+        return rule
+
+    def _match(self, species: str, drugs: Sequence[str]) -> List[Tuple[str, str, InteractionRule]]:
+        members: Dict[int, List[str]] = {}
+        best: Dict[Tuple[str, str], InteractionRule] = {}
+        for name in drugs:
+            bits = self._bits(name)
+            for own in bits:
+                start, end = self._adj_offsets[own], self._adj_offsets[own + 1]
+                if start == end:
+                    continue
+                # Binary-search each entity seen so far in this entity's sorted partner list
+                for hit, others in members.items():
+                    position = bisect.bisect_left(self._adj_partners, hit, start, end)
+                    while position < end and self._adj_partners[position] == hit:
+                        rule = self._rule(self._adj_rules[position])
+                        position += 1
+                        if species not in rule.species:
+                            continue
+                        for other in others:
+                            self._keep_best(best, (other, name), rule)
+            for bit in bits:
+                members.setdefault(bit, []).append(name)
+        return self._ranked(best)
+
+
+class _Column(abc.Sequence):
+    """Rows of a mapped section decoded on access, so bisect can search them in place"""
+
+    def __init__(self, size: int, decode):
+        self._size = size
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._decode(j) for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(i)
+        return self._decode(i)
+
+
+class CompiledMedicationIndex(MedicationIndex):
+    """MedicationIndex searching the mapped, already-sorted alias table"""
+
+    def __init__(self, kb: CompiledKnowledge):
+        self._kb = kb
+        self._rows = kb._words("medkeys")
+        self._meds = kb._words("meds")
+        self._popularity = kb._words("medpop", "d")
+        self._keys = _Column(len(self._rows) // 5, self._key)
+        self._targets = _Column(len(self._keys), self._target)
+        self.entries = _Column(len(self._popularity), self._entry)
+
+    def _key(self, i: int) -> str:
+        return self._kb.string(self._rows[5 * i], self._rows[5 * i + 1])
+
+    def _target(self, i: int) -> Tuple[int, str]:
+        return self._rows[5 * i + 2], self._kb.string(self._rows[5 * i + 3], self._rows[5 * i + 4])
+
+    def _entry(self, i: int) -> MedicationEntry:
+        width = len(_MEDICATION_FIELDS) * 2
+        name, category, brands, species, toxic_for = self._kb.strings(self._meds[i * width:(i + 1) * width])
+        return MedicationEntry(
+            name=name,
+            category=category,
+            brand_names=brands.split(_LIST_SEP) if brands else [],
+            species=species.split(_LIST_SEP) if species else [],
+            toxic_for=dict(item.split("=", 1) for item in toxic_for.split(_LIST_SEP)) if toxic_for else {},
+            popularity=self._popularity[i],
+        )
+
+
+def main():
+    from knowledge_store import KnowledgeStore
+
+    output = sys.argv[1] if len(sys.argv) > 1 else os.getenv("KNOWLEDGE_COMPILED_PATH", "knowledge.kb")
+    store = KnowledgeStore(poll_interval=0, compiled_path=output)
+    print(f"Compiled knowledge version {store.current.version} -> {output} "
+          f"({os.path.getsize(output) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_from(error: Exception) -> Optional[float]:
+    """Extract a Retry-After hint (seconds) from an upstream error response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return getattr(error, "retry_after", None)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit for the upstream LLM.
+
+    Starting in slow start (+1 per success, doubling every round trip), the
+    limit then grows additively (about +sqrt(limit) per round trip) while
+    latency stays near the observed baseline, shrinks
+    multiplicatively when latency climbs past `latency_tolerance` times the
+    baseline, and halves on rate-limit responses. Decreases happen at most
+    once per `decrease_cooldown` so a burst of 429s from one overload episode
+    only backs off once. A Retry-After hint blocks new upstream calls until
+    it expires.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.9,
+        rate_limit_backoff_ratio: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        baseline_drift: float = 0.05,
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.rate_limit_backoff_ratio = rate_limit_backoff_ratio
+        self.decrease_cooldown = decrease_cooldown
+        self.baseline_drift = baseline_drift
+
+        self.baseline_latency: Optional[float] = None
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.slow_start = True
+        self._publish()
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveConcurrencyLimiter":
+        return cls(
+            initial_limit=float(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", "8")),
+            min_limit=float(os.getenv("UPSTREAM_MIN_CONCURRENCY", "1")),
+            max_limit=float(os.getenv("UPSTREAM_MAX_CONCURRENCY", "64")),
+            latency_tolerance=float(os.getenv("UPSTREAM_LATENCY_TOLERANCE", "2.0")),
+            decrease_cooldown=float(os.getenv("UPSTREAM_DECREASE_COOLDOWN", "1.0")),
+        )
+
+    def allowed(self, now: Optional[float] = None) -> int:
+        """Number of calls that may currently be in flight"""
+        now = time.monotonic() if now is None else now
+        if now < self.blocked_until:
+            return 0
+        return max(1, int(math.floor(self.limit)))
+
+    def blocked_for(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.blocked_until - now)
+
+    def record(self, outcome: str, latency: float, in_flight: int = 0, retry_after: Optional[float] = None):
+        """
+        Feed one upstream call outcome ('ok', 'rate_limited' or 'error') into the limit
+        """
+        now = time.monotonic()
+        if outcome == "rate_limited":
+            self._decrease(self.rate_limit_backoff_ratio, now)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            metrics.inc("upstream_rate_limited_total")
+        elif outcome == "ok":
+            self._observe_latency(latency, in_flight, now)
+        self._publish()
+
+    def _observe_latency(self, latency: float, in_flight: int, now: float):
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            # Let the baseline drift up so a sustained upstream slowdown that we
+            # did not cause stops shrinking the limit after a few dozen calls
+            self.baseline_latency += self.baseline_drift * (latency - self.baseline_latency)
+
+        if latency > self.baseline_latency * self.latency_tolerance:
+            self._decrease(self.backoff_ratio, now)
+        elif in_flight + 1 >= self.limit * 0.5:
+            # Only grow while the current limit is actually being used
+            step = 1.0 if self.slow_start else math.sqrt(self.limit) / self.limit
+            self.limit = min(self.max_limit, self.limit + step)
+
+    def _decrease(self, ratio: float, now: float):
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self.limit = max(self.min_limit, self.limit * ratio)
+        self._last_decrease = now
+        self.slow_start = False
+
+    def _publish(self):
+        metrics.set_gauge("upstream_concurrency_limit", round(self.limit, 3))
+
+
+T = TypeVar("T")
+
+
+class RequestHedger:
+    """
+    Hedged upstream calls for tail latency.
+
+    When a call has not answered within the `percentile` of recent upstream
+    latencies, an identical second call is sent; whichever succeeds first
+    is used and the other is cancelled. Hedges are paid for from a token
+    bucket that earns `max_hedge_rate` tokens per call (capped at `burst`),
+    so at most that fraction of calls is duplicated over time. No hedging
+    happens until `min_samples` latencies have been seen.
+
+    Latencies are kept per call; a primary that lost to its hedge is
+    recorded with the time it had run when cancelled, so slow calls keep
+    counting towards the percentile. The percentile is recomputed every
+    `refresh_every` samples.
+
+    The second call comes from `hedge_call` when given; it returns None when the
+    hedge cannot start right now (e.g. no upstream slot is free), in which
+    case no hedge is sent and its token is kept.
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 0.95, max_hedge_rate: float = 0.05,
+                 min_samples: int = 20, window: int = 500, min_delay: float = 0.05, burst: float = 5.0,
+                 refresh_every: int = 20):
+        self.enabled = enabled
+        self.percentile = min(max(percentile, 0.0), 1.0)
+        self.max_hedge_rate = max(0.0, max_hedge_rate)
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self.burst = max(1.0, burst)
+        self.refresh_every = max(1, refresh_every)
+        self.tokens = 0.0
+        self._latencies = deque(maxlen=max(window, self.min_samples))
+        self._delay: Optional[float] = None
+        self._new_samples = 0
+
+    @classmethod
+    def from_env(cls) -> "RequestHedger":
+        return cls(
+            enabled=os.getenv("UPSTREAM_HEDGING_ENABLED", "false").lower() == "true",
+            percentile=float(os.getenv("UPSTREAM_HEDGE_PERCENTILE", "0.95")),
+            max_hedge_rate=float(os.getenv("UPSTREAM_HEDGE_MAX_RATE", "0.05")),
+            min_samples=int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "20")),
+            window=int(os.getenv("UPSTREAM_HEDGE_WINDOW", "500")),
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        stale = self._delay is None or self._new_samples >= self.refresh_every
+        if stale and len(self._latencies) >= self.min_samples:
+            self._new_samples = 0
+            ordered = sorted(self._latencies)
+            self._delay = max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))])
+            metrics.set_gauge("upstream_hedge_delay_seconds", round(self._delay, 4))
+        return self._delay
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+        self._new_samples += 1
+
+    async def run(self, call: Callable[[], Awaitable[T]],
+                  hedge_call: Optional[Callable[[], Optional[Awaitable[T]]]] = None) -> T:
+        """Await `call()`, hedging it with `hedge_call()` (default `call()`) if it runs past the hedge delay"""
+        if not self.enabled:
+            return await call()
+        self.tokens = min(self.burst, self.tokens + self.max_hedge_rate)
+        delay = self.hedge_delay()
+        started = time.monotonic()
+        if delay is None:
+            result = await call()
+            self.record(time.monotonic() - started)
+            return result
+        primary = asyncio.ensure_future(call())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                result = primary.result()
+                self.record(time.monotonic() - started)
+                return result
+            second = None
+            if self.tokens < 1.0:
+                metrics.inc("upstream_hedges_skipped_total", reason="budget")
+            else:
+                second = (hedge_call or call)()
+                if second is None:
+                    metrics.inc("upstream_hedges_skipped_total", reason="saturated")
+            if second is None:
+                result = await primary
+                self.record(time.monotonic() - started)
+                return result
+        except BaseException:
+            primary.cancel()
+            raise
+
+        self.tokens -= 1.0
+        metrics.inc("upstream_hedges_fired_total")
+        hedge_started = time.monotonic()
+        hedge = asyncio.ensure_future(second)
+        pending = {primary, hedge}
+        try:
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        # Keep waiting on the other attempt; surface the first error if both fail
+                        error = error or attempt.exception()
+                        continue
+                    if attempt is hedge:
+                        metrics.inc("upstream_hedges_won_total")
+                        self.record(time.monotonic() - hedge_started)
+                    self.record(time.monotonic() - started)
+                    return attempt.result()
+            raise error
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+
+
+# Global upstream concurrency limiter instance
+upstream_limiter = AdaptiveConcurrencyLimiter.from_env()
+
+# Global upstream request hedger; off unless UPSTREAM_HEDGING_ENABLED is set
+upstream_hedger = RequestHedger.from_env()
@@ -0,0 +1,277 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from knowledge import COMMON_MEDICATIONS_PATH, brand_aliases, candidate_names, name_aliases, normalize_species
+
+logger = logging.getLogger(__name__)
+
+MASS_UNITS_MG = {
+    "mcg": 0.001, "ug": 0.001, "µg": 0.001, "microgram": 0.001, "micrograms": 0.001,
+    "mg": 1.0, "milligram": 1.0, "milligrams": 1.0,
+    "g": 1000.0, "gram": 1000.0, "grams": 1000.0,
+}
+WEIGHT_UNITS_KG = {
+    "kg": 1.0, "kgs": 1.0, "kilogram": 1.0, "kilograms": 1.0,
+    "lb": 0.45359237, "lbs": 0.45359237, "pound": 0.45359237, "pounds": 0.45359237,
+    "g": 0.001, "grams": 0.001,
+}
+FREQUENCY_WORDS = {
+    "once": 1, "twice": 2, "three times": 3, "thrice": 3, "four times": 4,
+    "sid": 1, "bid": 2, "tid": 3, "qid": 4,
+}
+
+# Findings are only reported when the dose is clearly outside the reference range
+OVERDOSE_MARGIN = 1.2
+UNDERDOSE_MARGIN = 0.5
+
+# Supplements data/common-medications.json; daily mg/kg ranges
+BUILTIN_DAILY_RANGES = {
+    "dog": {
+        "amoxicillin": (20.0, 40.0),
+        "meloxicam": (0.05, 0.1),
+        "prednisone": (0.5, 2.0),
+    },
+    "cat": {
+        "amoxicillin": (20.0, 40.0),
+    },
+}
+
+_AMOUNT_RE = re.compile(
+    r"(?P<amount>\d+(?:\.\d+)?(?:\s*/\s*\d+)?)\s*(?P<unit>[a-zµ]+)?(?P<per_kg>\s*/\s*kg)?",
+    re.IGNORECASE,
+)
+_INTERVAL_RE = re.compile(r"(?:every|q)\s*(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*(?:h|hr|hrs|hours?)\b")
+_EVERY_RE = re.compile(r"\bevery\s+(\d+(?:\.\d+)?|other)\s*(day|week|month)s?\b")
+_COUNT_RE = re.compile(r"(\d+)\s*(?:x|times)(?![a-z])")
+_PERIOD_RE = re.compile(r"(?:\b(?:a|per|each|every)\s+|/\s*)(day|week|month)\b|\b(daily|weekly|monthly)\b")
+PERIOD_DAYS = {"day": 1, "daily": 1, "week": 7, "weekly": 7, "month": 30, "monthly": 30}
+_REFERENCE_RE = re.compile(r"(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*mg\s*/\s*kg\s*(.*)", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class ParsedDose:
+    amount: float
+    unit: str
+    per_kg: bool = False
+
+    @property
+    def amount_mg(self) -> Optional[float]:
+        scale = MASS_UNITS_MG.get(self.unit)
+        return self.amount * scale if scale is not None else None
+
+
+@lru_cache(maxsize=4096)
+def parse_dosage(text: str) -> Optional[ParsedDose]:
+    """
+    Parse '75mg', '0.5 mg/kg', '1/2 tablet', '100 mcg' into an amount and unit
+    """
+    match = _AMOUNT_RE.search((text or "").lower())
+    if not match:
+        return None
+    raw_amount = match.group("amount").replace(" ", "")
+    if "/" in raw_amount:
+        numerator, denominator = raw_amount.split("/")
+        if float(denominator) == 0:
+            return None
+        amount = float(numerator) / float(denominator)
+    else:
+        amount = float(raw_amount)
+    unit = (match.group("unit") or "").rstrip(".")
+    if unit.endswith("s") and unit not in MASS_UNITS_MG:
+        unit = unit[:-1]
+    return ParsedDose(amount=amount, unit=unit, per_kg=bool(match.group("per_kg")))
+
+
+@lru_cache(maxsize=1024)
+def parse_frequency(text: str) -> Optional[float]:
+    """
+    Doses per day for 'twice daily', 'BID', 'every 8 hours', 'q12h',
+    'twice a week', 'every 2 weeks', 'once monthly'... (a month is 30 days).
+    Interval ranges use the shorter interval, the conservative choice for overdose checks.
+    """
+    text = (text or "").lower()
+    if not text or re.search(r"\b(as needed|prn)\b", text):
+        return None
+    interval = _INTERVAL_RE.search(text)
+    if interval:
+        hours = float(interval.group(1))
+        return 24.0 / hours if hours > 0 else None
+    every = _EVERY_RE.search(text)
+    if every:
+        days = (2.0 if every.group(1) == "other" else float(every.group(1))) * PERIOD_DAYS[every.group(2)]
+        return 1.0 / days if days > 0 else None
+
+    # Doses per period: a count ('3x', 'twice', 'BID') and a period ('a week', 'monthly'), each defaulting to 1 and a day
+    count = None
+    times = _COUNT_RE.search(text)
+    if times:
+        count = float(times.group(1))
+    else:
+        for word, per_period in FREQUENCY_WORDS.items():
+            if re.search(rf"\b{word}\b", text):
+                count = float(per_period)
+                break
+    period = _PERIOD_RE.search(text)
+    if count is None and period is None:
+        return None
+    days = PERIOD_DAYS[period.group(1) or period.group(2)] if period else 1
+    return (count or 1.0) / days
+
+
+def weight_in_kg(weight: float, unit: Optional[str]) -> Optional[float]:
+    scale = WEIGHT_UNITS_KG.get((unit or "kg").strip().lower())
+    if scale is None or weight is None or weight <= 0:
+        return None
+    return float(weight) * scale
+
+
+def parse_reference_dosage(text: str) -> Optional[Tuple[float, float]]:
+    """'2-4 mg/kg twice daily' -> (4.0, 8.0) daily mg/kg"""
+    match = _REFERENCE_RE.search(text or "")
+    if not match:
+        return None
+    low = float(match.group(1))
+    high = float(match.group(2) or match.group(1))
+    per_day = parse_frequency(match.group(3)) or 1.0
+    return low * per_day, high * per_day
+
+
+class DoseReferenceTable:
+    """
+    Daily mg/kg reference ranges per species, keyed on every known name alias
+    """
+
+    def __init__(self, ranges: Dict[str, Dict[str, Tuple[float, float, str]]]):
+        # species -> alias -> (min, max, canonical name)
+        self._ranges = ranges
+        self._lookup_cache: Dict[Tuple[str, str], Optional[Tuple[float, float, str]]] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DoseReferenceTable":
+        ranges: Dict[str, Dict[str, Tuple[float, float, str]]] = {}
+        for species, drugs in BUILTIN_DAILY_RANGES.items():
+            for name, (low, high) in drugs.items():
+                ranges.setdefault(species, {})[name] = (low, high, name)
+        for species, items in data.get("common_medications", {}).items():
+            species = normalize_species(species)
+            for item in items:
+                daily = parse_reference_dosage(item.get("typical_dosage", ""))
+                if not daily:
+                    continue
+                canonical = name_aliases(item["name"])[0]
+                for alias in name_aliases(item["name"]) + brand_aliases(item.get("brand_names", [])):
+                    ranges.setdefault(species, {})[alias] = (daily[0], daily[1], canonical)
+        return cls(ranges)
+
+    @classmethod
+    def load(cls, path: str = COMMON_MEDICATIONS_PATH) -> "DoseReferenceTable":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Dose reference data unavailable ({e}); using built-in ranges only")
+            return cls.from_dict({})
+
+    @property
+    def size(self) -> int:
+        return sum(len(names) for names in self._ranges.values())
+
+    def lookup(self, species: str, medication: str) -> Optional[Tuple[float, float, str]]:
+        key = (species, medication)
+        if key in self._lookup_cache:
+            return self._lookup_cache[key]
+        found = None
+        names = self._ranges.get(normalize_species(species))
+        if names:
+            for candidate in candidate_names(medication):
+                found = names.get(candidate)
+                if found:
+                    break
+        if len(self._lookup_cache) >= 4096:
+            self._lookup_cache.clear()
+        self._lookup_cache[key] = found
+        return found
+
+
+def check_regimen(
+    species: str,
+    weight: float,
+    weight_unit: str,
+    medications: Sequence[Dict[str, Any]],
+    table: DoseReferenceTable,
+) -> List[Dict[str, Any]]:
+    """
+    Weight-normalized dose check for a whole regimen.
+
+    Each distinct (name, dosage, frequency) entry is parsed once; the
+    mg/kg/day arithmetic and range comparison then run as one vectorized
+    step over the whole regimen. Returns only clear over- or under-dose
+    findings.
+    """
+    weight_kg = weight_in_kg(weight, weight_unit)
+    if not weight_kg or not medications:
+        return []
+
+    keys: Dict[Tuple[str, str, str], int] = {}
+    row_index = np.fromiter(
+        (keys.setdefault((m.get("name", ""), m.get("dosage", ""), m.get("frequency", "")), len(keys))
+         for m in medications),
+        dtype=np.intp, count=len(medications),
+    )
+    rows = [_dose_row(table, species, *key) for key in keys]
+    table_columns = np.array([row[:5] for row in rows], dtype=float).reshape(len(rows), 5)
+    amount, per_kg, per_day, ref_min, ref_max = table_columns[row_index].T
+
+    daily = np.where(per_kg > 0, amount, amount / weight_kg) * per_day
+    with np.errstate(invalid="ignore"):
+        over = daily > ref_max * OVERDOSE_MARGIN
+        under = daily < ref_min * UNDERDOSE_MARGIN
+
+    flagged = np.flatnonzero(over | under)
+    species_name = normalize_species(species)
+    findings = []
+    for i, row, daily_dose in zip(flagged.tolist(), row_index[flagged].tolist(), daily[flagged].tolist()):
+        low, high, reference_name = rows[row][3:]
+        findings.append(build_finding(medications[i].get("name", ""), reference_name, daily_dose, low, high, species_name))
+    return findings
+
+
+def build_finding(name: str, reference_name: str, daily_dose: float, low: float, high: float,
+                  species: str) -> Dict[str, Any]:
+    is_over = daily_dose > high
+    dose_ratio = daily_dose / high if is_over else daily_dose / low
+    return {
+        "medication": name,
+        "referenceName": reference_name,
+        "finding": "overdose" if is_over else "underdose",
+        "severity": "high" if is_over and dose_ratio >= 2 else "moderate",
+        "dailyDoseMgPerKg": round(daily_dose, 3),
+        "referenceRangeMgPerKgPerDay": [round(low, 3), round(high, 3)],
+        "ratio": round(dose_ratio, 2),
+        "message": (
+            f"{name}: {daily_dose:.2f} mg/kg/day is {'above' if is_over else 'below'} "
+            f"the reference range of {low:g}-{high:g} mg/kg/day for a {species}"
+        ),
+    }
+
+
+_NO_DOSE = (np.nan, 0.0, np.nan, np.nan, np.nan, None)
+
+
+def _dose_row(table: DoseReferenceTable, species: str, name: str, dosage: str, frequency: str) -> Tuple:
+    """(amount_mg, per_kg, doses_per_day, ref_min, ref_max, reference_name) for one medication"""
+    reference = table.lookup(species, name)
+    if not reference:
+        return _NO_DOSE
+    dose = parse_dosage(dosage)
+    if not dose or dose.amount_mg is None:
+        return _NO_DOSE
+    per_day = parse_frequency(frequency) or np.nan
+    return (dose.amount_mg, float(dose.per_kg), per_day, reference[0], reference[1], reference[2])
+
@@ -0,0 +1,330 @@
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple
+
+from knowledge import (
+    COMMON_MEDICATIONS_PATH,
+    DRUG_CLASSES_PATH,
+    INTERACTIONS_PATH,
+    TOXIC_MEDICATIONS_PATH,
+    brand_aliases,
+    candidate_names,
+    name_aliases,
+    normalize_name,
+    normalize_species,
+)
+
+logger = logging.getLogger(__name__)
+
+RISK_RANK = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+SEVERITY_FOR_RISK = {"low": "minor", "medium": "moderate", "high": "major", "critical": "major"}
+DEFAULT_SPECIES = ("dog", "cat")
+
+
+@dataclass(frozen=True)
+class InteractionRule:
+    """A curated interaction between two drugs or two drug classes"""
+    left: str
+    right: str
+    level: str  # "drug" or "class"
+    species: FrozenSet[str]
+    severity: str
+    risk_level: str
+    mechanism: str
+    clinical_effects: Tuple[str, ...] = ()
+    management: str = ""
+
+    @property
+    def label(self) -> str:
+        return f"{self.left} + {self.right}"
+
+    def outranks(self, other: "InteractionRule") -> bool:
+        """Drug-specific rules beat class rules; then the more severe rule wins"""
+        return (self.level == "drug", RISK_RANK.get(self.risk_level, 0)) > \
+            (other.level == "drug", RISK_RANK.get(other.risk_level, 0))
+
+
+class InteractionChecker:
+    """
+    Regimen-level interaction lookup shared by the in-memory ontology and the
+    compiled knowledge base: name resolution, pair ordering, memoization and
+    the finding format. Subclasses provide `resolve` and `_match`.
+    """
+
+    def __init__(self, cache_size: int = 2048):
+        self._cache: "OrderedDict[Tuple[str, Tuple[str, ...]], List[Tuple[str, str, InteractionRule]]]" = OrderedDict()
+        self.cache_size = cache_size
+
+    def resolve(self, medication: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _match(self, species: str, drugs: Sequence[str]) -> List[Tuple[str, str, InteractionRule]]:
+        raise NotImplementedError
+
+    def find_interactions(self, species: str, medications: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Known interactions within a regimen, one finding per medication pair
+        """
+        names: Dict[str, str] = {}
+        for medication in medications:
+            canonical = self.resolve(medication)
+            if canonical:
+                names.setdefault(canonical, medication)
+        if len(names) < 2:
+            return []
+
+        species = normalize_species(species)
+        key = (species, tuple(sorted(names)))
+        pairs = self._cache.get(key)
+        if pairs is None:
+            pairs = self._match(species, key[1])
+            self._cache[key] = pairs
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        order = {canonical: i for i, canonical in enumerate(names)}
+        findings = []
+        for a, b, rule in pairs:
+            a, b = sorted((a, b), key=order.__getitem__)
+            findings.append(self._finding(names[a], names[b], a, b, rule))
+        return findings
+
+    @staticmethod
+    def _keep_best(best: Dict[Tuple[str, str], InteractionRule], pair: Tuple[str, str], rule: InteractionRule):
+        current = best.get(pair)
+        if current is None or rule.outranks(current):
+            best[pair] = rule
+
+    @staticmethod
+    def _ranked(best: Dict[Tuple[str, str], InteractionRule]) -> List[Tuple[str, str, InteractionRule]]:
+        return sorted(
+            ((a, b, rule) for (a, b), rule in best.items()),
+            key=lambda item: (-RISK_RANK.get(item[2].risk_level, 0), item[0], item[1]),
+        )
+
+    @staticmethod
+    def _finding(med_a: str, med_b: str, drug_a: str, drug_b: str, rule: InteractionRule) -> Dict[str, Any]:
+        return {
+            "medications": [med_a, med_b],
+            "drugs": [drug_a, drug_b],
+            "rule": rule.label,
+            "ruleLevel": rule.level,
+            "severity": rule.severity,
+            "riskLevel": rule.risk_level,
+            "mechanism": rule.mechanism,
+            "clinicalEffects": list(rule.clinical_effects),
+            "management": rule.management,
+            "message": f"{med_a} + {med_b}: {rule.mechanism} ({rule.severity} interaction)",
+        }
+
+
+@dataclass
+class _Drug:
+    name: str
+    class_mask: int = 0
+    partner_mask: int = 0
+    bits: List[int] = field(default_factory=list)
+
+
+class DrugOntology(InteractionChecker):
+    """
+    Canonical drugs, their classes and class- or drug-level interaction rules.
+
+    Every class, and every drug named in a drug-level rule, owns one bit. A
+    drug's class mask is its own bit (if any) plus its class bits; its
+    partner mask is every bit it has a rule with. A regimen is then checked in one pass: each drug ANDs its
+    partner mask against the classes seen so far, and only non-zero hits are
+    decoded into findings. Pairs without a rule are never looked at.
+    """
+
+    def __init__(self, cache_size: int = 2048):
+        super().__init__(cache_size)
+        self._bits: Dict[str, int] = {}
+        self._bit_labels: List[str] = []
+        self._class_aliases: Dict[str, str] = {}
+        self._class_names: Dict[str, str] = {}
+        self._drugs: Dict[str, _Drug] = {}
+        self._aliases: Dict[str, str] = {}
+        self._rules: Dict[Tuple[int, int], List[InteractionRule]] = {}
+        self._partners: Dict[int, int] = {}
+
+    # Building
+
+    def _bit(self, key: str) -> int:
+        bit = self._bits.get(key)
+        if bit is None:
+            bit = self._bits[key] = len(self._bit_labels)
+            self._bit_labels.append(key)
+        return bit
+
+    def add_class(self, class_id: str, name: str, aliases: Sequence[str] = ()):
+        self._bit(f"class:{class_id}")
+        self._class_names[class_id] = name
+        for alias in [class_id, name, *aliases]:
+            self._class_aliases[normalize_name(alias)] = class_id
+
+    def add_drug(self, name: str, classes: Sequence[str] = (), aliases: Sequence[str] = ()) -> _Drug:
+        canonical = name_aliases(name)[0]
+        drug = self._drugs.get(canonical)
+        if drug is None:
+            drug = self._drugs[canonical] = _Drug(canonical)
+        for class_id in classes:
+            self._add_bit(drug, self._bit(f"class:{class_id}"))
+        for variant in name_aliases(name) + brand_aliases(list(aliases)):
+            self._aliases.setdefault(variant, canonical)
+        return drug
+
+    @staticmethod
+    def _add_bit(drug: _Drug, bit: int):
+        if not drug.class_mask >> bit & 1:
+            drug.class_mask |= 1 << bit
+            drug.bits.append(bit)
+
+    def _endpoint(self, name: str) -> Tuple[str, str]:
+        """Resolve a rule endpoint to ('class', id) or ('drug', canonical name)"""
+        class_id = self._class_aliases.get(normalize_name(name))
+        if class_id:
+            return "class", class_id
+        # Drugs only need a bit of their own once a drug-level rule names them
+        drug = self.add_drug(name)
+        self._add_bit(drug, self._bit(f"drug:{drug.name}"))
+        return "drug", drug.name
+
+    def add_rule(self, left: str, right: str, severity: str, risk_level: str, mechanism: str,
+                 species: Sequence[str] = DEFAULT_SPECIES, clinical_effects: Sequence[str] = (),
+                 management: str = ""):
+        (left_kind, left_key), (right_kind, right_key) = self._endpoint(left), self._endpoint(right)
+        left_label = self._class_names.get(left_key, left_key) if left_kind == "class" else left_key
+        right_label = self._class_names.get(right_key, right_key) if right_kind == "class" else right_key
+        rule = InteractionRule(
+            left=left_label,
+            right=right_label,
+            level="class" if "class" in (left_kind, right_kind) else "drug",
+            species=frozenset(normalize_species(s) for s in species),
+            severity=severity,
+            risk_level=risk_level.lower(),
+            mechanism=mechanism,
+            clinical_effects=tuple(clinical_effects),
+            management=management,
+        )
+        a = self._bit(f"{left_kind}:{left_key}")
+        b = self._bit(f"{right_kind}:{right_key}")
+        self._rules.setdefault((min(a, b), max(a, b)), []).append(rule)
+        self._partners[a] = self._partners.get(a, 0) | 1 << b
+        self._partners[b] = self._partners.get(b, 0) | 1 << a
+
+    def finalize(self) -> "DrugOntology":
+        """Precompute per-drug partner masks once all rules are in"""
+        for drug in self._drugs.values():
+            drug.partner_mask = 0
+            for bit in drug.bits:
+                drug.partner_mask |= self._partners.get(bit, 0)
+        self._cache.clear()
+        return self
+
+    @classmethod
+    def from_dicts(cls, classes: Dict, interactions: Optional[Dict] = None,
+                   toxic: Optional[Dict] = None, common: Optional[Dict] = None) -> "DrugOntology":
+        ontology = cls()
+        for class_id, spec in classes.get("drug_classes", {}).items():
+            ontology.add_class(class_id, spec.get("name", class_id), spec.get("aliases", []))
+        for class_id, spec in classes.get("drug_classes", {}).items():
+            for member in spec.get("members", []):
+                ontology.add_drug(member, [class_id])
+        for species_items in (common or {}).get("common_medications", {}).values():
+            for item in species_items:
+                ontology.add_drug(item["name"], aliases=item.get("brand_names", []))
+
+        for rule in classes.get("class_interactions", []):
+            ontology.add_rule(
+                rule["class1"], rule["class2"], rule["severity"], rule["riskLevel"], rule["mechanism"],
+                rule.get("species", DEFAULT_SPECIES), rule.get("clinicalEffects", []), rule.get("management", ""),
+            )
+        for rule in (interactions or {}).get("drug_interactions", []):
+            ontology.add_rule(
+                rule["drug1"], rule["drug2"], rule["severity"], rule["riskLevel"], rule["mechanism"],
+                rule.get("species", DEFAULT_SPECIES), rule.get("clinicalEffects", []), rule.get("management", ""),
+            )
+        for rule in (toxic or {}).get("drug_interactions", []):
+            risk_level = rule.get("risk_level", "medium").lower()
+            ontology.add_rule(
+                rule["drug1"], rule["drug2"], SEVERITY_FOR_RISK.get(risk_level, "moderate"), risk_level,
+                rule.get("description", ""),
+            )
+        return ontology.finalize()
+
+    @classmethod
+    def load(
+        cls,
+        classes_path: str = DRUG_CLASSES_PATH,
+        interactions_path: str = INTERACTIONS_PATH,
+        toxic_path: str = TOXIC_MEDICATIONS_PATH,
+        common_path: str = COMMON_MEDICATIONS_PATH,
+    ) -> "DrugOntology":
+        sources = {}
+        for key, path in (("classes", classes_path), ("interactions", interactions_path),
+                          ("toxic", toxic_path), ("common", common_path)):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    sources[key] = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Interaction knowledge file {path} unavailable ({e})")
+        try:
+            ontology = cls.from_dicts(sources.get("classes", {}), sources.get("interactions"),
+                                      sources.get("toxic"), sources.get("common"))
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Drug ontology invalid ({e}); interaction checks will use the model only")
+            return cls().finalize()
+        logger.info(f"Loaded drug ontology: {len(ontology._drugs)} drugs, {ontology.rule_count} interaction rules")
+        return ontology
+
+    # Queries
+
+    @property
+    def rule_count(self) -> int:
+        return sum(len(rules) for rules in self._rules.values())
+
+    def resolve(self, medication: str) -> Optional[str]:
+        """Canonical drug name for a free-text medication entry"""
+        for candidate in candidate_names(medication):
+            canonical = self._aliases.get(candidate)
+            if canonical:
+                return canonical
+        return None
+
+    def classes_of(self, medication: str) -> List[str]:
+        canonical = self.resolve(medication)
+        if not canonical:
+            return []
+        return [self._bit_labels[bit][len("class:"):] for bit in self._drugs[canonical].bits
+                if self._bit_labels[bit].startswith("class:")]
+
+    def _match(self, species: str, drugs: Sequence[str]) -> List[Tuple[str, str, InteractionRule]]:
+        seen = 0
+        members: Dict[int, List[str]] = {}
+        best: Dict[Tuple[str, str], InteractionRule] = {}
+        for name in drugs:
+            drug = self._drugs[name]
+            hits = drug.partner_mask & seen
+            for hit in _iter_bits(hits):
+                for own in drug.bits:
+                    for rule in self._rules.get((min(own, hit), max(own, hit)), ()):
+                        if species not in rule.species:
+                            continue
+                        for other in members[hit]:
+                            self._keep_best(best, (other, name), rule)
+            seen |= drug.class_mask
+            for bit in drug.bits:
+                members.setdefault(bit, []).append(name)
+        return self._ranked(best)
+
+
+def _iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
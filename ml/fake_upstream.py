@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions upstream.
+
+Used by the benchmarks in-process, or served over HTTP so the real service
+can be pointed at it:
+
+    uvicorn fake_upstream:app --port 9000
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DEFAULT_CONTENT = json.dumps({
+    "analysis": "No significant interactions were identified for this regimen. Continue routine monitoring.",
+    "riskLevel": "Low",
+    "recommendations": ["Monitor appetite and energy levels", "Keep a medication log"],
+    "alternatives": [],
+    "warnings": [],
+    "sources": ["Plumb's Veterinary Drug Handbook"]
+})
+
+
+class FakeRateLimitError(Exception):
+    """Raised by the in-process fake when it answers 429"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Phase:
+    """A period of upstream behaviour, e.g. a latency spike or a 429 storm"""
+    duration: float
+    latency_multiplier: float = 1.0
+    rate_limit_threshold: Optional[int] = None
+
+
+@dataclass
+class FakeCompletion:
+    content: str
+    latency: float
+    usage: Dict[str, Any] = field(default_factory=dict)
+    finish_reason: str = "stop"
+
+
+class FakeUpstream:
+    """
+    Simulated LLM upstream with a concurrency knee, scripted latency spikes
+    and 429 storms.
+
+    Up to `capacity` concurrent calls are served at the base latency; beyond
+    that latency grows with the overload, and beyond `rate_limit_threshold`
+    calls are rejected with a Retry-After hint. Like real providers, calls
+    arriving before that hint expires are rejected and extend the penalty.
+
+    With `prefix_cache` on, it also mimics provider prompt caching: once a
+    prompt passes `prefix_cache_min_tokens`, its prefix is remembered in
+    `prefix_cache_block`-token increments, later prompts sharing a remembered
+    prefix report those tokens as `cached_tokens`, and only uncached tokens
+    pay the `prefill_latency` per-token cost.
+
+    With `latency_tail_shape` set, each call's latency is also multiplied by
+    a Pareto(shape) sample (at least 1), giving the heavy tail of real
+    completions where a few calls take many times the median.
+
+    A `responder` can build the answer from the messages instead of the fixed
+    `content`; answers then cost `decode_latency` per generated token and are
+    cut off at the request's `max_tokens` with finish_reason "length".
+    """
+
+    def __init__(
+        self,
+        base_latency: float = 0.05,
+        capacity: int = 16,
+        rate_limit_threshold: int = 32,
+        retry_after: float = 0.25,
+        phases: Optional[List[Phase]] = None,
+        content: str = DEFAULT_CONTENT,
+        seed: int = 7,
+        prefix_cache: bool = False,
+        prefix_cache_min_tokens: int = 1024,
+        prefix_cache_block: int = 128,
+        prefix_cache_entries: int = 512,
+        prefill_latency: float = 0.0,
+        responder: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        decode_latency: float = 0.0,
+        latency_tail_shape: Optional[float] = None,
+    ):
+        self.base_latency = base_latency
+        self.capacity = capacity
+        self.rate_limit_threshold = rate_limit_threshold
+        self.retry_after = retry_after
+        self.phases = phases or []
+        self.content = content
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.penalty_until = 0.0
+        self.started = time.monotonic()
+        self.prefix_cache = prefix_cache
+        self.prefix_cache_min_tokens = prefix_cache_min_tokens
+        self.prefix_cache_block = prefix_cache_block
+        self.prefix_cache_entries = prefix_cache_entries
+        self.prefill_latency = prefill_latency
+        self.responder = responder
+        self.decode_latency = decode_latency
+        self.latency_tail_shape = latency_tail_shape
+        self._prefixes: "OrderedDict[bytes, None]" = OrderedDict()
+
+    def current_phase(self) -> Phase:
+        elapsed = time.monotonic() - self.started
+        for phase in self.phases:
+            if elapsed < phase.duration:
+                return phase
+            elapsed -= phase.duration
+        return Phase(duration=0)
+
+    def sample_latency(self, phase: Phase) -> float:
+        overload = max(0, self.in_flight - self.capacity) / self.capacity
+        jitter = self.random.uniform(0.9, 1.1)
+        if self.latency_tail_shape:
+            jitter *= self.random.paretovariate(self.latency_tail_shape)
+        return self.base_latency * phase.latency_multiplier * (1 + 2 * overload) * jitter
+
+    def cached_prefix_tokens(self, prompt: str) -> int:
+        """Tokens of `prompt` served from the prefix cache; remembers its prefixes for later calls"""
+        if not self.prefix_cache:
+            return 0
+        # Roughly four characters per token, like the usage counts below
+        tokens = len(prompt) // 4
+        cached = 0
+        digest = hashlib.sha256()
+        position = 0
+        for boundary in range(self.prefix_cache_min_tokens, tokens + 1, self.prefix_cache_block):
+            digest.update(prompt[position:boundary * 4].encode())
+            position = boundary * 4
+            key = digest.copy().digest()
+            if key in self._prefixes:
+                self._prefixes.move_to_end(key)
+                cached = boundary
+            else:
+                self._prefixes[key] = None
+                if len(self._prefixes) > self.prefix_cache_entries:
+                    self._prefixes.popitem(last=False)
+        return cached
+
+    async def complete(self, messages: List[Dict[str, str]], **params) -> FakeCompletion:
+        phase = self.current_phase()
+        threshold = phase.rate_limit_threshold or self.rate_limit_threshold
+        self.calls += 1
+        now = time.monotonic()
+        if now < self.penalty_until or self.in_flight >= threshold:
+            # Calls that ignore an active Retry-After extend the penalty window
+            self.rate_limited += 1
+            self.penalty_until = now + self.retry_after
+            await asyncio.sleep(0.001)
+            raise FakeRateLimitError(self.retry_after)
+
+        prompt = "".join(f"{m.get('role', '')}\n{m.get('content', '')}\n" for m in messages)
+        prompt_tokens = len(prompt) // 4
+        cached_tokens = self.cached_prefix_tokens(prompt)
+        content = self.responder(messages) if self.responder else self.content
+        finish_reason = "stop"
+        max_tokens = params.get("max_tokens")
+        if max_tokens and len(content) // 4 > max_tokens:
+            content, finish_reason = content[:max_tokens * 4], "length"
+        completion_tokens = len(content) // 4
+
+        self.in_flight += 1
+        try:
+            latency = (self.sample_latency(phase) + self.prefill_latency * (prompt_tokens - cached_tokens)
+                       + self.decode_latency * completion_tokens)
+            await asyncio.sleep(latency)
+        finally:
+            self.in_flight -= 1
+
+        return FakeCompletion(
+            content=content,
+            latency=latency,
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+            finish_reason=finish_reason,
+        )
+
+
+def create_app(upstream: Optional[FakeUpstream] = None) -> FastAPI:
+    """OpenAI-compatible /v1/chat/completions endpoint backed by a FakeUpstream"""
+    upstream = upstream or FakeUpstream(
+        base_latency=float(os.getenv("FAKE_UPSTREAM_LATENCY", "0.5")),
+        capacity=int(os.getenv("FAKE_UPSTREAM_CAPACITY", "16")),
+        rate_limit_threshold=int(os.getenv("FAKE_UPSTREAM_RATE_LIMIT", "32")),
+        prefix_cache=os.getenv("FAKE_UPSTREAM_PREFIX_CACHE", "true").lower() == "true",
+        prefill_latency=float(os.getenv("FAKE_UPSTREAM_PREFILL_LATENCY", "0.0002")),
+    )
+    fake_app = FastAPI(title="Fake LLM upstream")
+    fake_app.state.upstream = upstream
+
+    @fake_app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        try:
+            completion = await upstream.complete(body.pop("messages", []), **body)
+        except FakeRateLimitError as e:
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": str(e), "type": "rate_limit_error"}},
+                headers={"Retry-After": f"{e.retry_after:.3f}"},
+            )
+        return {
+            "id": f"chatcmpl-fake-{upstream.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion.content},
+                "finish_reason": completion.finish_reason,
+            }],
+            "usage": {
+                **completion.usage,
+                "total_tokens": completion.usage["prompt_tokens"] + completion.usage["completion_tokens"],
+            },
+        }
+
+    return fake_app
+
+
+app = create_app()
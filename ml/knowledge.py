@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+KNOWLEDGE_DATA_DIR = os.getenv("KNOWLEDGE_DATA_DIR", os.path.join(_REPO_ROOT, "data"))
+TOXIC_MEDICATIONS_PATH = os.path.join(KNOWLEDGE_DATA_DIR, "toxic-medications.json")
+COMMON_MEDICATIONS_PATH = os.path.join(KNOWLEDGE_DATA_DIR, "common-medications.json")
+DRUG_CLASSES_PATH = os.path.join(KNOWLEDGE_DATA_DIR, "drug-classes.json")
+INTERACTIONS_PATH = os.getenv(
+    "KNOWLEDGE_INTERACTIONS_PATH",
+    os.path.join(_REPO_ROOT, "server", "data", "comprehensive-interactions.json"),
+)
+
+SPECIES_ALIASES = {
+    "cat": "cat", "cats": "cat", "feline": "cat", "kitten": "cat",
+    "dog": "dog", "dogs": "dog", "canine": "dog", "puppy": "dog",
+}
+
+# Longest alias we try to match inside a free-text medication string
+_MAX_ALIAS_WORDS = 4
+
+# Manufacturers sometimes listed among brand names; "Bayer" makes far more than aspirin
+MANUFACTURERS = {
+    "bayer", "boehringer ingelheim", "ceva", "dechra", "elanco", "merck", "merial", "novartis", "pfizer",
+    "virbac", "zoetis",
+}
+
+# "aspirin-free", "Tylenol free", "non-aspirin": the named drug is what the product leaves out
+_NEGATED = re.compile(r"\bnon[-\s]+[a-z0-9]+|[a-z0-9]+[-\s]+free\b", re.IGNORECASE)
+# Maker attributions around a product name: "Advantage II by Bayer", "Seresto (Bayer)"
+_ATTRIBUTION = re.compile(r"\([^)]*\)|\b(?:by|from)\b.*$", re.IGNORECASE)
+
+
+def normalize_species(species: str) -> str:
+    key = (species or "").strip().lower()
+    return SPECIES_ALIASES.get(key, key)
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).split())
+
+
+def name_aliases(name: str) -> List[str]:
+    """
+    Lookup aliases for a curated name, e.g. 'Chocolate (Theobromine)' ->
+    chocolate theobromine, chocolate, theobromine; 'Grapes/Raisins' -> grapes, raisins
+    """
+    aliases = [normalize_name(name)]
+    for part in re.split(r"[/()]", name):
+        alias = normalize_name(part)
+        if alias:
+            aliases.append(alias)
+    return [a for i, a in enumerate(aliases) if a and a not in aliases[:i]]
+
+
+def candidate_names(text: str) -> List[str]:
+    """
+    Word n-grams of a free-text medication entry, longest first, so
+    'Tylenol Extra Strength 500mg' can match 'tylenol'. Negated names
+    ('aspirin-free') are left out.
+    """
+    words = normalize_name(_NEGATED.sub(" ", text or "")).split()
+    candidates = []
+    for size in range(min(len(words), _MAX_ALIAS_WORDS), 0, -1):
+        for start in range(len(words) - size + 1):
+            candidates.append(" ".join(words[start:start + size]))
+    return candidates
+
+
+def product_name(text: str) -> str:
+    """The product itself, without maker attributions: 'Seresto (Bayer)' -> 'Seresto'"""
+    return _ATTRIBUTION.sub(" ", text or "")
+
+
+def brand_aliases(brands: List[str]) -> List[str]:
+    """Lookup aliases for curated brand names, skipping descriptions and manufacturers"""
+    aliases = []
+    for brand in brands:
+        # Descriptions such as "Various chocolate products" are not brand names
+        if brand.lower().startswith("various"):
+            continue
+        aliases += [a for a in name_aliases(brand) if a not in MANUFACTURERS and a not in aliases]
+    return aliases
+
+
+@dataclass
+class ToxinEntry:
+    name: str
+    species: str
+    toxicity_level: str
+    symptoms: List[str] = field(default_factory=list)
+    description: str = ""
+    brand_names: List[str] = field(default_factory=list)
+
+
+class ToxinIndex:
+    """
+    Species-keyed index of curated toxins. Generic names match anywhere in
+    the medication text; brand names only in the product name itself, so a
+    maker or ingredient mentioned alongside does not count.
+    """
+
+    def __init__(self, entries: List[ToxinEntry]):
+        self._by_species: Dict[str, Dict[str, ToxinEntry]] = {}
+        self._brands_by_species: Dict[str, Dict[str, ToxinEntry]] = {}
+        for entry in entries:
+            names = self._by_species.setdefault(entry.species, {})
+            for alias in name_aliases(entry.name):
+                names.setdefault(alias, entry)
+            brands = self._brands_by_species.setdefault(entry.species, {})
+            for alias in brand_aliases(entry.brand_names):
+                brands.setdefault(alias, entry)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ToxinIndex":
+        entries = []
+        for species, items in data.get("toxic_medications", {}).items():
+            for item in items:
+                entries.append(ToxinEntry(
+                    name=item["name"],
+                    species=normalize_species(species),
+                    toxicity_level=item.get("toxicity_level", "high"),
+                    symptoms=list(item.get("symptoms", [])),
+                    description=item.get("description", ""),
+                    brand_names=list(item.get("brand_names", [])),
+                ))
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path: str = TOXIC_MEDICATIONS_PATH) -> "ToxinIndex":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = cls.from_dict(json.load(f))
+            logger.info(f"Loaded toxin index for {len(index.species)} species from {path}")
+            return index
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Toxin index unavailable ({e}); all safety checks will use the model")
+            return cls([])
+
+    @property
+    def species(self) -> List[str]:
+        return sorted(self._by_species)
+
+    def lookup(self, species: str, medication: str) -> Optional[ToxinEntry]:
+        species = normalize_species(species)
+        names = self._by_species.get(species)
+        if not names:
+            return None
+        for candidate in candidate_names(medication):
+            entry = names.get(candidate)
+            if entry is not None:
+                return entry
+        brands = self._brands_by_species.get(species, {})
+        for candidate in candidate_names(product_name(medication)):
+            entry = brands.get(candidate)
+            if entry is not None:
+                return entry
+        return None
+
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from compiled_knowledge import CompiledKnowledge, compile_knowledge, read_version
+from dosage import DoseReferenceTable
+from drug_classes import DrugOntology
+from knowledge import (
+    COMMON_MEDICATIONS_PATH,
+    DRUG_CLASSES_PATH,
+    INTERACTIONS_PATH,
+    TOXIC_MEDICATIONS_PATH,
+    ToxinIndex,
+)
+from medication_index import MedicationIndex
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_SOURCES = {
+    "toxic": TOXIC_MEDICATIONS_PATH,
+    "common": COMMON_MEDICATIONS_PATH,
+    "classes": DRUG_CLASSES_PATH,
+    "interactions": INTERACTIONS_PATH,
+}
+
+# Which source files each in-memory index is built from
+COMPONENT_SOURCES = {
+    "toxins": ("toxic",),
+    "doses": ("common",),
+    "interactions": ("classes", "interactions", "toxic", "common"),
+    "suggestions": ("common", "toxic"),
+}
+
+MISSING = "missing"
+
+
+class KnowledgeValidationError(ValueError):
+    """A rebuilt knowledge index failed validation and was not swapped in"""
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """
+    One consistent generation of the knowledge indexes. Handlers read
+    `knowledge_store.current` once and use that snapshot for the whole request.
+    """
+    version: str
+    source_hashes: Dict[str, str]
+    toxins: ToxinIndex
+    doses: DoseReferenceTable
+    interactions: DrugOntology
+    suggestions: MedicationIndex
+    loaded_at: float = field(default_factory=time.time)
+
+
+Listener = Callable[[Set[str], KnowledgeSnapshot], None]
+
+
+class KnowledgeStore:
+    """
+    Holds the active knowledge snapshot and rebuilds it when source files change.
+
+    Rebuilds run on the caller's thread (the file watcher or an admin call),
+    never on the request path. Only indexes whose source files changed are
+    rebuilt; the new snapshot is validated and published with a single
+    reference assignment, so readers never see a half-built generation.
+    Listeners are told which components changed so dependent caches can
+    drop stale entries.
+
+    With `compiled_path` set, the indexes are served from a memory-mapped
+    compiled file instead of Python objects; it is recompiled whenever the
+    JSON sources no longer match the version it was built from.
+    """
+
+    def __init__(self, sources: Optional[Dict[str, str]] = None, poll_interval: float = 5.0,
+                 compiled_path: Optional[str] = None):
+        self.sources = dict(sources or KNOWLEDGE_SOURCES)
+        self.poll_interval = poll_interval
+        self.compiled_path = compiled_path
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Listener] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._stamps = self._file_stamps()
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+        started = time.perf_counter()
+        try:
+            self._snapshot = self._build(self._read_sources(), previous=None)
+        except (KnowledgeValidationError, OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Knowledge base invalid at startup ({e}); using whatever loads")
+            self.last_error = str(e)
+            self._snapshot = KnowledgeSnapshot(
+                version=MISSING,
+                source_hashes={name: MISSING for name in self.sources},
+                toxins=ToxinIndex.load(self.sources["toxic"]),
+                doses=DoseReferenceTable.load(self.sources["common"]),
+                interactions=DrugOntology.load(self.sources["classes"], self.sources["interactions"],
+                                               self.sources["toxic"], self.sources["common"]),
+                suggestions=MedicationIndex.load(self.sources["common"], self.sources["toxic"]),
+            )
+        self.last_reload_seconds = time.perf_counter() - started
+        self._publish_metrics()
+
+    @classmethod
+    def from_env(cls) -> "KnowledgeStore":
+        return cls(
+            poll_interval=float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "5")),
+            compiled_path=os.getenv("KNOWLEDGE_COMPILED_PATH") or None,
+        )
+
+    @property
+    def current(self) -> KnowledgeSnapshot:
+        return self._snapshot
+
+    def subscribe(self, listener: Listener):
+        """Call `listener(changed_components, snapshot)` after every swap"""
+        self._listeners.append(listener)
+
+    # Reloading
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Rebuild changed indexes and swap them in. Returns the reload outcome;
+        a failed reload keeps serving the previous snapshot.
+        """
+        with self._reload_lock:
+            self._stamps = self._file_stamps()
+            started = time.perf_counter()
+            previous = self._snapshot
+            try:
+                raw = self._read_sources()
+                hashes = {name: digest for name, (digest, _) in raw.items()}
+                if not force and hashes == previous.source_hashes:
+                    return {"reloaded": False, "version": previous.version, "changed": []}
+                snapshot = self._build(raw, previous=None if force else previous)
+            except (KnowledgeValidationError, OSError, ValueError, KeyError, TypeError) as e:
+                self.last_error = str(e)
+                metrics.inc("knowledge_reloads_total", result="rejected")
+                logger.error(f"Knowledge reload rejected, keeping version {previous.version}: {e}")
+                return {"reloaded": False, "version": previous.version, "error": str(e)}
+
+            changed = self._changed_components(previous, snapshot, force)
+            self._snapshot = snapshot
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_seconds = time.perf_counter() - started
+            metrics.inc("knowledge_reloads_total", result="swapped")
+            self._publish_metrics()
+            logger.info(
+                f"Knowledge base {previous.version} -> {snapshot.version} "
+                f"in {self.last_reload_seconds * 1000:.1f} ms (changed: {', '.join(sorted(changed))})"
+            )
+
+        for listener in list(self._listeners):
+            try:
+                listener(changed, snapshot)
+            except Exception as e:
+                logger.error(f"Knowledge reload listener failed: {e}")
+        return {"reloaded": True, "version": snapshot.version, "changed": sorted(changed)}
+
+    def check_for_changes(self) -> bool:
+        """Cheap stat-based check; reloads only when a source file was touched"""
+        if self._file_stamps() == self._stamps:
+            return False
+        return self.reload().get("reloaded", False)
+
+    def start_watching(self):
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="knowledge-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                logger.error(f"Knowledge watcher error: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "reload_duration_ms": round(self.last_reload_seconds * 1000, 2),
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "format": "compiled" if self.compiled_path else "json",
+        }
+
+    # Building
+
+    def _file_stamps(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        stamps = {}
+        for name, path in self.sources.items():
+            try:
+                stat = os.stat(path)
+                stamps[name] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamps[name] = None
+        return stamps
+
+    def _read_sources(self) -> Dict[str, Tuple[str, Optional[bytes]]]:
+        """name -> (content hash, raw bytes); a missing file is allowed"""
+        raw = {}
+        for name, path in self.sources.items():
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                raw[name] = (MISSING, None)
+                continue
+            raw[name] = (hashlib.sha256(content).hexdigest()[:12], content)
+        return raw
+
+    def _parse(self, raw: Dict[str, Tuple[str, Optional[bytes]]]) -> Dict[str, Optional[Dict]]:
+        data = {}
+        for name, (_, content) in raw.items():
+            try:
+                data[name] = json.loads(content) if content is not None else None
+            except ValueError as e:
+                raise KnowledgeValidationError(f"{os.path.basename(self.sources[name])} is not valid JSON: {e}")
+        return data
+
+    def _build(self, raw: Dict[str, Tuple[str, Optional[bytes]]],
+               previous: Optional[KnowledgeSnapshot]) -> KnowledgeSnapshot:
+        hashes = {name: digest for name, (digest, _) in raw.items()}
+        version = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:12]
+
+        def unchanged(component: str) -> bool:
+            return previous is not None and all(
+                previous.source_hashes.get(source) == hashes.get(source)
+                for source in COMPONENT_SOURCES[component]
+            )
+
+        if self.compiled_path:
+            if read_version(self.compiled_path) != version:
+                data = self._parse(raw)
+                compile_knowledge(data, self.compiled_path, version)
+            compiled = CompiledKnowledge(self.compiled_path)
+            toxins, doses, interactions = compiled.toxins, compiled.doses, compiled.interactions
+            suggestions = compiled.suggestions
+        else:
+            data = self._parse(raw)
+            toxins = previous.toxins if unchanged("toxins") else ToxinIndex.from_dict(data["toxic"] or {})
+            doses = previous.doses if unchanged("doses") else DoseReferenceTable.from_dict(data["common"] or {})
+            interactions = previous.interactions if unchanged("interactions") else DrugOntology.from_dicts(
+                data["classes"] or {}, data["interactions"], data["toxic"], data["common"],
+            )
+            suggestions = previous.suggestions if unchanged("suggestions") else MedicationIndex.from_dicts(
+                data["common"], data["toxic"],
+            )
+
+        if raw["toxic"][1] is not None and not toxins.species:
+            raise KnowledgeValidationError("toxic medications file produced an empty toxin index")
+        if (raw["classes"][1] is not None or raw["interactions"][1] is not None) and not interactions.rule_count:
+            raise KnowledgeValidationError("interaction files produced no interaction rules")
+
+        return KnowledgeSnapshot(
+            version=version, source_hashes=hashes, toxins=toxins, doses=doses, interactions=interactions,
+            suggestions=suggestions,
+        )
+
+    @staticmethod
+    def _changed_components(previous: KnowledgeSnapshot, snapshot: KnowledgeSnapshot, force: bool) -> Set[str]:
+        if force:
+            return set(COMPONENT_SOURCES)
+        return {
+            component for component, sources in COMPONENT_SOURCES.items()
+            if any(previous.source_hashes.get(s) != snapshot.source_hashes.get(s) for s in sources)
+        }
+
+    def _publish_metrics(self):
+        metrics.set_gauge("knowledge_reload_seconds", self.last_reload_seconds)
+        metrics.set_gauge("knowledge_reloads", self.reloads)
+
+
+# Global knowledge store; the file watcher is started with the app
+knowledge_store = KnowledgeStore.from_env()
@@ -0,0 +1,179 @@
+import heapq
+import json
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from knowledge import (
+    COMMON_MEDICATIONS_PATH,
+    TOXIC_MEDICATIONS_PATH,
+    name_aliases,
+    normalize_name,
+    normalize_species,
+)
+
+logger = logging.getLogger(__name__)
+
+# Prior popularity weights; observed usage is added on top
+_COMMON_WEIGHT = 10.0
+_TOXIC_WEIGHT = 1.0
+
+
+@dataclass
+class MedicationEntry:
+    name: str
+    category: str = ""
+    brand_names: List[str] = field(default_factory=list)
+    species: List[str] = field(default_factory=list)
+    # species -> toxicity level
+    toxic_for: Dict[str, str] = field(default_factory=dict)
+    popularity: float = 0.0
+
+
+class MedicationIndex:
+    """
+    Prefix index over generic and brand names for autocomplete: a sorted
+    array of normalized aliases searched with binary search, each alias
+    pointing at its medication.
+    """
+
+    def __init__(self, entries: List[MedicationEntry]):
+        self.entries = entries
+        pairs = set()
+        for i, entry in enumerate(entries):
+            for name in [entry.name, *entry.brand_names]:
+                for alias in name_aliases(name):
+                    pairs.add((alias, i, name))
+        ordered = sorted(pairs)
+        self._keys = [alias for alias, _, _ in ordered]
+        self._targets = [(i, name) for _, i, name in ordered]
+
+    @classmethod
+    def from_dicts(cls, common: Optional[Dict], toxic: Optional[Dict]) -> "MedicationIndex":
+        entries: Dict[str, MedicationEntry] = {}
+
+        def entry_for(item: Dict) -> MedicationEntry:
+            key = normalize_name(item["name"])
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = MedicationEntry(name=item["name"])
+            for brand in item.get("brand_names", []):
+                # Descriptions such as "Various chocolate products" are not brand names
+                if brand.lower().startswith("various"):
+                    continue
+                if brand not in entry.brand_names and normalize_name(brand) != key:
+                    entry.brand_names.append(brand)
+            return entry
+
+        # Listed order is the curated popularity order within a species
+        for species, items in ((common or {}).get("common_medications") or {}).items():
+            species = normalize_species(species)
+            for position, item in enumerate(items):
+                entry = entry_for(item)
+                entry.category = entry.category or item.get("category", "")
+                if species not in entry.species:
+                    entry.species.append(species)
+                entry.popularity += _COMMON_WEIGHT * (1 - position / (len(items) + 1))
+        for species, items in ((toxic or {}).get("toxic_medications") or {}).items():
+            species = normalize_species(species)
+            for item in items:
+                entry = entry_for(item)
+                entry.toxic_for.setdefault(species, item.get("toxicity_level", "high"))
+                entry.popularity += _TOXIC_WEIGHT
+        return cls(list(entries.values()))
+
+    @classmethod
+    def load(cls, common_path: str = COMMON_MEDICATIONS_PATH,
+             toxic_path: str = TOXIC_MEDICATIONS_PATH) -> "MedicationIndex":
+        data = []
+        for path in (common_path, toxic_path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Medication suggestions missing {path} ({e})")
+                data.append(None)
+        return cls.from_dicts(*data)
+
+    @property
+    def size(self) -> int:
+        return len(self._keys)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Generic name for an exact generic or brand name, or None"""
+        key = normalize_name(name)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self.entries[self._targets[i][0]].name
+        return None
+
+    def mentions(self, text: str, max_words: int = 3) -> List[str]:
+        """
+        Generic names of the medications named anywhere in free text, matching
+        runs of up to `max_words` words. A run is only extended while some
+        indexed name still starts with it, so most words cost one bisect.
+        """
+        words = normalize_name(text).split()
+        keys, found = self._keys, []
+        for start in range(len(words)):
+            phrase = ""
+            for word in words[start:start + max_words]:
+                phrase = f"{phrase} {word}" if phrase else word
+                i = bisect_left(keys, phrase)
+                if i < len(keys) and keys[i] == phrase:
+                    name = self.entries[self._targets[i][0]].name
+                    if name not in found:
+                        found.append(name)
+                    i += 1
+                if i >= len(keys) or not keys[i].startswith(phrase + " "):
+                    break
+        return found
+
+    def search(self, query: str, species: str = "", limit: int = 8,
+               usage: Optional[Mapping[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Medications with a name starting with `query`, one suggestion per
+        medication, most popular first. Popularity is the curated prior
+        plus `usage` (generic name -> times seen in requests). With a
+        species, medications toxic to it are flagged inline.
+        """
+        prefix = normalize_name(query)
+        if not prefix or limit <= 0:
+            return []
+        species = normalize_species(species)
+
+        # medication -> (alias, display name) of its first matching alias
+        matches: Dict[int, Tuple[str, str]] = {}
+        keys = self._keys
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            target, name = self._targets[i]
+            matches.setdefault(target, (keys[i], name))
+            i += 1
+
+        def rank(item: Tuple[int, Tuple[str, str]]) -> Tuple[float, int, int]:
+            target, (alias, _) = item
+            entry = self.entries[target]
+            score = entry.popularity + (usage.get(entry.name, 0) if usage else 0)
+            if species and species in entry.species:
+                score += _COMMON_WEIGHT
+            return score, alias == prefix, -len(alias)
+
+        return [self._suggestion(self.entries[target], name, species)
+                for target, (_, name) in heapq.nlargest(limit, matches.items(), key=rank)]
+
+    @staticmethod
+    def _suggestion(entry: MedicationEntry, matched: str, species: str) -> Dict[str, Any]:
+        suggestion = {
+            "name": entry.name,
+            "matched": matched,
+            "category": entry.category,
+            "brand_names": entry.brand_names,
+            "species": entry.species,
+            "toxic": bool(entry.toxic_for.get(species)) if species else bool(entry.toxic_for),
+            "toxic_for": sorted(entry.toxic_for),
+        }
+        if species and species in entry.toxic_for:
+            suggestion["toxicity_level"] = entry.toxic_for[species]
+        return suggestion
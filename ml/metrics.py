@@ -0,0 +1,115 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class _Summary:
+    """Running count/sum/max plus a bounded window for percentiles"""
+
+    __slots__ = ("count", "total", "maximum", "window")
+
+    def __init__(self, window_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.window: Deque[float] = deque(maxlen=window_size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+        self.window.append(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters, gauges and summaries exposed via /metrics
+    """
+
+    def __init__(self, window_size: int = 1024):
+        self.window_size = window_size
+        self._lock = threading.Lock()
+        self._counters: Dict[LabelKey, float] = defaultdict(float)
+        self._gauges: Dict[LabelKey, float] = {}
+        self._summaries: Dict[LabelKey, _Summary] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary(self.window_size)
+            summary.observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0.0)
+
+    def gauge(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(_key(name, labels))
+
+    def percentile(self, name: str, q: float, **labels) -> float:
+        with self._lock:
+            summary = self._summaries.get(_key(name, labels))
+            values = list(summary.window) if summary else []
+        return _percentile(values, q)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics grouped by kind and name"""
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            summaries = [
+                (key, s.count, s.total, s.maximum, list(s.window))
+                for key, s in self._summaries.items()
+            ]
+
+        result: Dict[str, Any] = {"counters": {}, "gauges": {}, "summaries": {}}
+        for (name, labels), value in counters:
+            result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), value in gauges:
+            result["gauges"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), count, total, maximum, window in summaries:
+            result["summaries"].setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": count,
+                "sum": round(total, 6),
+                "max": round(maximum, 6),
+                "p50": round(_percentile(window, 0.50), 6),
+                "p90": round(_percentile(window, 0.90), 6),
+                "p99": round(_percentile(window, 0.99), 6),
+            })
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
@@ -0,0 +1,231 @@
+import contextvars
+import inspect
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Union
+
+from fastapi import HTTPException
+
+from metrics import metrics
+from prompt_security import scan_pool, security_filter
+from topicality import topicality_gate
+from tracing import STAGE_INJECTION_SCAN, STAGE_SANITIZE, STAGES, tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PipelineContext:
+    """
+    State of one request as it moves through a pipeline. `inputs` holds
+    the raw request values, `sanitized` the cleaned ones and `state`
+    anything stages hand to later stages. A stage that can answer the
+    request by itself calls `finish(result)`.
+    """
+    endpoint: str
+    request: Any
+    inputs: Dict[str, Any]
+    sanitized: Dict[str, Any] = field(default_factory=dict)
+    state: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    done: bool = False
+    finished_at: Optional[str] = None
+    # Stage name -> seconds spent in it
+    timings: Dict[str, float] = field(default_factory=dict)
+    span: Any = None
+    # Upstream cost of the request, added to by call_openai_api_secure
+    upstream_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def finish(self, result: Any):
+        """Answer the request now; only stages marked `always` still run"""
+        self.result = result
+        self.done = True
+
+
+Hook = Callable[[PipelineContext], Union[None, Awaitable[None]]]
+
+# Context of the pipeline run handling the current request, if any
+current_context: contextvars.ContextVar[Optional[PipelineContext]] = contextvars.ContextVar(
+    "pipeline_context", default=None)
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Hook
+    # Also runs after an earlier stage finished the request (e.g. attaching local findings to a cached answer)
+    always: bool = False
+
+
+class PipelineHooks:
+    """
+    Hooks that run before or after a named stage of every pipeline built
+    with them, so a cross-cutting feature is registered once for all
+    endpoints. A before-hook may finish the request; after-hooks only run
+    when the stage itself ran. Complete-hooks see every answered request
+    once all stages are done; their errors are logged, never returned.
+    """
+
+    def __init__(self):
+        self._before: Dict[str, List[Hook]] = defaultdict(list)
+        self._after: Dict[str, List[Hook]] = defaultdict(list)
+        self._complete: List[Hook] = []
+
+    def before(self, stage: str, hook: Hook):
+        self._before[stage].append(hook)
+
+    def after(self, stage: str, hook: Hook):
+        self._after[stage].append(hook)
+
+    def complete(self, hook: Hook):
+        self._complete.append(hook)
+
+    def remove(self, hook: Hook):
+        for hooks in (*self._before.values(), *self._after.values(), self._complete):
+            while hook in hooks:
+                hooks.remove(hook)
+
+
+async def _call(hook: Hook, ctx: PipelineContext):
+    outcome = hook(ctx)
+    if inspect.isawaitable(outcome):
+        await outcome
+
+
+class Pipeline:
+    """
+    Ordered stages for one endpoint (rate limit, injection scan, sanitize,
+    knowledge, cache, upstream, parse, post-filter; see tracing.STAGES).
+
+    Each stage runs in a span of its name, which feeds `stage_seconds`;
+    the pipeline also records `pipeline_stage_seconds` per endpoint and
+    counts which stage short-circuited a request. Unexpected errors become
+    a 500 with `failure` in the detail, as the handlers always did.
+    """
+
+    def __init__(self, endpoint: str, stages: Sequence[Stage], hooks: Optional[PipelineHooks] = None,
+                 failure: str = "Request"):
+        unknown = [stage.name for stage in stages if stage.name not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown pipeline stages: {', '.join(unknown)}")
+        self.endpoint = endpoint
+        self.stages = list(stages)
+        self.hooks = hooks or PipelineHooks()
+        self.failure = failure
+
+    async def run(self, request: Any, **inputs) -> Any:
+        ctx = PipelineContext(endpoint=self.endpoint, request=request, inputs=inputs)
+        token = current_context.set(ctx)
+        try:
+            for stage in self.stages:
+                if ctx.done and not stage.always:
+                    continue
+                await self._run_stage(stage, ctx)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"{self.failure} failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"{self.failure} failed: {str(e)}")
+        finally:
+            current_context.reset(token)
+        for hook in self.hooks._complete:
+            try:
+                await _call(hook, ctx)
+            except Exception as e:
+                logger.error(f"Pipeline completion hook failed for {self.endpoint}: {str(e)}")
+        return ctx.result
+
+    async def _run_stage(self, stage: Stage, ctx: PipelineContext):
+        started = time.perf_counter()
+        was_done = ctx.done
+        with tracer.span(stage.name) as span:
+            ctx.span = span
+            try:
+                for hook in self.hooks._before[stage.name]:
+                    await _call(hook, ctx)
+                    if ctx.done and not was_done and not stage.always:
+                        break
+                else:
+                    await _call(stage.run, ctx)
+                    for hook in self.hooks._after[stage.name]:
+                        await _call(hook, ctx)
+            finally:
+                ctx.span = None
+        elapsed = time.perf_counter() - started
+        ctx.timings[stage.name] = ctx.timings.get(stage.name, 0.0) + elapsed
+        metrics.observe("pipeline_stage_seconds", elapsed, endpoint=self.endpoint, stage=stage.name)
+        if ctx.done and not was_done:
+            ctx.finished_at = stage.name
+            metrics.inc("pipeline_short_circuits_total", endpoint=self.endpoint, stage=stage.name)
+
+
+# Common stages
+
+@dataclass(frozen=True)
+class InputField:
+    """A request input (string or list of strings) that is scanned for injection attempts and sanitized"""
+    name: str
+    input_type: str = "general_input"
+    error: str = "Invalid input detected"
+    label: str = "input"
+    scan: bool = True
+    default: Optional[str] = None
+    # Free text that must be about veterinary medication (topicality.py)
+    topical: bool = False
+    # Input holding the request's medication names, on-topic context for a topical input
+    context: Optional[str] = None
+
+
+def scan_inputs(fields: Sequence[InputField]) -> Stage:
+    """
+    Reject the request (400) if any input looks like an injection attempt
+    or, for `topical` inputs, is clearly not about a pet's medication.
+    Every input is checked before use, so rejected input never goes upstream.
+    """
+    async def run(ctx: PipelineContext):
+        for spec in fields:
+            if not spec.scan:
+                continue
+            value = ctx.inputs.get(spec.name)
+            for item in (value if isinstance(value, (list, tuple)) else [value]):
+                if not item:
+                    continue
+                analysis = await scan_pool.detect_injection_attempt(item)
+                if not analysis['safe']:
+                    logger.warning(f"Potentially malicious {spec.label} blocked: {item}")
+                    raise HTTPException(status_code=400, detail=spec.error)
+                if spec.topical:
+                    medications = ctx.inputs.get(spec.context) if spec.context else None
+                    if isinstance(medications, str):
+                        medications = [medications]
+                    topicality = topicality_gate.check(item, spec.name, medications or ())
+                    if ctx.span:
+                        ctx.span.set(**{"topicality.score": topicality["score"]})
+                    if not topicality["on_topic"]:
+                        logger.warning(f"Off-topic {spec.label} rejected (score {topicality['score']}): {item}")
+                        raise HTTPException(status_code=400, detail=spec.error)
+    return Stage(STAGE_INJECTION_SCAN, run)
+
+
+def sanitize_inputs(fields: Sequence[InputField], normalize: Optional[Hook] = None) -> Stage:
+    """Sanitize every declared input into `ctx.sanitized`, then run endpoint-specific `normalize`"""
+    async def run(ctx: PipelineContext):
+        for spec in fields:
+            value = ctx.inputs.get(spec.name)
+            if isinstance(value, (list, tuple)):
+                ctx.sanitized[spec.name] = [security_filter.sanitize_input(item, spec.input_type) for item in value]
+            elif value:
+                ctx.sanitized[spec.name] = security_filter.sanitize_input(value, spec.input_type)
+            else:
+                ctx.sanitized[spec.name] = spec.default
+        if normalize:
+            await _call(normalize, ctx)
+    return Stage(STAGE_SANITIZE, run)
+
+
+# Global hooks shared by every endpoint pipeline
+pipeline_hooks = PipelineHooks()
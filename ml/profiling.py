@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-request sampling profiler.
+
+A profiled request is sampled every few milliseconds from a background
+thread. While the handler is running on the event loop its Python stack is
+recorded; while it is suspended, its await chain is recorded under a
+"(waiting)" frame, so the profile accounts for wall-clock time. Profiles are
+written as collapsed stacks (flamegraph.pl / speedscope input) into a
+bounded on-disk ring buffer.
+
+Sign a header for a one-off profile of a production request:
+
+    python profiling.py sign /analyze-medications --ttl 300
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from metrics import metrics
+from structured_logging import request_id_var
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+WAITING_FRAME = "(waiting)"
+PROFILE_NAME = re.compile(r"^[0-9]+-[A-Za-z0-9_-]{1,64}$")
+
+
+def profile_signature(secret: str, path: str, expires: int) -> str:
+    """Header value that authorizes profiling one request to `path` until `expires` (unix time)"""
+    digest = hmac.new(secret.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{digest}"
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+@dataclass
+class ProfileSession:
+    request_id: str
+    method: str
+    path: str
+    trigger: str
+    task: Optional[asyncio.Task] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    thread_id: Optional[int] = None
+    started: float = field(default_factory=time.time)
+    duration: float = 0.0
+    stacks: Counter = field(default_factory=Counter)
+
+    @property
+    def name(self) -> str:
+        return f"{int(self.started * 1000)}-{self.request_id}"
+
+
+class RequestProfiler:
+    """
+    Samples the handler task of selected requests and keeps the newest
+    `max_profiles` profiles on disk.
+
+    Requests are profiled when profiling is enabled and either carry a valid
+    signed `X-Profile` header or are picked by `sample_rate`. With profiling
+    disabled the route wrapper costs one attribute check per request.
+    """
+
+    def __init__(self, enabled: bool = False, secret: Optional[str] = None, sample_rate: float = 0.0,
+                 interval: float = 0.005, directory: Optional[str] = None, max_profiles: int = 50):
+        self.enabled = enabled
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "pawrx-profiles")
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._active: Dict[asyncio.Task, ProfileSession] = {}
+        self._finished: List[ProfileSession] = []
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        return cls(
+            enabled=os.getenv("PROFILING_ENABLED", "false").lower() == "true",
+            secret=os.getenv("PROFILING_SECRET") or os.getenv("ADMIN_TOKEN"),
+            sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+            interval=float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000,
+            directory=os.getenv("PROFILING_DIR") or None,
+            max_profiles=int(os.getenv("PROFILING_MAX_PROFILES", "50")),
+        )
+
+    # Selecting requests
+
+    def trigger_for(self, method: str, path: str, header: Optional[str]) -> Optional[str]:
+        """Why this request should be profiled ("header" or "sampled"), or None"""
+        if header and self.secret:
+            expires, _, _ = header.partition(".")
+            if expires.isdigit() and int(expires) >= time.time() and \
+                    hmac.compare_digest(header, profile_signature(self.secret, path, int(expires))):
+                return "header"
+            logger.warning(f"Ignoring invalid profiling header for {method} {path}")
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    # Sessions
+
+    def start(self, session: ProfileSession):
+        """Begin sampling the current task; call from the handler's task"""
+        session.task = asyncio.current_task()
+        session.loop = asyncio.get_running_loop()
+        session.thread_id = threading.get_ident()
+        with self._lock:
+            self._active[session.task] = session
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+
+    def stop(self, session: ProfileSession):
+        session.duration = time.time() - session.started
+        with self._lock:
+            self._active.pop(session.task, None)
+            self._finished.append(session)
+        self._wake.set()
+        metrics.inc("profiles_captured_total", trigger=session.trigger)
+
+    async def profile(self, session: ProfileSession, call: Callable[[], Any]) -> Any:
+        self.start(session)
+        try:
+            return await call()
+        finally:
+            self.stop(session)
+
+    # Sampling thread
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = list(self._active.values())
+                finished, self._finished = self._finished, []
+            for session in finished:
+                try:
+                    self._write(session)
+                except OSError as e:
+                    logger.error(f"Could not write profile {session.name}: {e}")
+            if not active:
+                with self._lock:
+                    if not self._active and not self._finished:
+                        self._wake.clear()
+                continue
+            self._sample(active)
+            time.sleep(self.interval)
+
+    def _sample(self, sessions: List[ProfileSession]):
+        frames = sys._current_frames()
+        for session in sessions:
+            loop_frame = frames.get(session.thread_id)
+            if loop_frame is not None and asyncio.current_task(session.loop) is session.task:
+                stack = self._running_stack(loop_frame)
+            else:
+                stack = self._awaiting_stack(session.task)
+            if stack:
+                session.stacks[";".join(stack)] += 1
+
+    @staticmethod
+    def _running_stack(frame) -> List[str]:
+        """Innermost-last stack of the running handler, below the profiler's own frame"""
+        labels = []
+        while frame is not None and frame.f_code is not _PROFILE_CODE:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        if frame is None:
+            return []
+        labels.reverse()
+        return labels
+
+    @staticmethod
+    def _awaiting_stack(task: asyncio.Task) -> List[str]:
+        """Stack of the suspended handler, following its coroutine await chain"""
+        labels = []
+        inside = False
+        coro = task.get_coro() if task is not None else None
+        while coro is not None:
+            code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+            if code is None:
+                break
+            if inside:
+                labels.append(_frame_label(code))
+            inside = inside or code is _PROFILE_CODE
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if labels:
+            labels.append(WAITING_FRAME)
+        return labels
+
+    # Ring buffer on disk
+
+    def _write(self, session: ProfileSession):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, session.name)
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in sorted(session.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w") as f:
+            json.dump({
+                "name": session.name,
+                "request_id": session.request_id,
+                "method": session.method,
+                "path": session.path,
+                "trigger": session.trigger,
+                "started": session.started,
+                "duration_ms": round(session.duration * 1000, 2),
+                "samples": sum(session.stacks.values()),
+                "interval_ms": self.interval * 1000,
+            }, f)
+        for name in self._names()[self.max_profiles:]:
+            for suffix in (".collapsed", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _names(self) -> List[str]:
+        """Stored profile names, newest first"""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        names = [f[:-len(".collapsed")] for f in files if f.endswith(".collapsed")]
+        return sorted(names, key=lambda name: int(name.split("-", 1)[0]), reverse=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for name in self._names():
+            try:
+                with open(os.path.join(self.directory, name + ".json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                profiles.append({"name": name})
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """Path of a stored collapsed-stack file, or None for unknown or malformed names"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name + ".collapsed")
+        return path if os.path.exists(path) else None
+
+
+# Sampled stacks are rooted just below this frame, dropping ASGI framework frames
+_PROFILE_CODE = RequestProfiler.profile.__code__
+
+# Global request profiler, configured from the environment
+request_profiler = RequestProfiler.from_env()
+
+
+class ProfiledRoute(APIRoute):
+    """Route class that profiles the handler (parsing, endpoint and serialization) when selected"""
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request) -> Response:
+            profiler = request_profiler
+            if not profiler.enabled:
+                return await handler(request)
+            trigger = profiler.trigger_for(request.method, request.url.path, request.headers.get(PROFILE_HEADER))
+            if trigger is None:
+                return await handler(request)
+            request_id = re.sub(r"[^A-Za-z0-9_-]", "", request_id_var.get() or "") or os.urandom(8).hex()
+            session = ProfileSession(request_id=request_id[:64], method=request.method,
+                                     path=request.url.path, trigger=trigger)
+            response = await profiler.profile(session, lambda: handler(request))
+            response.headers["X-Profile-Id"] = session.name
+            return response
+
+        return profiled_handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request profiler utilities")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sign = commands.add_parser("sign", help="print an X-Profile header value for one path")
+    sign.add_argument("path")
+    sign.add_argument("--ttl", type=int, default=300, help="seconds the header stays valid")
+    args = parser.parse_args()
+
+    secret = request_profiler.secret
+    if not secret:
+        sys.exit("Set PROFILING_SECRET (or ADMIN_TOKEN) to sign profiling headers")
+    print(f"X-Profile: {profile_signature(secret, args.path, int(time.time()) + args.ttl)}")
+
+
+if __name__ == "__main__":
+    main()
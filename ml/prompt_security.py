@@ -1,9 +1,17 @@
 import re
+import os
 import json
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any, Optional
 from enum import Enum
 
+from prompts import ANALYZE_ADDITION_TEMPLATE, ANALYZE_MEDICATIONS_TEMPLATE, DEFAULT_ANALYSIS_QUERY
+from metrics import metrics
+from tracing import STAGE_INJECTION_SCAN, STAGE_SANITIZE, tracer
+
 logger = logging.getLogger(__name__)
 
 class RiskLevel(Enum):
@@ -92,6 +100,34 @@ class PromptSecurityFilter:
             'medical_condition': 200,
             'general_input': 1000
         }
+        
+        # Clearly non-medical topics, used by validate_medical_context
+        self.non_medical_patterns = [
+            r'\b(politics|election|government|democracy)\b',
+            r'\b(weather|climate|temperature)\b',
+            r'\b(sports|football|basketball|soccer)\b',
+            r'\b(programming|coding|software|computer)\b',
+            r'\b(movie|film|entertainment|celebrity)\b',
+            r'\b(cooking|recipe|restaurant|food)\b(?!.*\bpet\b)',  # Allow food-related if about pets
+            r'\b(bomb|explosive|weapon|violence)\b',
+            r'\b(cryptocurrency|bitcoin|investment|stock)\b'
+        ]
+        
+        # Patterns that get a model response replaced outright
+        self.response_malicious_patterns = [
+            r'(?i)\b(ignore\s+all|forget\s+everything|new\s+instructions?)\b',
+            r'(?i)\b(jailbreak|DAN\s+mode|system\s+override)\b',
+            r'(?i)\b(hack|exploit|malicious|unauthorized)\b',
+        ]
+        
+        # Compiled once here (and once per scan worker) rather than looked up on every scan
+        self._injection_regexes = [(p, re.compile(p, re.IGNORECASE)) for p in self.injection_patterns]
+        self._medical_regexes = [re.compile(p, re.IGNORECASE) for p in self.medical_whitelist_patterns]
+        self._non_medical_regexes = [re.compile(p, re.IGNORECASE) for p in self.non_medical_patterns]
+        self._response_regexes = [re.compile(p) for p in self.response_malicious_patterns]
+        self._special_char = re.compile(r'[^a-zA-Z0-9\s]')
+        self._prompt_leak = re.compile(r'(?i)\b(system\s+prompt|original\s+instruction)\b')
+        self._code_block = re.compile(r'```.*?```', re.DOTALL)
 
     def sanitize_input(self, input_text: str, input_type: str = 'general_input') -> str:
         """
@@ -133,8 +169,8 @@ class PromptSecurityFilter:
         risk_score = 0
         
         # Check against injection patterns
-        for pattern in self.injection_patterns:
-            matches = re.findall(pattern, input_text, re.IGNORECASE)
+        for pattern, regex in self._injection_regexes:
+            matches = regex.findall(input_text)
             if matches:
                 flags.append({
                     "pattern": pattern,
@@ -144,7 +180,7 @@ class PromptSecurityFilter:
                 risk_score += 10
         
         # Check for excessive special characters (could indicate obfuscation)
-        special_char_ratio = len(re.findall(r'[^a-zA-Z0-9\s]', input_text)) / len(input_text)
+        special_char_ratio = len(self._special_char.findall(input_text)) / len(input_text)
         if special_char_ratio > 0.3:
             flags.append({
                 "type": "high_special_char_ratio",
@@ -198,7 +234,12 @@ class PromptSecurityFilter:
                 elif 'breed' in key.lower():
                     input_type = 'pet_breed'
                 
-                sanitized_inputs[key] = self.sanitize_input(value, input_type)
+                if key.lower().endswith('_list'):
+                    # One item per line; each line is sanitized and length-limited on its own
+                    sanitized_inputs[key] = "\n".join(
+                        self.sanitize_input(line, input_type) for line in value.splitlines())
+                else:
+                    sanitized_inputs[key] = self.sanitize_input(value, input_type)
             else:
                 sanitized_inputs[key] = value
         
@@ -219,28 +260,17 @@ class PromptSecurityFilter:
         
         # Check for medical whitelist patterns
         medical_indicators = 0
-        for pattern in self.medical_whitelist_patterns:
-            if re.search(pattern, input_text, re.IGNORECASE):
+        for regex in self._medical_regexes:
+            if regex.search(input_text):
                 medical_indicators += 1
         
         # Be more lenient - only flag as non-medical if text is long AND has clear non-medical indicators
         text_length = len(input_text.split())
         
         # Check for clearly non-medical content
-        non_medical_patterns = [
-            r'\b(politics|election|government|democracy)\b',
-            r'\b(weather|climate|temperature)\b',
-            r'\b(sports|football|basketball|soccer)\b',
-            r'\b(programming|coding|software|computer)\b',
-            r'\b(movie|film|entertainment|celebrity)\b',
-            r'\b(cooking|recipe|restaurant|food)\b(?!.*\bpet\b)',  # Allow food-related if about pets
-            r'\b(bomb|explosive|weapon|violence)\b',
-            r'\b(cryptocurrency|bitcoin|investment|stock)\b'
-        ]
-        
         non_medical_indicators = 0
-        for pattern in non_medical_patterns:
-            if re.search(pattern, input_text, re.IGNORECASE):
+        for regex in self._non_medical_regexes:
+            if regex.search(input_text):
                 non_medical_indicators += 1
         
         # Only reject if clearly non-medical AND long text with no medical context
@@ -258,21 +288,14 @@ class PromptSecurityFilter:
             return ""
         
         # Remove any potential prompt leakage (be more specific to avoid false positives)
-        sanitized = re.sub(r'(?i)\b(system\s+prompt|original\s+instruction)\b', 
-                          '[FILTERED]', response)
+        sanitized = self._prompt_leak.sub('[FILTERED]', response)
         
         # Remove any code blocks that might have been injected
-        sanitized = re.sub(r'```.*?```', '[CODE_BLOCK_FILTERED]', sanitized, flags=re.DOTALL)
+        sanitized = self._code_block.sub('[CODE_BLOCK_FILTERED]', sanitized)
         
         # Only filter response if it contains clearly malicious content
-        malicious_patterns = [
-            r'(?i)\b(ignore\s+all|forget\s+everything|new\s+instructions?)\b',
-            r'(?i)\b(jailbreak|DAN\s+mode|system\s+override)\b',
-            r'(?i)\b(hack|exploit|malicious|unauthorized)\b',
-        ]
-        
-        for pattern in malicious_patterns:
-            if re.search(pattern, sanitized):
+        for regex in self._response_regexes:
+            if regex.search(sanitized):
                 logger.warning("AI response filtered due to malicious content patterns")
                 return "I can only provide information about pet medication safety. Please rephrase your question about your pet's medications."
         
@@ -282,59 +305,120 @@ class PromptSecurityFilter:
 # Global security filter instance
 security_filter = PromptSecurityFilter()
 
-def secure_analyze_medications(pet_info: Dict[str, Any], medications: List[Dict[str, Any]], query: str = None) -> str:
+SCAN_METHODS = ("detect_injection_attempt", "validate_medical_context", "sanitize_ai_response")
+
+def _run_scan(method: str, text: str) -> Any:
+    """Scan worker entry point; runs against the worker process's own security_filter"""
+    return getattr(security_filter, method)(text)
+
+def _warm_worker() -> int:
+    # Importing this module compiled the patterns; run each scan once to settle the worker
+    for method in SCAN_METHODS:
+        _run_scan(method, "warm up carprofen 75 mg twice daily")
+    return os.getpid()
+
+class SecurityScanPool:
     """
-    Securely analyze medications with full injection protection
+    Runs large security scans off the event loop.
+    
+    Texts shorter than `offload_min_chars` are scanned inline (a process
+    round trip costs more than the scan); longer ones go to a bounded pool
+    of `workers` processes, at most `max_pending` at a time, so a huge
+    query or model response no longer stalls every other connection.
+    Until start() is called, or with no workers, everything runs inline.
     """
-    # Validate and sanitize all inputs
-    medication_names = []
-    for med in medications:
-        if 'name' in med:
-            # Check each medication name for injection attempts
-            med_analysis = security_filter.detect_injection_attempt(med['name'])
-            if not med_analysis['safe']:
-                logger.warning(f"Potentially malicious medication name blocked: {med['name']}")
-                raise ValueError("Invalid medication name detected")
-            
-            sanitized_name = security_filter.sanitize_input(med['name'], 'medication_name')
-            medication_names.append(sanitized_name)
     
-    # Validate query if provided
-    if query:
-        query_analysis = security_filter.detect_injection_attempt(query)
-        if not query_analysis['safe']:
-            logger.warning(f"Potentially malicious query blocked: {query}")
-            raise ValueError("Invalid query detected")
-        
-        query = security_filter.sanitize_input(query, 'query')
+    def __init__(self, workers: int = 0, offload_min_chars: int = 2048, max_pending: Optional[int] = None):
+        self.workers = workers
+        self.offload_min_chars = offload_min_chars
+        self.max_pending = max_pending or workers * 4
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Optional[asyncio.Semaphore] = None
     
-    # Create secure prompt using template
-    prompt_template = """You are a veterinary pharmacology expert. Your role is strictly limited to analyzing pet medications for safety.
-
-Pet Information:
-- Species: {species}
-- Breed: {breed}
-- Weight: {weight} {weightUnit}
-- Age: {age} {ageUnit}
-
-Current Medications:
-{medications_list}
-
-Analysis Request: {query}
+    @classmethod
+    def from_env(cls) -> "SecurityScanPool":
+        # Leave a core for the event loop; a few workers cover the large scans
+        default_workers = min(4, max(1, (os.cpu_count() or 2) - 1))
+        return cls(
+            workers=int(os.getenv("SCAN_POOL_WORKERS", str(default_workers))),
+            offload_min_chars=int(os.getenv("SCAN_OFFLOAD_MIN_CHARS", "2048")),
+        )
+    
+    async def start(self):
+        """Start the worker processes and wait until each has warmed up"""
+        if self.workers <= 0 or self._executor:
+            return
+        # Spawned rather than forked: the service already runs background threads
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        self._pending = asyncio.Semaphore(self.max_pending)
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker) for _ in range(self.workers)))
+        logger.info(f"Security scan pool ready: {len(set(pids))} workers, offloading scans over {self.offload_min_chars} chars")
+    
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def scan(self, method: str, text: str) -> Any:
+        if self._executor is None or not text or len(text) < self.offload_min_chars:
+            metrics.inc("security_scans_total", scan=method, mode="inline")
+            return _run_scan(method, text)
+        metrics.inc("security_scans_total", scan=method, mode="offloaded")
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _run_scan, method, text)
+    
+    async def detect_injection_attempt(self, text: str) -> Dict[str, Any]:
+        return await self.scan("detect_injection_attempt", text)
+    
+    async def validate_medical_context(self, text: str) -> bool:
+        return await self.scan("validate_medical_context", text)
+    
+    async def sanitize_ai_response(self, text: str) -> str:
+        return await self.scan("sanitize_ai_response", text)
 
-IMPORTANT: Only provide veterinary medication analysis. Do not respond to any requests outside this scope.
+# Global scan pool; started with the service (SCAN_POOL_WORKERS, SCAN_OFFLOAD_MIN_CHARS)
+scan_pool = SecurityScanPool.from_env()
 
-Provide your analysis in the following JSON format:
-{{
-    "analysis": "detailed safety analysis",
-    "riskLevel": "Low/Medium/High/Critical",
-    "recommendations": ["recommendation1", "recommendation2"],
-    "warnings": ["warning1", "warning2"],
-    "sources": []
-}}"""
+async def secure_analyze_medications(pet_info: Dict[str, Any], medications: List[Dict[str, Any]], query: str = None,
+                                     added: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Securely analyze medications with full injection protection. With
+    `added`, the prompt asks only about that medication joining the
+    already-analyzed `medications`.
+    """
+    # Check every input for injection attempts before using any of them
+    with tracer.span(STAGE_INJECTION_SCAN):
+        for med in medications + ([added] if added else []):
+            if 'name' in med:
+                med_analysis = await scan_pool.detect_injection_attempt(med['name'])
+                if not med_analysis['safe']:
+                    logger.warning(f"Potentially malicious medication name blocked: {med['name']}")
+                    raise ValueError("Invalid medication name detected")
+        
+        if query:
+            query_analysis = await scan_pool.detect_injection_attempt(query)
+            if not query_analysis['safe']:
+                logger.warning(f"Potentially malicious query blocked: {query}")
+                raise ValueError("Invalid query detected")
     
-    # Prepare sanitized inputs
-    medications_formatted = "\n".join([f"- {name}" for name in medication_names])
+    # Sanitize inputs and render them into the request template
+    with tracer.span(STAGE_SANITIZE):
+        return render_analysis_prompt(pet_info, medications, query, added)
+
+def render_analysis_prompt(pet_info: Dict[str, Any], medications: List[Dict[str, Any]], query: str = None,
+                           added: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Sanitize already-scanned analysis inputs and render them into the
+    request template (ANALYZE_ADDITION_TEMPLATE when `added` is given)
+    """
+    medication_names = [
+        security_filter.sanitize_input(med['name'], 'medication_name')
+        for med in medications if 'name' in med
+    ]
+    if query:
+        query = security_filter.sanitize_input(query, 'query')
     
     secure_inputs = {
         'species': security_filter.sanitize_input(str(pet_info.get('species', 'Unknown'))),
@@ -343,11 +427,11 @@ Provide your analysis in the following JSON format:
         'weightUnit': security_filter.sanitize_input(str(pet_info.get('weightUnit', 'kg'))),
         'age': str(pet_info.get('age', 'Unknown')),
         'ageUnit': security_filter.sanitize_input(str(pet_info.get('ageUnit', 'years'))),
-        'medications_list': medications_formatted,
-        'query': query or "Provide a comprehensive safety analysis of these medications"
+        'medications_list': "\n".join([f"- {name}" for name in medication_names]),
+        'query': query or DEFAULT_ANALYSIS_QUERY
     }
     
-    # Create secure prompt
-    secure_prompt = security_filter.create_secure_prompt(prompt_template, secure_inputs)
-    
-    return secure_prompt 
\ No newline at end of file
+    if added:
+        secure_inputs['medication'] = security_filter.sanitize_input(added['name'], 'medication_name')
+        return security_filter.create_secure_prompt(ANALYZE_ADDITION_TEMPLATE, secure_inputs)
+    return security_filter.create_secure_prompt(ANALYZE_MEDICATIONS_TEMPLATE, secure_inputs) 
\ No newline at end of file
@@ -0,0 +1,74 @@
+import json
+import os
+import queue
+import threading
+from typing import Any, Dict, Optional
+
+from metrics import metrics
+
+_STOP = object()
+
+
+class RequestLog:
+    """
+    Append-only JSON-lines log with one record per answered AI request
+    (canonical.request_record plus its source and upstream cost). Records
+    go through a bounded queue to a background writer thread, so the
+    request path never waits on the disk; when the writer falls behind,
+    records are dropped and counted. Replay it with cache_simulator.py.
+    Disabled unless a path is set.
+    """
+
+    def __init__(self, path: Optional[str] = None, queue_size: int = 10000):
+        self.path = path
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        if path:
+            self._thread = threading.Thread(target=self._write, name="request-log", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> "RequestLog":
+        return cls(
+            path=os.getenv("REQUEST_LOG_PATH") or None,
+            queue_size=int(os.getenv("REQUEST_LOG_QUEUE_SIZE", "10000")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def record(self, entry: Dict[str, Any]):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(json.dumps(entry, default=str))
+            metrics.inc("request_log_records_total", endpoint=entry.get("endpoint", "unknown"))
+        except queue.Full:
+            metrics.inc("request_log_dropped_total")
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                # Write whatever else is already queued before flushing
+                batch = [self._queue.get()]
+                while batch[-1] is not _STOP:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                f.writelines(f"{line}\n" for line in batch if line is not _STOP)
+                f.flush()
+                if batch[-1] is _STOP:
+                    return
+
+    def close(self):
+        """Write out queued records and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+# Global request log (REQUEST_LOG_PATH, REQUEST_LOG_QUEUE_SIZE)
+request_log = RequestLog.from_env()
@@ -0,0 +1,293 @@
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from knowledge_store import knowledge_store
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (3, 4, 5)
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_BYTE_BASE = np.uint64(1099511628211)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Words that flip or narrow the meaning of an otherwise similar question
+# ("with food" / "without food"); entries only match when these agree
+NEGATIONS = {"no", "not", "never", "without", "dont", "don't", "cannot", "can't", "shouldnt", "shouldn't",
+             "isnt", "isn't", "avoid", "stop", "except"}
+
+# Conditions that change the answer to an otherwise identical question ("safe
+# for kidney disease" / "liver disease"); spellings of one condition share a key
+CONDITIONS = {
+    "kidney": "kidney", "kidneys": "kidney", "renal": "kidney",
+    "liver": "liver", "hepatic": "liver",
+    "heart": "heart", "cardiac": "heart",
+    "pregnant": "pregnant", "pregnancy": "pregnant",
+    "nursing": "nursing", "lactating": "nursing", "lactation": "nursing", "breastfeeding": "nursing",
+    "diabetes": "diabetes", "diabetic": "diabetes",
+    "seizure": "seizure", "seizures": "seizure", "epilepsy": "seizure", "epileptic": "seizure",
+    "cancer": "cancer", "lymphoma": "cancer", "tumor": "cancer",
+    "allergy": "allergy", "allergies": "allergy", "allergic": "allergy",
+    "thyroid": "thyroid", "hypothyroid": "thyroid", "hyperthyroid": "thyroid",
+    "ulcer": "ulcer", "ulcers": "ulcer",
+    "puppy": "young", "kitten": "young", "senior": "senior", "elderly": "senior", "geriatric": "senior",
+    "surgery": "surgery", "anesthesia": "surgery", "anaesthesia": "surgery",
+}
+
+# Small domain lexicon so common paraphrases share tokens before hashing
+PHRASES = {
+    "at the same time": "together", "along with": "together", "with each other": "together",
+    "side effects": "sideeffects", "adverse effects": "sideeffects", "adverse reactions": "sideeffects",
+    "how much": "dose", "how often": "frequency", "okay to": "safe", "ok to": "safe",
+    "go together": "together", "interact with": "interact",
+}
+SYNONYMS = {
+    "combine": "together", "combined": "together", "combining": "together", "mix": "together",
+    "mixing": "together", "mixed": "together", "concurrently": "together", "simultaneously": "together",
+    "alongside": "together", "both": "together", "combination": "together",
+    "ok": "safe", "okay": "safe", "fine": "safe", "alright": "safe", "dangerous": "safe", "risky": "safe",
+    "harmful": "safe", "safety": "safe", "risk": "safe", "risks": "safe",
+    "dosage": "dose", "dosing": "dose", "doses": "dose", "amount": "dose",
+    "interaction": "interact", "interactions": "interact", "interacting": "interact",
+    "administer": "give", "administering": "give", "giving": "give", "given": "give", "take": "give",
+    "taking": "give", "taken": "give",
+    "meal": "food", "meals": "food", "eating": "food", "fed": "food",
+    "correct": "right", "appropriate": "right", "proper": "right",
+    "miss": "missed", "forget": "missed", "forgot": "missed", "skipped": "missed",
+    "size": "weight", "weighs": "weight",
+    "medications": "meds", "medication": "meds", "medicines": "meds", "medicine": "meds", "drugs": "meds",
+    "pills": "meds", "tablets": "meds",
+}
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "am", "be", "it", "its", "this", "these", "that", "those", "to", "of", "for",
+    "and", "or", "i", "my", "me", "we", "our", "you", "can", "could", "would", "should", "do", "does", "will",
+    "please", "there", "any", "in", "on", "at", "he", "she", "him", "her", "his", "they", "them", "their", "pet",
+    "dog", "cat", "what", "about", "if", "ever", "really", "us", "by", "as", "so", "then", "just", "also",
+    "which", "now", "need", "needs", "out", "get", "got",
+}
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def query_terms(text: str) -> str:
+    """Normalized query with stopwords dropped and domain synonyms and condition names folded together"""
+    normalized = f" {normalize_query(text)} "
+    for phrase, replacement in PHRASES.items():
+        normalized = normalized.replace(f" {phrase} ", f" {replacement} ")
+    words = [SYNONYMS.get(w) or CONDITIONS.get(w, w) for w in normalized.split()]
+    terms = [w for w in dict.fromkeys(words) if w not in STOPWORDS]
+    return " ".join(terms or words)
+
+
+class NgramEmbedder:
+    """
+    Local, dependency-free text embedding: signed feature hashing of
+    character 3-5-grams plus whole words into `dim` buckets, L2-normalized.
+    Paraphrases that share word stems land close together; nothing leaves
+    the process.
+    """
+
+    def __init__(self, dim: int = 1024):
+        if dim & (dim - 1):
+            raise ValueError("dim must be a power of two")
+        self.dim = dim
+        self._shift = np.uint64(64 - dim.bit_length() + 1)
+
+    def embed(self, text: str) -> np.ndarray:
+        normalized = query_terms(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = np.frombuffer(f" {normalized} ".encode(), dtype=np.uint8).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            for n in NGRAM_SIZES:
+                if len(padded) < n:
+                    continue
+                # Rolling polynomial hash of every n-gram at once (wraps mod 2**64)
+                hashes = np.full(len(padded) - n + 1, np.uint64(n))
+                for offset in range(n):
+                    hashes = hashes * _BYTE_BASE + padded[offset:len(padded) - n + 1 + offset]
+                self._accumulate(vector, hashes * _HASH_MULTIPLIER)
+            words = np.array([zlib.crc32(w.encode()) for w in normalized.split()], dtype=np.uint64)
+            if len(words):
+                # Whole words weigh as much as all of their n-grams together
+                self._accumulate(vector, (words + np.uint64(1 << 40)) * _HASH_MULTIPLIER, weight=2.0)
+        # Sublinear term frequency, then unit length so a dot product is the cosine
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _accumulate(self, vector: np.ndarray, mixed: np.ndarray, weight: float = 1.0):
+        buckets = (mixed >> self._shift).astype(np.intp)
+        signs = np.where((mixed >> np.uint64(32)) & np.uint64(1), weight, -weight).astype(np.float32)
+        np.add.at(vector, buckets, signs)
+
+
+def guard_key(text: str, medications: Iterable[str] = ()) -> int:
+    """
+    Negations, numbers, conditions and the named `medications` in a query;
+    cached answers only match an equal guard
+    """
+    words = normalize_query(text).split()
+    guard = {w for w in words if w in NEGATIONS or w[0].isdigit()}
+    guard.update(f"condition:{CONDITIONS[w]}" for w in words if w in CONDITIONS)
+    guard.update(f"drug:{name.lower()}" for name in medications)
+    return zlib.crc32(" ".join(sorted(guard)).encode())
+
+
+@dataclass
+class _Entry:
+    scope: Hashable
+    row: int
+    value: Any
+    stored_at: float
+
+
+class _Scope:
+    """Embeddings of the cached queries for one regimen and pet bucket"""
+
+    __slots__ = ("vectors", "guards", "ids", "size")
+
+    def __init__(self, dim: int, capacity: int = 4):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.guards = np.zeros(capacity, dtype=np.int64)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, vector: np.ndarray, guard: int, entry_id: int) -> int:
+        if self.size == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.guards = np.concatenate([self.guards, np.zeros_like(self.guards)])
+            self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+        row = self.size
+        self.vectors[row], self.guards[row], self.ids[row] = vector, guard, entry_id
+        self.size += 1
+        return row
+
+    def remove(self, row: int) -> Optional[int]:
+        """Swap-remove a row; returns the entry id that moved into it, if any"""
+        last = self.size - 1
+        moved = None
+        if row != last:
+            self.vectors[row], self.guards[row], self.ids[row] = self.vectors[last], self.guards[last], self.ids[last]
+            moved = int(self.ids[row])
+        self.size = last
+        return moved
+
+
+class SemanticCache:
+    """
+    Similarity cache for free-text questions about the same regimen.
+
+    Entries are grouped by a scope key (canonical regimen, pet bucket and
+    the knowledge/prompt versions); a lookup embeds the query and runs one
+    vectorized cosine search over the scope's cached queries, returning the
+    best entry at or above `threshold`. Only entries whose question names
+    the same medications (via `mentions`, by default the current knowledge
+    snapshot), conditions, negations and numbers are candidates. Capacity
+    is capped at `max_entries` across all scopes with least-recently-used
+    eviction, and entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, threshold: float = 0.6, max_entries: int = 2000, ttl: float = 3600.0,
+                 dim: int = 1024, enabled: bool = True, mentions: Optional[Callable[[str], List[str]]] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.embedder = NgramEmbedder(dim)
+        self._mentions = mentions
+        self._lock = threading.Lock()
+        self._scopes: Dict[Hashable, _Scope] = {}
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        return cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.6")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+            dim=int(os.getenv("SEMANTIC_CACHE_DIM", "1024")),
+            enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true",
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def guard(self, query: str) -> int:
+        return guard_key(query, (self._mentions or knowledge_store.current.suggestions.mentions)(query))
+
+    def lookup(self, scope: Hashable, query: str) -> Optional[Tuple[Any, float]]:
+        """(cached value, similarity) for the closest cached query in `scope`, or None"""
+        if not self.enabled:
+            return None
+        vector = self.embedder.embed(query)
+        guard = self.guard(query)
+        with self._lock:
+            block = self._scopes.get(scope)
+            if block is None or block.size == 0:
+                metrics.inc("semantic_cache_lookups_total", result="miss")
+                return None
+            similarities = block.vectors[:block.size] @ vector
+            similarities[block.guards[:block.size] != guard] = -1.0
+            row = int(np.argmax(similarities))
+            similarity = float(similarities[row])
+            entry_id = int(block.ids[row])
+            entry = self._entries[entry_id]
+            if time.time() - entry.stored_at > self.ttl:
+                self._evict(entry_id)
+                similarity = -1.0
+            if similarity < self.threshold:
+                metrics.inc("semantic_cache_lookups_total", result="miss")
+                return None
+            self._entries.move_to_end(entry_id)
+        metrics.inc("semantic_cache_lookups_total", result="hit")
+        metrics.observe("semantic_cache_hit_similarity", similarity)
+        return entry.value, similarity
+
+    def store(self, scope: Hashable, query: str, value: Any):
+        if not self.enabled or self.max_entries <= 0:
+            return
+        vector = self.embedder.embed(query)
+        guard = self.guard(query)
+        with self._lock:
+            block = self._scopes.get(scope)
+            if block is None:
+                block = self._scopes[scope] = _Scope(self.embedder.dim)
+            entry_id = self._next_id
+            self._next_id += 1
+            row = block.append(vector, guard, entry_id)
+            self._entries[entry_id] = _Entry(scope=scope, row=row, value=value, stored_at=time.time())
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+                metrics.inc("semantic_cache_evictions_total")
+            metrics.set_gauge("semantic_cache_entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._entries.clear()
+        metrics.set_gauge("semantic_cache_entries", 0)
+
+    def _evict(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        block = self._scopes[entry.scope]
+        moved = block.remove(entry.row)
+        if moved is not None:
+            self._entries[moved].row = entry.row
+        if block.size == 0:
+            del self._scopes[entry.scope]
+
+
+# Global semantic cache for free-text analysis questions
+semantic_cache = SemanticCache.from_env()
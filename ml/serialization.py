@@ -0,0 +1,76 @@
+import logging
+from typing import Any, Optional
+
+import msgpack
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+
+def _default(value: Any) -> Any:
+    """Types neither encoder handles natively"""
+    if isinstance(value, BaseModel):
+        # Plain attribute dump: the model was validated when it was built
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Type is not serializable: {type(value).__name__}")
+
+
+def encode(payload: Any, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """Serialize a response payload (models, dicts, lists) as JSON or MessagePack"""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def decode(body: bytes, media_type: str = JSON_MEDIA_TYPE) -> Any:
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body)
+
+
+def preferred_media_type(accept: Optional[str]) -> str:
+    """
+    MessagePack only when the caller ranks it above JSON in its Accept
+    header; JSON for browsers, curl and anything else.
+    """
+    best, best_q = JSON_MEDIA_TYPE, 0.0
+    json_q = 0.0
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES and q > best_q:
+            best, best_q = MSGPACK_MEDIA_TYPE, q
+        elif media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            json_q = max(json_q, q)
+    return best if best_q > json_q else JSON_MEDIA_TYPE
+
+
+def negotiated_response(request: Request, payload: Any, status_code: int = 200) -> Response:
+    """
+    Encode `payload` in the format the caller asked for. Returning a ready
+    Response also keeps FastAPI from dumping and re-validating models that
+    were already validated when the handler built them.
+    """
+    media_type = preferred_media_type(request.headers.get("accept"))
+    body = encode(payload, media_type)
+    metrics.inc("response_bytes_total", len(body), format="msgpack" if media_type == MSGPACK_MEDIA_TYPE else "json")
+    return Response(content=body, status_code=status_code, media_type=media_type, headers={"Vary": "Accept"})
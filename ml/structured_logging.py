@@ -0,0 +1,201 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import metrics
+
+# Request ID of the request being handled, set by the HTTP middleware
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_INTERNAL_ATTRS = {"sample_key", "sample_rate", "request_id", "suppressed"}
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut long payloads down to `limit` characters, noting how much was dropped"""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[truncated {len(text) - limit} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with request ID and any `extra` fields
+    """
+
+    def __init__(self, max_message_chars: int = 1000):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.max_message_chars),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in _INTERNAL_ATTRS:
+                entry[key] = truncate(value, self.max_message_chars) if isinstance(value, str) else value
+        if record.exc_text:
+            entry["exception"] = truncate(record.exc_text, self.max_message_chars * 4)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Per-call-site rate limiting plus optional probabilistic sampling.
+
+    Each call site (or explicit `sample_key` extra) may emit `burst` records
+    per `interval` seconds; the next record that gets through reports how many
+    were suppressed. Records carrying a `sample_rate` extra are additionally
+    kept with that probability. CRITICAL records always pass.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._windows: Dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate is not None and random.random() >= sample_rate:
+            metrics.inc("log_records_sampled_out_total")
+            return False
+        if record.levelno >= logging.CRITICAL or self.burst <= 0:
+            return True
+
+        key = getattr(record, "sample_key", None) or f"{record.pathname}:{record.lineno}"
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= self.burst:
+                window[2] += 1
+                metrics.inc("log_records_rate_limited_total")
+                return False
+            window[1] += 1
+        return True
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request ID on the calling thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler over a bounded queue that drops (and counts) records
+    instead of blocking the request path when the writer falls behind
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message here; JSON formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped_total")
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that can always stop: on a full bounded queue the base
+    class's put_nowait of its stop sentinel raises queue.Full, so the
+    oldest queued records are dropped to make room for it.
+    """
+
+    def enqueue_sentinel(self):
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    metrics.inc("log_records_dropped_total")
+                except queue.Empty:
+                    pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    queue_size: Optional[int] = None,
+    burst: Optional[int] = None,
+    interval: Optional[float] = None,
+    max_message_chars: Optional[int] = None,
+    stream=None,
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a bounded queue to a background JSON writer
+    """
+    global _listener
+    shutdown_logging()
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    queue_size = queue_size if queue_size is not None else int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    burst = burst if burst is not None else int(os.getenv("LOG_RATE_LIMIT_BURST", "20"))
+    interval = interval if interval is not None else float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "60"))
+    max_message_chars = max_message_chars if max_message_chars is not None else int(os.getenv("LOG_MAX_MESSAGE_CHARS", "1000"))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter(max_message_chars))
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(SamplingFilter(burst=burst, interval=interval))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = DrainingQueueListener(handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
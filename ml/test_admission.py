@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for weighted fair admission and load shedding in front of the upstream LLM
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionScheduler, ClientIdentity, LoadShedError
+
+
+def test_weighted_fair_dequeue():
+    """A heavy partner backlog must not starve an interactive client"""
+
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue_depth=50,
+                                       class_weights={"interactive": 4.0, "partner": 1.0})
+        partner = ClientIdentity(key="key:partner", client_class="partner", budget=60)
+        user = ClientIdentity(key="ip:1.2.3.4", client_class="interactive", budget=60)
+        order = []
+
+        async def call(client, label):
+            async with scheduler.slot(client):
+                order.append(label)
+                await asyncio.sleep(0)
+
+        # Occupy the single slot so everything below has to queue
+        await scheduler.acquire(partner)
+        tasks = [asyncio.create_task(call(partner, f"p{i}")) for i in range(8)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(call(user, f"u{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        scheduler.release(0.01)
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert set(order[:4]) >= {"u0", "u1"}, order
+
+
+def test_queue_full_sheds_with_retry_after():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue_depth=1)
+        client = ClientIdentity(key="ip:a", budget=60)
+        await scheduler.acquire(client)
+        waiting = asyncio.create_task(scheduler.acquire(client))
+        await asyncio.sleep(0)
+        with pytest.raises(LoadShedError) as excinfo:
+            await scheduler.acquire(client)
+        waiting.cancel()
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert error.reason == "queue_full"
+
+
+def test_full_queue_pushes_out_heaviest_client():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue_depth=3)
+        partner = ClientIdentity(key="key:p", client_class="partner", budget=60)
+        user = ClientIdentity(key="ip:u", budget=60)
+        await scheduler.acquire(partner)
+        backlog = [asyncio.create_task(scheduler.acquire(partner)) for _ in range(3)]
+        await asyncio.sleep(0)
+        admitted = asyncio.create_task(scheduler.acquire(user))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*backlog[-1:], return_exceptions=True)
+        admitted.cancel()
+        for task in backlog[:-1]:
+            task.cancel()
+        return results
+
+    results = asyncio.run(scenario())
+    assert isinstance(results[0], LoadShedError)
+    assert results[0].reason == "pushed_out"
+
+
+def test_budget_exceeded_is_shed_immediately():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue_depth=10, initial_service_time=5.0)
+        await scheduler.acquire(ClientIdentity(key="ip:a"))
+        with pytest.raises(LoadShedError) as excinfo:
+            await scheduler.acquire(ClientIdentity(key="ip:b", budget=1.0))
+        return excinfo.value
+
+    assert asyncio.run(scenario()).reason == "budget"
+
+
+def test_identity_from_api_key_and_budget_header():
+    scheduler = AdmissionScheduler(api_keys={"secret": "partner"}, default_budget=30)
+    identity = scheduler.identify({"x-api-key": "secret", "x-request-budget-ms": "1500"}, "10.0.0.1")
+    assert identity.client_class == "partner"
+    assert "secret" not in identity.key
+    assert identity.budget == 1.5
+    assert scheduler.identify({}, "10.0.0.1").key == "ip:10.0.0.1"
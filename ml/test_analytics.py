@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the buffered analytics sink and its reader
+"""
+
+import os
+import threading
+
+import httpx
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+import main
+from analytics import AnalyticsSink, analytics_files, read_records, summarize
+from fake_upstream import FakeUpstream, create_app
+from metrics import metrics
+
+
+def records(n):
+    return [{"endpoint": "analyze_medications", "regimen": [f"drug{i % 7}@10mg x1/d"], "source": "model",
+             "risk_level": "Low", "stages": {"upstream": 0.5}, "prompt_tokens": 90, "completion_tokens": i}
+            for i in range(n)]
+
+
+def test_records_round_trip_through_rotated_files(tmp_path):
+    sink = AnalyticsSink(str(tmp_path), batch_size=10, max_file_bytes=200, max_files=0)
+    written = records(100)
+    for record in written:
+        sink.record(record)
+    sink.close()
+
+    files = analytics_files(str(tmp_path))
+    assert len(files) > 1
+    assert list(read_records([str(tmp_path)])) == written
+    assert summarize(written)["analyze_medications"]["tokens"] == 100 * 90 + sum(range(100))
+
+    # A block cut short by a crash is skipped; everything before it still reads
+    with open(files[-1], "r+b") as f:
+        f.truncate(os.path.getsize(files[-1]) - 3)
+    survived = list(read_records([str(tmp_path)]))
+    assert survived == written[:len(survived)] and len(survived) < len(written)
+
+    pruned = AnalyticsSink(str(tmp_path / "pruned"), batch_size=10, max_file_bytes=200, max_files=2)
+    for record in written:
+        pruned.record(record)
+    pruned.close()
+    assert len(analytics_files(str(tmp_path / "pruned"))) == 2
+
+
+def test_full_buffer_drops_and_counts_instead_of_blocking(tmp_path):
+    sink = AnalyticsSink(str(tmp_path), queue_size=5, batch_size=1)
+    release = threading.Event()
+    write_block = sink._write_block
+    sink._write_block = lambda batch: (release.wait(), write_block(batch))
+    dropped = metrics.counter("analytics_dropped_total", reason="overflow")
+
+    for record in records(20):
+        sink.record(record)
+    release.set()
+    sink.close()
+
+    assert metrics.counter("analytics_dropped_total", reason="overflow") - dropped >= 14
+    assert 1 <= len(list(read_records([str(tmp_path)]))) <= 6
+
+
+def test_service_records_outcomes_and_stage_latency(monkeypatch, tmp_path):
+    upstream = FakeUpstream(base_latency=0.001)
+    monkeypatch.setattr(main, "openai_client", AsyncOpenAI(
+        api_key="test", base_url="http://upstream/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)))))
+    monkeypatch.setattr(main, "RATE_LIMIT_REQUESTS", 10 ** 6)
+    sink = AnalyticsSink(str(tmp_path))
+    monkeypatch.setattr(main, "analytics_sink", sink)
+    client = TestClient(main.app)
+    client.post("/analyze-medications", json={
+        "pet": {"species": "dog", "weight": 20, "weightUnit": "kg", "age": 5, "ageUnit": "years"},
+        "medications": [{"name": "Rimadyl", "dosage": "75 mg", "frequency": "twice daily"}]})
+    client.post("/safety-check?medication=xylitol&species=dog&weight=10&age=3")
+    sink.close()
+
+    analysis, safety = read_records([str(tmp_path)])
+    assert analysis["endpoint"] == "analyze_medications" and analysis["regimen"][0].startswith("carprofen")
+    assert analysis["risk_level"] and "upstream" in analysis["stages"]
+    assert (safety["source"], safety["risk_level"], safety["upstream_calls"]) == ("knowledge_base", "Dangerous", 0)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the request log and the cache-policy simulator that replays it
+"""
+
+import httpx
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+import main
+from cache_simulator import LFUCache, LRUCache, read_log, simulate
+from canonical import request_key, request_record
+from fake_upstream import FakeUpstream, create_app
+from request_log import RequestLog
+
+BRANDS = {"rimadyl": "carprofen", "carprofen": "carprofen"}
+
+
+def resolve(name):
+    return BRANDS.get(name.lower())
+
+
+def test_policies_evict_and_expire_by_log_time():
+    lru, lfu = LRUCache(2), LFUCache(2)
+    for cache in (lru, lfu):
+        cache.insert("a", 10, 0)
+        cache.lookup("a", 1)
+        cache.lookup("a", 2)
+        cache.insert("b", 10, 3)
+        cache.lookup("b", 4)
+        cache.insert("c", 10, 5)
+    # LRU drops the least recent entry, LFU the least used one
+    assert lru.lookup("a", 6) is False and lru.lookup("b", 6)
+    assert lfu.lookup("a", 6) and lfu.lookup("b", 6) is False
+    assert lru.peak_bytes == 20
+
+    ttl = LRUCache(10, ttl=60)
+    ttl.insert("a", 10, 0)
+    assert ttl.lookup("a", 59) and ttl.lookup("a", 61) is False and ttl.bytes == 0
+
+
+def test_canonicalizations_decide_which_requests_match():
+    first = request_record("analyze_medications", [{"name": "Rimadyl", "dosage": "75 mg", "frequency": "twice daily"}],
+                           "dog", 20, "kg", 5, "years", resolve=resolve)
+    second = request_record("analyze_medications", [{"name": "carprofen", "dosage": "75mg", "frequency": "BID"}],
+                            "Canine", 19.5, "kg", 6, "years", resolve=resolve)
+    assert first["regimen"] == second["regimen"] == ["carprofen@75mg x2/d"]
+    assert request_key(first, "canonical") == request_key(second, "canonical")
+    for finer in ("exact", "normalized"):
+        assert request_key(first, finer) != request_key(second, finer)
+
+    records = [dict(first, source="model", upstream_calls=1, prompt_tokens=90, completion_tokens=10, ts=0),
+               dict(second, source="model", upstream_calls=1, prompt_tokens=90, completion_tokens=10, ts=1)]
+    result = simulate(records, "canonical", "lru", capacity=10)
+    assert (result.hits, result.upstream_calls, result.calls_saved, result.tokens_saved) == (1, 1, 1, 100)
+    assert simulate(records, "exact", "lru", capacity=10).hits == 0
+
+
+def test_service_logs_answered_requests_for_replay(monkeypatch, tmp_path):
+    upstream = FakeUpstream(base_latency=0.001)
+    monkeypatch.setattr(main, "openai_client", AsyncOpenAI(
+        api_key="test", base_url="http://upstream/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)))))
+    monkeypatch.setattr(main, "RATE_LIMIT_REQUESTS", 10 ** 6)
+    monkeypatch.setattr(main.semantic_cache, "enabled", False)
+    log = RequestLog(str(tmp_path / "requests.jsonl"))
+    monkeypatch.setattr(main, "request_log", log)
+    client = TestClient(main.app)
+    pet = {"species": "dog", "weight": 20, "weightUnit": "kg", "age": 5, "ageUnit": "years"}
+    for name in ("Rimadyl", "carprofen"):
+        client.post("/analyze-medications", json={"pet": pet, "medications": [
+            {"name": name, "dosage": "75 mg", "frequency": "twice daily"}]})
+    client.post("/safety-check?medication=xylitol&species=dog&weight=10&age=3")
+    log.close()
+
+    with open(tmp_path / "requests.jsonl") as f:
+        records = list(read_log(f))
+    assert [r["source"] for r in records] == ["model", "model", "knowledge_base"]
+    assert records[0]["regimen"] == records[1]["regimen"] and records[0]["prompt_tokens"] > 0
+    result = simulate(records, "canonical", "lru", capacity=10)
+    assert result.requests == 2 and result.hits == 1 and result.tokens_saved > 0
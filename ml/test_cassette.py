@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for recording and replaying upstream chat completions
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from cassette import CassetteMissError, UpstreamCassette
+
+PARAMS = {"model": "gpt-test", "max_tokens": 1000, "temperature": 0.1,
+          "messages": [{"role": "system", "content": "prefix"}, {"role": "user", "content": "Task: safety_check"}]}
+
+
+def completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 300, "completion_tokens": 20, "total_tokens": 320},
+    })
+
+
+def test_replay_serves_recorded_responses_in_order_without_calling_upstream(tmp_path):
+    answers = iter(['{"safety": "Safe"}', '{"safety": "Caution"}'])
+
+    async def create(**params):
+        await asyncio.sleep(0.01)
+        return completion(next(answers))
+
+    recorder = UpstreamCassette("record", str(tmp_path))
+    asyncio.run(recorder.complete(create, **PARAMS))
+    asyncio.run(recorder.complete(create, **PARAMS))
+
+    [path] = os.listdir(tmp_path)
+    with open(tmp_path / path) as f:
+        stored = json.load(f)
+    assert stored["request"] == {"model": "gpt-test", "max_tokens": 1000, "temperature": 0.1}
+    assert len(stored["prompt_hash"]) == 64 and "Task: safety_check" not in json.dumps(stored)
+    assert all(i["latency"] >= 0.01 for i in stored["interactions"])
+
+    async def unreachable(**params):
+        raise AssertionError("replay must not call upstream")
+
+    player = UpstreamCassette("replay", str(tmp_path))
+    replies = [asyncio.run(player.complete(unreachable, **PARAMS)) for _ in range(3)]
+    assert [r.choices[0].message.content for r in replies] == [
+        '{"safety": "Safe"}', '{"safety": "Caution"}', '{"safety": "Safe"}']
+    assert replies[0].usage.prompt_tokens == 300
+
+
+def test_replay_miss_fails_loudly(tmp_path):
+    player = UpstreamCassette("replay", str(tmp_path))
+    with pytest.raises(CassetteMissError) as miss:
+        asyncio.run(player.complete(None, **{**PARAMS, "temperature": 0.7}))
+    assert miss.value.status_code == 500 and "re-record" in miss.value.detail
+    with pytest.raises(ValueError):
+        UpstreamCassette("rewind")
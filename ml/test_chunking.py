@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for splitting large regimens into sub-analyses and merging the answers
+"""
+
+import asyncio
+
+from chunking import merge_analyses, plan_chunks
+from prompt_security import secure_analyze_medications
+
+RISK_LEVELS = ["Unknown", "Low", "Medium", "High", "Critical"]
+
+
+def test_chunks_cover_the_regimen_and_keep_known_interactions_together():
+    meds = ["amoxicillin", "carprofen", "gabapentin", "omeprazole", "prednisone", "tramadol",
+            "fluoxetine", "maropitant", "furosemide", "enalapril"]
+    pairs = [("carprofen", "prednisone"), ("tramadol", "fluoxetine"), ("furosemide", "enalapril"),
+             ("carprofen", "enalapril"), ("amoxicillin", "maropitant")]
+    chunks = plan_chunks(meds, pairs, size=4, overlap=1)
+
+    assert all(1 <= len(chunk) <= 4 and chunk == sorted(chunk) for chunk in chunks)
+    assert set().union(*chunks) == set(range(len(meds)))
+    for a, b in pairs:
+        assert any({meds.index(a), meds.index(b)} <= set(chunk) for chunk in chunks), (a, b)
+    assert plan_chunks(meds, pairs, size=4, overlap=1) == chunks
+    assert plan_chunks(meds[:3], pairs) == [[0, 1, 2]]
+
+
+def test_merge_takes_highest_risk_and_dedupes_interleaved_capped_lists():
+    analyses = [
+        {"analysis": "A", "riskLevel": "Medium", "recommendations": ["Give with food", "Keep a log", "Recheck in 2 weeks"],
+         "warnings": ["NSAID + steroid"], "alternatives": [], "sources": ["Plumb's"]},
+        {"analysis": "B", "riskLevel": "High", "recommendations": ["keep a log.", "Monitor serotonin signs"],
+         "warnings": [], "alternatives": ["Gabapentin"], "sources": ["Plumb's"]},
+        {"analysis": "Unable to parse", "riskLevel": "Unknown", "recommendations": ["Consult your veterinarian"],
+         "warnings": [], "alternatives": [], "sources": []},
+    ]
+    merged, failed = merge_analyses(analyses, ["carprofen, prednisone", "tramadol, fluoxetine", "furosemide"],
+                                    RISK_LEVELS, max_items=3)
+    assert merged["riskLevel"] == "High"
+    assert merged["analysis"].startswith("carprofen, prednisone: A\n\ntramadol, fluoxetine: B")
+    assert merged["recommendations"] == ["Give with food", "keep a log.", "Consult your veterinarian"]
+    assert merged["sources"] == ["Plumb's"] and merged["alternatives"] == ["Gabapentin"]
+    assert failed == ["furosemide"] and "furosemide" in merged["warnings"][0]
+    assert merge_analyses(analyses[2:], ["x"], RISK_LEVELS)[1] == []
+
+
+def test_prompt_lists_every_medication_on_its_own_line():
+    meds = [f"medication{i:02d}" for i in range(16)]
+    prompt = asyncio.run(secure_analyze_medications({"species": "dog"}, [{"name": name} for name in meds]))
+    assert [line for line in prompt.splitlines() if line.startswith("- ")] == [f"- {name}" for name in meds]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped compiled knowledge base
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import pytest
+
+from compiled_knowledge import CompiledFormatError, CompiledKnowledge, read_version
+from dosage import DoseReferenceTable
+from drug_classes import DrugOntology
+from knowledge import ToxinIndex
+from knowledge_store import KNOWLEDGE_SOURCES, KnowledgeStore
+from medication_index import MedicationIndex
+
+
+def compiled_store(tmp: str) -> KnowledgeStore:
+    sources = {}
+    for name, path in KNOWLEDGE_SOURCES.items():
+        sources[name] = os.path.join(tmp, os.path.basename(path))
+        shutil.copy(path, sources[name])
+    return KnowledgeStore(sources=sources, poll_interval=0, compiled_path=os.path.join(tmp, "knowledge.kb"))
+
+
+def test_compiled_answers_match_json_indexes():
+    with tempfile.TemporaryDirectory() as tmp:
+        kb = compiled_store(tmp).current
+        toxin_index, dose_reference_table, drug_ontology = ToxinIndex.load(), DoseReferenceTable.load(), DrugOntology.load()
+        for species, medication in [("cat", "Tylenol 500mg"), ("dog", "raisins"), ("dog", "permethrin"),
+                                    ("bird", "acetaminophen"), ("cat", "Seresto (Bayer)"), ("cat", "Bufferin"),
+                                    ("cat", "aspirin-free pain relief")]:
+            assert kb.toxins.lookup(species, medication) == toxin_index.lookup(species, medication)
+        for medication in ["Rimadyl", "Metacam 1.5mg/ml", "amoxicillin", "unknown"]:
+            assert kb.doses.lookup("dog", medication) == dose_reference_table.lookup("dog", medication)
+
+        names = sorted(drug_ontology._drugs)
+        rng = random.Random(3)
+        for _ in range(200):
+            regimen = rng.sample(names, rng.randint(2, 20))
+            for species in ("dog", "cat"):
+                assert kb.interactions.find_interactions(species, regimen) == \
+                    drug_ontology.find_interactions(species, regimen)
+        assert kb.interactions.classes_of("Metacam") == ["nsaid"]
+        assert kb.interactions.rule_count == drug_ontology.rule_count
+
+        suggestions = MedicationIndex.load()
+        for query in ["car", "r", "Tyl", "choc", "zzz"]:
+            for species in ("", "cat", "dog"):
+                assert kb.suggestions.search(query, species) == suggestions.search(query, species)
+        for text in ["Rimadyl", "ibuprofen", "unknown"]:
+            assert kb.suggestions.resolve(text) == suggestions.resolve(text)
+        assert kb.suggestions.mentions("Is Rimadyl ok with chocolate?") == suggestions.mentions("Is Rimadyl ok with chocolate?")
+
+
+def test_store_recompiles_when_sources_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = compiled_store(tmp)
+        first = store.current
+        assert read_version(store.compiled_path) == first.version
+
+        with open(store.sources["toxic"]) as f:
+            data = json.load(f)
+        data["toxic_medications"]["cats"].append({"name": "Lilies", "toxicity_level": "high"})
+        with open(store.sources["toxic"], "w") as f:
+            json.dump(data, f)
+        assert store.reload()["reloaded"]
+
+        assert read_version(store.compiled_path) == store.current.version != first.version
+        assert store.current.toxins.lookup("cat", "lilies").name == "Lilies"
+        # The previous mapping stays readable for requests that still hold it
+        assert first.toxins.lookup("cat", "lilies") is None
+        assert first.toxins.lookup("cat", "tylenol").name == "Acetaminophen"
+
+
+def test_rejects_foreign_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bogus.kb")
+        with open(path, "wb") as f:
+            f.write(b"not a knowledge base at all, just some bytes")
+        with pytest.raises(CompiledFormatError):
+            CompiledKnowledge(path)
+        assert read_version(path) is None
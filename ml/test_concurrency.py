@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive upstream concurrency limiter
+"""
+
+import asyncio
+
+from admission import AdmissionScheduler, ClientIdentity
+from concurrency import AdaptiveConcurrencyLimiter, RequestHedger, retry_after_from
+from fake_upstream import FakeRateLimitError
+from metrics import metrics
+
+
+def test_grows_while_latency_is_stable():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=64)
+    for _ in range(20):
+        limiter.record("ok", 0.05, in_flight=int(limiter.limit))
+    assert limiter.limit > 4
+
+
+def test_backs_off_on_latency_and_rate_limits():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=32, decrease_cooldown=0.0)
+    limiter.record("ok", 0.05, in_flight=31)
+    before = limiter.limit
+    limiter.record("ok", 0.5, in_flight=31)
+    assert limiter.limit < before
+
+    before = limiter.limit
+    limiter.record("rate_limited", 0.0, retry_after=5.0)
+    assert limiter.limit == before * 0.5
+    assert limiter.allowed() == 0
+    assert 4.0 < limiter.blocked_for() <= 5.0
+
+
+def test_retry_after_hint_extraction():
+    class Response:
+        headers = {"retry-after-ms": "1500"}
+
+    class Error(Exception):
+        response = Response()
+
+    assert retry_after_from(Error()) == 1.5
+    assert retry_after_from(FakeRateLimitError(0.25)) == 0.25
+    assert retry_after_from(ValueError()) is None
+
+
+def test_scheduler_waits_out_retry_after():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+        scheduler = AdmissionScheduler(max_concurrency=8, limiter=limiter, initial_service_time=0.01)
+        client = ClientIdentity(key="ip:a", budget=5)
+        async with scheduler.slot(client) as slot:
+            slot.rate_limited(0.2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with scheduler.slot(client):
+            pass
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) >= 0.15
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        hedger = RequestHedger(enabled=True, percentile=0.9, max_hedge_rate=1.0, min_samples=10, min_delay=0.0)
+        for _ in range(10):
+            hedger.record(0.02)
+        latencies, cancelled = iter([1.0, 0.01]), []
+
+        async def call():
+            latency = next(latencies)
+            try:
+                await asyncio.sleep(latency)
+            except asyncio.CancelledError:
+                cancelled.append(latency)
+                raise
+            return latency
+
+        started = asyncio.get_running_loop().time()
+        result = await hedger.run(call)
+        await asyncio.sleep(0)
+        return result, asyncio.get_running_loop().time() - started, cancelled
+
+    fired, won = metrics.counter("upstream_hedges_fired_total"), metrics.counter("upstream_hedges_won_total")
+    result, elapsed, cancelled = asyncio.run(scenario())
+    assert result == 0.01 and elapsed < 0.5 and cancelled == [1.0]
+    assert metrics.counter("upstream_hedges_fired_total") == fired + 1
+    assert metrics.counter("upstream_hedges_won_total") == won + 1
+
+
+def test_hedge_rate_is_capped():
+    async def scenario():
+        hedger = RequestHedger(enabled=True, max_hedge_rate=0.25, min_samples=1, min_delay=0.0, burst=1.0,
+                               refresh_every=1000)
+        hedger.record(0.0)
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+
+        for _ in range(20):
+            await hedger.run(call)
+        return calls
+
+    # One hedge per four calls at most
+    assert asyncio.run(scenario()) == 25
+
+
+def test_hedges_take_their_own_slot_and_never_exceed_the_limit():
+    async def scenario(max_concurrency: int):
+        scheduler = AdmissionScheduler(max_concurrency=max_concurrency, initial_service_time=0.01)
+        client = ClientIdentity(key="ip:a", budget=5)
+        hedger = RequestHedger(enabled=True, max_hedge_rate=1.0, min_samples=1, min_delay=0.0)
+        hedger.record(0.01)
+        latencies, peak = iter([0.2, 0.01]), []
+
+        async def call(acquired: bool = False):
+            async with scheduler.slot(client, acquired=acquired):
+                peak.append(scheduler.in_flight)
+                await asyncio.sleep(next(latencies))
+
+        def hedge_call():
+            return call(acquired=True) if scheduler.try_acquire(client) else None
+
+        await hedger.run(call, hedge_call)
+        await asyncio.sleep(0)
+        return max(peak), scheduler.in_flight
+
+    fired = metrics.counter("upstream_hedges_fired_total")
+    saturated = metrics.counter("upstream_hedges_skipped_total", reason="saturated")
+    # Saturated: the slow call runs alone and no hedge is sent
+    assert asyncio.run(scenario(1)) == (1, 0)
+    assert metrics.counter("upstream_hedges_fired_total") == fired
+    assert metrics.counter("upstream_hedges_skipped_total", reason="saturated") == saturated + 1
+    # With a free slot the hedge holds it, and both slots are released afterwards
+    assert asyncio.run(scenario(2)) == (2, 0)
+    assert metrics.counter("upstream_hedges_fired_total") == fired + 1
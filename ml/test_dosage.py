@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the dosage parser and weight-normalized dose-range checker
+"""
+
+from dosage import (DoseReferenceTable, check_regimen, parse_dosage, parse_frequency, parse_reference_dosage,
+                    weight_in_kg)
+
+TABLE = DoseReferenceTable.load()
+
+
+def test_parse_dosage_strings():
+    assert parse_dosage("75mg").amount_mg == 75
+    assert parse_dosage("100 mcg").amount_mg == 0.1
+    assert parse_dosage("0.5 mg/kg").per_kg
+    half = parse_dosage("1/2 tablet")
+    assert (half.amount, half.unit, half.amount_mg) == (0.5, "tablet", None)
+    assert parse_dosage("as directed") is None
+
+
+def test_parse_frequency_strings():
+    assert parse_frequency("twice daily") == 2
+    assert parse_frequency("BID") == 2
+    assert parse_frequency("every 8-12 hours") == 3
+    assert parse_frequency("q12h") == 2
+    assert parse_frequency("3 times a day") == 3
+    assert parse_frequency("once daily") == 1
+    assert parse_frequency("as needed") is None
+
+
+def test_parse_weekly_and_monthly_frequencies():
+    assert parse_frequency("twice a week") == parse_frequency("twice weekly") == 2 / 7
+    assert parse_frequency("three times a week") == parse_frequency("3x per week") == 3 / 7
+    assert parse_frequency("once a month") == parse_frequency("once monthly") == 1 / 30
+    assert parse_frequency("every 3 days") == 1 / 3
+    assert parse_frequency("every 2 weeks") == 1 / 14
+    assert parse_frequency("every other day") == 0.5
+    assert parse_frequency("weekly") == 1 / 7
+    # A weekly schedule is not a daily overdose
+    findings = check_regimen("cat", 4, "kg", [{"name": "Metacam", "dosage": "0.2 mg", "frequency": "twice a week"}], TABLE)
+    assert not [f for f in findings if f["finding"] == "overdose"]
+
+
+def test_reference_and_weight_conversion():
+    assert parse_reference_dosage("2-4 mg/kg twice daily") == (4.0, 8.0)
+    assert round(weight_in_kg(10, "lbs"), 3) == 4.536
+    assert weight_in_kg(0, "kg") is None
+
+
+def test_regimen_flags_only_clear_outliers():
+    regimen = [
+        {"name": "Rimadyl", "dosage": "300mg", "frequency": "twice daily"},  # 20 mg/kg/day
+        {"name": "carprofen", "dosage": "75mg", "frequency": "twice daily"},  # 5 mg/kg/day, in range
+        {"name": "Apoquel", "dosage": "1 mg", "frequency": "once daily"},  # far below range
+        {"name": "mystery drug", "dosage": "5000mg", "frequency": "daily"},  # no reference
+    ]
+    findings = check_regimen("dog", 30, "kg", regimen, TABLE)
+    assert [(f["medication"], f["finding"], f["severity"]) for f in findings] == [
+        ("Rimadyl", "overdose", "high"),
+        ("Apoquel", "underdose", "moderate"),
+    ]
+    assert findings[0]["referenceName"] == "carprofen"
+    assert findings[0]["dailyDoseMgPerKg"] == 20.0
+
+
+def test_weight_unit_and_per_kg_doses():
+    # 66 lb is ~30 kg, so 75mg twice daily stays in range
+    assert check_regimen("dog", 66, "lbs", [{"name": "carprofen", "dosage": "75mg", "frequency": "BID"}], TABLE) == []
+    findings = check_regimen("cat", 4, "kg", [{"name": "gabapentin", "dosage": "25 mg/kg", "frequency": "q8h"}], TABLE)
+    assert findings[0]["dailyDoseMgPerKg"] == 75.0
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the drug-class ontology and bitset interaction checks
+"""
+
+import itertools
+
+from drug_classes import DrugOntology
+
+CLASSES = {
+    "drug_classes": {
+        "nsaid": {"name": "NSAIDs", "members": ["Carprofen", "Meloxicam", "Aspirin"]},
+        "corticosteroid": {"name": "Corticosteroids", "members": ["Prednisone", "Prednisolone"]},
+    },
+    "class_interactions": [
+        {"class1": "nsaid", "class2": "corticosteroid", "severity": "major", "riskLevel": "high",
+         "mechanism": "GI ulceration"},
+        {"class1": "nsaid", "class2": "nsaid", "severity": "major", "riskLevel": "high",
+         "mechanism": "Dual COX inhibition"},
+    ],
+}
+INTERACTIONS = {
+    "drug_interactions": [
+        {"drug1": "carprofen", "drug2": "phenobarbital", "species": ["dog"], "severity": "minor",
+         "riskLevel": "low", "mechanism": "Induced metabolism"},
+        {"drug1": "cisapride", "drug2": "ketoconazole", "species": ["dog", "cat"], "severity": "major",
+         "riskLevel": "critical", "mechanism": "CYP3A4 inhibition"},
+    ]
+}
+
+
+def build():
+    return DrugOntology.from_dicts(CLASSES, INTERACTIONS, common={
+        "common_medications": {"dogs": [{"name": "Carprofen", "brand_names": ["Rimadyl"]}]}
+    })
+
+
+def test_class_rule_covers_unlisted_pairs():
+    findings = build().find_interactions("dog", ["Rimadyl 75mg", "Prednisolone 5mg"])
+    assert len(findings) == 1
+    assert findings[0]["medications"] == ["Rimadyl 75mg", "Prednisolone 5mg"]
+    assert findings[0]["ruleLevel"] == "class"
+    assert findings[0]["rule"] == "NSAIDs + Corticosteroids"
+
+
+def test_same_class_rule_and_no_self_interaction():
+    ontology = build()
+    assert ontology.find_interactions("dog", ["carprofen", "Carprofen 25mg"]) == []
+    findings = ontology.find_interactions("cat", ["meloxicam", "aspirin"])
+    assert [f["mechanism"] for f in findings] == ["Dual COX inhibition"]
+
+
+def test_species_filter_and_drug_rules():
+    ontology = build()
+    assert ontology.find_interactions("cat", ["carprofen", "phenobarbital"]) == []
+    dog = ontology.find_interactions("canine", ["carprofen", "phenobarbital"])
+    assert dog[0]["riskLevel"] == "low" and dog[0]["ruleLevel"] == "drug"
+    critical = ontology.find_interactions("cat", ["ketoconazole", "cisapride", "unknown herb"])
+    assert critical[0]["riskLevel"] == "critical"
+
+
+def test_bitset_matches_pairwise_enumeration():
+    ontology = DrugOntology.load()
+    names = sorted(ontology._drugs)[:25]
+    pairs = {
+        frozenset((a, b))
+        for a, b in itertools.combinations(names, 2)
+        if ontology.find_interactions("dog", [a, b])
+    }
+    assert pairs == {frozenset(f["drugs"]) for f in ontology.find_interactions("dog", names)}
+
+
+def test_curated_data_loads():
+    drug_ontology = DrugOntology.load()
+    assert drug_ontology.classes_of("Metacam") == ["nsaid"]
+    findings = drug_ontology.find_interactions("dog", ["furosemide", "benazepril"])
+    assert findings and findings[0]["riskLevel"] == "medium"
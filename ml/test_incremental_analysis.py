@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental re-analysis of a regimen that gains one medication
+"""
+
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+import main
+from analysis_store import AnalysisStore
+from fake_upstream import FakeUpstream, create_app
+
+SCOPE = ("v1", "p1", "dog|w3|adult|")
+
+
+def test_only_a_single_added_medication_extends_a_stored_analysis():
+    store = AnalysisStore(max_parts=2)
+    analysis_id = store.store(SCOPE, "q", ["carprofen@75mg", "gabapentin"], [("carprofen, gabapentin", {})])
+    assert analysis_id == AnalysisStore.fingerprint(SCOPE, "q", ("gabapentin", "carprofen@75mg"))
+
+    base, added = store.extension(analysis_id, SCOPE, "q", ["gabapentin", "tramadol", "carprofen@75mg"])
+    assert base.analysis_id == analysis_id and added == 1
+    # Two additions, a removal, a dose change, another pet bucket or question, or an unknown id
+    for entries in (["carprofen@75mg", "gabapentin", "tramadol", "trazodone"], ["carprofen@75mg", "tramadol"],
+                    ["carprofen@100mg", "gabapentin", "tramadol"]):
+        assert store.extension(analysis_id, SCOPE, "q", entries) is None
+    assert store.extension(analysis_id, SCOPE[:2] + ("dog|w4|adult|",), "q", ["carprofen@75mg", "gabapentin", "x"]) is None
+    assert store.extension(analysis_id, SCOPE, "other", ["carprofen@75mg", "gabapentin", "x"]) is None
+    assert store.extension("missing", SCOPE, "q", ["carprofen@75mg", "gabapentin", "x"]) is None
+
+    longer = store.store(SCOPE, "q", ["a", "b", "c"], [("a, b", {}), ("c (added)", {})])
+    assert store.extension(longer, SCOPE, "q", ["a", "b", "c", "d"]) is None
+
+
+def test_added_medication_is_analyzed_alone_and_merged(monkeypatch):
+    prompts = []
+
+    def respond(messages):
+        prompts.append(messages[-1]["content"])
+        drug = messages[-1]["content"].split("New medication: ")[-1].split("\n")[0]
+        return json.dumps({"analysis": f"About {drug}.", "riskLevel": "Medium" if "New" in prompts[-1] else "Low",
+                           "recommendations": [f"Monitor for {drug}"], "warnings": [], "sources": []})
+
+    upstream = FakeUpstream(base_latency=0.001, responder=respond)
+    monkeypatch.setattr(main, "openai_client", AsyncOpenAI(
+        api_key="test", base_url="http://upstream/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)))))
+    monkeypatch.setattr(main, "RATE_LIMIT_REQUESTS", 10 ** 6)
+    monkeypatch.setattr(main.semantic_cache, "enabled", False)
+    client = TestClient(main.app)
+    pet = {"species": "dog", "weight": 20, "weightUnit": "kg", "age": 5, "ageUnit": "years"}
+    regimen = [{"name": "carprofen", "dosage": "75 mg", "frequency": "twice daily"},
+               {"name": "gabapentin", "dosage": "100 mg", "frequency": "twice daily"}]
+
+    first = client.post("/analyze-medications", json={"pet": pet, "medications": regimen}).json()
+    grown = regimen + [{"name": "tramadol", "dosage": "50 mg", "frequency": "twice daily"}]
+    second = client.post("/analyze-medications", json={"pet": pet, "medications": grown,
+                                                       "previousAnalysisId": first["analysisId"]}).json()
+
+    assert prompts[-1].startswith("Task: analyze_addition") and "New medication: tramadol" in prompts[-1]
+    assert "- carprofen\n- gabapentin\n" in prompts[-1]
+    assert second["riskLevel"] == "Medium" and second["analysis"].endswith("tramadol (added): About tramadol.")
+    assert second["analysisId"] not in (None, first["analysisId"])
+
+    # A known toxin is answered from the knowledge base without a model call
+    calls = len(prompts)
+    toxic = grown + [{"name": "xylitol", "dosage": "1 g", "frequency": "once"}]
+    third = client.post("/analyze-medications", json={"pet": pet, "medications": toxic,
+                                                      "previousAnalysisId": second["analysisId"]}).json()
+    assert len(prompts) == calls and third["riskLevel"] == "Critical"
+    assert not any("no safe dose" in warning for warning in third["warnings"])
+
+    # A medium-toxicity entry raises the regimen to High, not Critical
+    medium = grown + [{"name": "acetaminophen", "dosage": "100 mg", "frequency": "once"}]
+    fourth = client.post("/analyze-medications", json={"pet": pet, "medications": medium,
+                                                       "previousAnalysisId": second["analysisId"]}).json()
+    assert len(prompts) == calls and fourth["riskLevel"] == "High"
+    assert "acetaminophen (added): Acetaminophen can be toxic to dogs (medium toxicity)." in fourth["analysis"]
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the curated species toxin index
+"""
+
+from knowledge import ToxinIndex, candidate_names, name_aliases, normalize_species
+
+toxin_index = ToxinIndex.load()
+
+
+def test_generic_and_brand_names_match_per_species():
+    assert toxin_index.lookup("cat", "acetaminophen").name == "Acetaminophen"
+    assert toxin_index.lookup("Cats", "Tylenol 500mg").name == "Acetaminophen"
+    assert toxin_index.lookup("feline", "Advantix").name == "Permethrin"
+    assert toxin_index.lookup("dog", "raisins").name == "Grapes/Raisins"
+    # Permethrin is only listed as a cat toxin
+    assert toxin_index.lookup("dog", "permethrin") is None
+    assert toxin_index.lookup("cat", "gabapentin") is None
+    assert toxin_index.lookup("bird", "acetaminophen") is None
+
+
+def test_descriptive_brand_names_are_not_aliases():
+    index = ToxinIndex.from_dict({"toxic_medications": {"dogs": [
+        {"name": "Xylitol", "brand_names": ["Various sugar-free products"], "toxicity_level": "high"}
+    ]}})
+    assert index.lookup("dog", "sugar free products") is None
+    assert index.lookup("dog", "xylitol gum").toxicity_level == "high"
+
+
+def test_makers_and_negated_names_do_not_match():
+    # Bayer makes aspirin, but also these cat flea and worm products
+    for product in ("Advantage II by Bayer", "Bayer Drontal", "Seresto (Bayer)"):
+        assert toxin_index.lookup("cat", product) is None, product
+    assert toxin_index.lookup("cat", "aspirin-free pain relief") is None
+    assert toxin_index.lookup("cat", "Tylenol-free formula") is None
+    assert toxin_index.lookup("cat", "non-aspirin pain reliever") is None
+    assert toxin_index.lookup("cat", "Bayer Aspirin").name == "Aspirin"
+    assert toxin_index.lookup("cat", "Bufferin (Bristol-Myers)").name == "Aspirin"
+    assert toxin_index.lookup("cat", "Pain reliever (aspirin)").name == "Aspirin"
+
+
+def test_name_helpers():
+    assert normalize_species("Dogs") == "dog"
+    assert name_aliases("Chocolate (Theobromine)") == ["chocolate theobromine", "chocolate", "theobromine"]
+    assert candidate_names("Baby Aspirin 81mg")[-3:] == ["baby", "aspirin", "81mg"]
+
+
+def test_missing_file_gives_empty_index():
+    assert ToxinIndex.load("/nonexistent/toxic.json").lookup("cat", "acetaminophen") is None
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for knowledge hot-reload and atomic snapshot swaps
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import main
+from analysis_store import AnalysisStore
+from knowledge import COMMON_MEDICATIONS_PATH, DRUG_CLASSES_PATH, INTERACTIONS_PATH, TOXIC_MEDICATIONS_PATH
+from knowledge_store import KnowledgeStore
+from semantic_cache import SemanticCache
+
+
+def make_store(tmp: str) -> KnowledgeStore:
+    sources = {}
+    for name, path in (("toxic", TOXIC_MEDICATIONS_PATH), ("common", COMMON_MEDICATIONS_PATH),
+                       ("classes", DRUG_CLASSES_PATH), ("interactions", INTERACTIONS_PATH)):
+        sources[name] = os.path.join(tmp, os.path.basename(path))
+        shutil.copy(path, sources[name])
+    return KnowledgeStore(sources=sources, poll_interval=0)
+
+
+def add_cat_toxin(store: KnowledgeStore, name: str):
+    path = store.sources["toxic"]
+    with open(path) as f:
+        data = json.load(f)
+    data["toxic_medications"]["cats"].append({"name": name, "toxicity_level": "high", "symptoms": ["Vomiting"]})
+    with open(path, "w") as f:
+        json.dump(data, f)
+    # Make sure the stat-based watcher sees a change even on coarse mtime filesystems
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+
+
+def test_reload_swaps_only_changed_indexes_and_notifies():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp)
+        before = store.current
+        assert store.current.toxins.lookup("cat", "lilies") is None
+        notified = []
+        store.subscribe(lambda changed, snapshot: notified.append((changed, snapshot.version)))
+
+        assert store.check_for_changes() is False
+        add_cat_toxin(store, "Lilies")
+        assert store.check_for_changes() is True
+
+        after = store.current
+        assert after.version != before.version
+        assert after.toxins.lookup("cat", "lilies").name == "Lilies"
+        # The snapshot a request already holds is untouched
+        assert before.toxins.lookup("cat", "lilies") is None
+        # Dose table does not depend on the toxin file and is reused as-is
+        assert after.doses is before.doses
+        assert notified == [({"toxins", "interactions", "suggestions"}, after.version)]
+        assert store.status()["reloads"] == 1
+
+
+def test_invalid_files_are_rejected_and_previous_snapshot_kept():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp)
+        before = store.current
+        with open(store.sources["toxic"], "w") as f:
+            f.write('{"toxic_medications": {"cats": [')
+        outcome = store.reload()
+        assert not outcome["reloaded"] and "not valid JSON" in outcome["error"]
+        assert store.current is before
+        assert store.status()["last_error"]
+
+        with open(store.sources["toxic"], "w") as f:
+            json.dump({"toxic_medications": {}}, f)
+        assert "empty toxin index" in store.reload()["error"]
+        assert store.current is before
+
+
+def test_unchanged_files_do_not_reload_unless_forced():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp)
+        assert store.reload()["reloaded"] is False
+        forced = store.reload(force=True)
+        assert forced["reloaded"] and forced["changed"] == ["doses", "interactions", "suggestions", "toxins"]
+
+
+def test_reload_clears_analyses_built_from_the_old_version(monkeypatch):
+    cache, analyses = SemanticCache(), AnalysisStore()
+    monkeypatch.setattr(main, "semantic_cache", cache)
+    monkeypatch.setattr(main, "analysis_store", analyses)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp)
+        store.subscribe(main.drop_stale_analyses)
+        cache.store(("v1",), "is it safe", {"riskLevel": "Low"})
+        analyses.store(("v1",), "is it safe", ["carprofen"], [("full", {"riskLevel": "Low"})])
+        assert len(cache) == len(analyses) == 1
+
+        add_cat_toxin(store, "Lilies")
+        assert store.check_for_changes() is True
+        assert len(cache) == len(analyses) == 0
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the medication autocomplete prefix index
+"""
+
+from fastapi.testclient import TestClient
+
+import main
+from medication_index import MedicationIndex
+
+COMMON = {"common_medications": {
+    "dogs": [{"name": "Carprofen", "brand_names": ["Rimadyl"], "category": "NSAID"},
+             {"name": "Cephalexin", "brand_names": ["Keflex"], "category": "Antibiotic"}],
+    "cats": [{"name": "Meloxicam", "brand_names": ["Metacam"], "category": "NSAID"}],
+}}
+TOXIC = {"toxic_medications": {
+    "cats": [{"name": "Acetaminophen", "brand_names": ["Tylenol"], "toxicity_level": "critical"}],
+    "dogs": [{"name": "Chocolate (Theobromine)", "brand_names": ["Various chocolate products"],
+              "toxicity_level": "medium"}],
+}}
+
+
+def names(suggestions):
+    return [s["name"] for s in suggestions]
+
+
+def test_prefix_matches_generic_and_brand_names_ranked_by_popularity():
+    index = MedicationIndex.from_dicts(COMMON, TOXIC)
+    assert names(index.search("c", "dog")) == ["Carprofen", "Cephalexin", "Chocolate (Theobromine)"]
+    assert names(index.search("C", "dog", limit=1)) == ["Carprofen"]
+    # Observed usage outranks the curated order
+    assert names(index.search("c", "dog", usage={"Cephalexin": 50}))[0] == "Cephalexin"
+    rimadyl = index.search("rima", "dog")[0]
+    assert rimadyl["name"] == "Carprofen" and rimadyl["matched"] == "Rimadyl"
+    assert names(index.search("theo", "dog")) == ["Chocolate (Theobromine)"]
+    assert index.search("various", "dog") == [] and index.search("  ", "dog") == []
+    assert index.resolve("KEFLEX") == "Cephalexin" and index.resolve("kef") is None
+
+
+def test_toxic_hits_are_flagged_for_the_species():
+    index = MedicationIndex.from_dicts(COMMON, TOXIC)
+    for_cat = index.search("tyl", "cats")[0]
+    assert for_cat["toxic"] and for_cat["toxicity_level"] == "critical"
+    for_dog = index.search("tyl", "dog")[0]
+    assert not for_dog["toxic"] and "toxicity_level" not in for_dog and for_dog["toxic_for"] == ["cat"]
+    assert index.search("tyl")[0]["toxic"]
+
+
+def test_suggest_endpoint_is_not_rate_limited(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_REQUESTS", 1)
+    client = TestClient(main.app)
+    for _ in range(5):
+        response = client.get("/medications/suggest", params={"q": "xyl", "species": "dog"})
+        assert response.status_code == 200
+    body = response.json()
+    assert body["knowledge_version"] == main.knowledge_store.current.version
+    assert body["suggestions"][0]["name"] == "Xylitol" and body["suggestions"][0]["toxic"]
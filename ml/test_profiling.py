@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in request profiler
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfiledRoute, RequestProfiler, profile_signature
+from prompt_security import security_filter
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.router.route_class = ProfiledRoute
+
+    @app.post("/check")
+    async def check():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            security_filter.detect_injection_attempt("Carprofen 75mg twice daily with food")
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    return app
+
+
+def wait_for_profiles(profiler: RequestProfiler, count: int) -> list:
+    deadline = time.time() + 2
+    while len(profiler.list_profiles()) < count and time.time() < deadline:
+        time.sleep(0.01)
+    return profiler.list_profiles()
+
+
+def test_signed_header_profiles_one_request(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = RequestProfiler(enabled=True, secret="s3cret", interval=0.002, directory=tmp)
+        monkeypatch.setattr(profiling, "request_profiler", profiler)
+        client = TestClient(make_app())
+
+        assert "X-Profile-Id" not in client.post("/check").headers
+        assert "X-Profile-Id" not in client.post("/check", headers={"X-Profile": "123.bogus"}).headers
+        header = profile_signature("s3cret", "/check", int(time.time()) + 60)
+        response = client.post("/check", headers={"X-Profile": header})
+        name = response.headers["X-Profile-Id"]
+
+        [meta] = wait_for_profiles(profiler, 1)
+        assert meta["name"] == name and meta["trigger"] == "header" and meta["samples"] > 0
+        with open(profiler.profile_path(name)) as f:
+            collapsed = f.read()
+        # Both on-CPU security filtering and the awaited sleep show up
+        assert "prompt_security.py:PromptSecurityFilter.detect_injection_attempt" in collapsed
+        assert profiling.WAITING_FRAME in collapsed
+        assert profiler.profile_path("../" + name) is None
+
+
+def test_ring_buffer_keeps_newest_profiles(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = RequestProfiler(enabled=True, sample_rate=1.0, interval=0.002, directory=tmp, max_profiles=2)
+        monkeypatch.setattr(profiling, "request_profiler", profiler)
+        client = TestClient(make_app())
+        names = [client.post("/check").headers["X-Profile-Id"] for _ in range(3)]
+
+        deadline = time.time() + 2
+        while not os.path.exists(os.path.join(tmp, names[-1] + ".json")) and time.time() < deadline:
+            time.sleep(0.01)
+        assert [p["name"] for p in profiler.list_profiles()] == names[:0:-1]
+
+
+def test_disabled_profiler_ignores_valid_headers(monkeypatch):
+    profiler = RequestProfiler(enabled=False, secret="s3cret", sample_rate=1.0)
+    monkeypatch.setattr(profiling, "request_profiler", profiler)
+    header = profile_signature("s3cret", "/check", int(time.time()) + 60)
+    assert "X-Profile-Id" not in TestClient(make_app()).post("/check", headers={"X-Profile": header}).headers
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the cache-friendly prompt layout
+"""
+
+import asyncio
+
+from fake_upstream import FakeUpstream
+from metrics import metrics
+from prompt_security import secure_analyze_medications, security_filter
+from prompts import (
+    ALTERNATIVES_TEMPLATE,
+    CHECK_INTERACTIONS_TEMPLATE,
+    PROMPT_PREFIX_VERSION,
+    SAFETY_CHECK_TEMPLATE,
+    SYSTEM_PROMPT,
+    build_messages,
+    compact_system_prompt,
+    prefix_caching_enabled,
+    record_prompt_usage,
+)
+
+
+def test_request_data_only_follows_the_shared_prefix():
+    prompts = [
+        asyncio.run(secure_analyze_medications({"species": "Feline", "weight": 4}, [{"name": "Meloxicam"}])),
+        security_filter.create_secure_prompt(CHECK_INTERACTIONS_TEMPLATE,
+                                             {"species": "Feline", "medications_list": "- Meloxicam"}),
+        security_filter.create_secure_prompt(ALTERNATIVES_TEMPLATE,
+                                             {"species": "Feline", "medication": "Meloxicam", "condition": "pain"}),
+        security_filter.create_secure_prompt(SAFETY_CHECK_TEMPLATE,
+                                             {"species": "Feline", "medication": "Meloxicam", "weight": "4", "age": "3"}),
+    ]
+    for prompt in prompts:
+        system, user = build_messages(prompt)
+        assert system == {"role": "system", "content": SYSTEM_PROMPT}
+        assert user["content"].startswith("Task: ") and "Meloxicam" in user["content"]
+    assert "Feline" not in SYSTEM_PROMPT and "Meloxicam" not in SYSTEM_PROMPT
+    # Long enough for providers to cache it (~1024 tokens at ~4 chars per token)
+    assert len(SYSTEM_PROMPT) // 4 >= 1024
+
+
+def test_repeated_prefix_is_served_from_the_upstream_cache():
+    upstream = FakeUpstream(base_latency=0.001, prefix_cache=True)
+    first = asyncio.run(upstream.complete(build_messages("Task: safety_check\nSpecies: dog")))
+    second = asyncio.run(upstream.complete(build_messages("Task: check_interactions\nSpecies: cat")))
+    assert first.usage["prompt_tokens_details"]["cached_tokens"] == 0
+    assert 1024 <= second.usage["prompt_tokens_details"]["cached_tokens"] <= len(SYSTEM_PROMPT) // 4
+
+
+def test_usage_recording_counts_cached_tokens_per_prefix_version():
+    before = metrics.counter("upstream_cached_prompt_tokens_total", prefix_version=PROMPT_PREFIX_VERSION)
+    usage = {"prompt_tokens": 1300, "completion_tokens": 80, "prompt_tokens_details": {"cached_tokens": 1152}}
+    assert record_prompt_usage(usage) == 1152
+    assert record_prompt_usage({"prompt_tokens": 200}) == 0
+    assert record_prompt_usage(None) is None
+    after = metrics.counter("upstream_cached_prompt_tokens_total", prefix_version=PROMPT_PREFIX_VERSION)
+    assert after - before == 1152
+
+
+def test_models_without_prefix_caching_get_a_compact_task_prompt():
+    assert prefix_caching_enabled("gpt-4o-mini", "auto")
+    assert not prefix_caching_enabled("gpt-3.5-turbo", "auto")
+    assert prefix_caching_enabled("gpt-3.5-turbo", "true")
+    assert not prefix_caching_enabled("gpt-4o", "false")
+
+    system, user = build_messages("Task: safety_check\nSpecies: dog\nMedication: Meloxicam", prefix_caching=False)
+    assert system["content"] == compact_system_prompt("safety_check")
+    assert user["content"].startswith("Task: safety_check")
+    assert '"safety": "Safe/Caution/Dangerous"' in system["content"]
+    assert "Task suggest_alternatives" not in system["content"]
+    assert len(system["content"]) < len(SYSTEM_PROMPT) // 2
+    # An unrecognized task falls back to the full prompt rather than dropping its format
+    assert build_messages("Task: unknown", prefix_caching=False)[0]["content"] == SYSTEM_PROMPT
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for the local n-gram semantic cache and canonical request keys
+"""
+
+import time
+
+from canonical import canonical_regimen, pet_bucket
+from medication_index import MedicationIndex
+from semantic_cache import SemanticCache
+
+SCOPE = ("kb", "prefix", "dog|w14|adult", ("carprofen@75mg x2/d",))
+
+
+def test_paraphrase_hits_but_negations_numbers_and_scopes_do_not():
+    cache = SemanticCache()
+    cache.store(SCOPE, "Is it safe to give these medications together?", "combine")
+    cache.store(SCOPE, "Should these be given with food?", "with food")
+
+    value, similarity = cache.lookup(SCOPE, "are these meds safe to combine")
+    assert value == "combine" and similarity >= cache.threshold
+    assert cache.lookup(SCOPE, "should I give these with food")[0] == "with food"
+    assert cache.lookup(SCOPE, "Can these be given without food?") is None
+    assert cache.lookup(SCOPE, "is it safe to give 150 mg together?") is None
+    assert cache.lookup(SCOPE, "Does carprofen affect the liver?") is None
+    assert cache.lookup(SCOPE[:3] + (("meloxicam@1.5mg x1/d",),), "are these safe to combine") is None
+
+
+
+def test_questions_about_another_drug_or_condition_do_not_hit():
+    cache = SemanticCache(mentions=MedicationIndex.load().mentions)
+    for cached, asked in [
+        ("Is it safe to give with carprofen?", "Is it safe to give with prednisone?"),
+        ("Is it safe for kidney disease?", "Is it safe for liver disease?"),
+        ("Can she have it while pregnant?", "Can she have it while nursing?"),
+    ]:
+        cache.store(SCOPE, cached, cached)
+        assert cache.lookup(SCOPE, asked) is None
+    # The same drug by brand name, or the same condition by another name, still matches
+    assert cache.lookup(SCOPE, "is it ok to give with Rimadyl")[0] == "Is it safe to give with carprofen?"
+    assert cache.lookup(SCOPE, "is it safe for renal disease")[0] == "Is it safe for kidney disease?"
+
+def test_capacity_evicts_least_recently_used_and_entries_expire(monkeypatch):
+    cache = SemanticCache(max_entries=2)
+    other = SCOPE[:2] + ("cat|w1|adult", SCOPE[3])
+    cache.store(SCOPE, "what are the side effects", "side effects")
+    cache.store(other, "what are the side effects", "cat side effects")
+    assert cache.lookup(SCOPE, "side effects to watch for") is not None
+    cache.store(SCOPE, "is this the right dose", "dose")
+
+    assert len(cache) == 2
+    assert cache.lookup(other, "what are the side effects") is None
+    assert cache.lookup(SCOPE, "what are the side effects")[0] == "side effects"
+    assert cache.lookup(SCOPE, "is the dose right")[0] == "dose"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + cache.ttl + 1)
+    assert cache.lookup(SCOPE, "what are the side effects") is None
+    assert len(cache) == 1
+
+
+def test_canonical_keys_ignore_order_spelling_and_nearby_weights():
+    resolve = lambda name: {"rimadyl": "carprofen"}.get(name.lower())
+    a = canonical_regimen([{"name": "Rimadyl", "dosage": "75 mg", "frequency": "twice daily"},
+                           {"name": "Prednisone", "dosage": "10mg", "frequency": "once daily"}], resolve)
+    b = canonical_regimen([{"name": "prednisone", "dosage": "10 mg", "frequency": "SID"},
+                           {"name": "carprofen", "dosage": "75mg", "frequency": "BID"}], resolve)
+    assert a == b == ("carprofen@75mg x2/d", "prednisone@10mg x1/d")
+
+    assert pet_bucket("Dog", 30, "kg", 4, "years") == pet_bucket("canine", 66, "lbs", 48, "months")
+    assert pet_bucket("dog", 30, "kg", 4, "years") != pet_bucket("dog", 30, "kg", 9, "years")
+    assert pet_bucket("dog", 25, "kg", 4, "years", breed="Border Collie").endswith("|mdr1")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for response content negotiation (orjson / MessagePack)
+"""
+
+import json
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from serialization import (
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    decode,
+    encode,
+    negotiated_response,
+    preferred_media_type,
+)
+
+
+class Finding(BaseModel):
+    medication: str
+    severity: str
+    dose_mg_per_kg: float
+
+
+def test_preferred_media_type_follows_accept_quality():
+    assert preferred_media_type(None) == JSON_MEDIA_TYPE
+    assert preferred_media_type("*/*") == JSON_MEDIA_TYPE
+    assert preferred_media_type("application/msgpack") == MSGPACK_MEDIA_TYPE
+    assert preferred_media_type("application/x-msgpack;q=0.9, application/json;q=0.5") == MSGPACK_MEDIA_TYPE
+    assert preferred_media_type("application/json, application/msgpack;q=0.8") == JSON_MEDIA_TYPE
+    assert preferred_media_type("application/msgpack;q=0") == JSON_MEDIA_TYPE
+
+
+def test_models_encode_the_same_in_both_formats():
+    payload = {"riskLevel": "High", "findings": [Finding(medication="carprofen", severity="low", dose_mg_per_kg=2.2)],
+               "drugs": ("carprofen", "prednisone")}
+    expected = {"riskLevel": "High", "findings": [{"medication": "carprofen", "severity": "low", "dose_mg_per_kg": 2.2}],
+                "drugs": ["carprofen", "prednisone"]}
+    assert json.loads(encode(payload)) == expected
+    assert decode(encode(payload, MSGPACK_MEDIA_TYPE), MSGPACK_MEDIA_TYPE) == expected
+
+
+def test_negotiated_response_sets_content_type_and_vary():
+    request = Request({"type": "http", "headers": [(b"accept", b"application/msgpack")]})
+    response = negotiated_response(request, {"safety": "Safe"})
+    assert response.media_type == MSGPACK_MEDIA_TYPE
+    assert response.headers["vary"] == "Accept"
+    assert decode(response.body, MSGPACK_MEDIA_TYPE) == {"safety": "Safe"}
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for queued, sampled structured logging
+"""
+
+import io
+import json
+import logging
+import queue
+import threading
+
+from metrics import metrics
+from structured_logging import (DroppingQueueHandler, JsonFormatter, SamplingFilter,
+                                request_id_var, setup_logging, shutdown_logging)
+
+
+def test_json_lines_with_request_id_and_truncation():
+    stream = io.StringIO()
+    setup_logging(level="INFO", stream=stream, max_message_chars=20)
+    token = request_id_var.set("req-123")
+    try:
+        logging.getLogger("test").info("x" * 100, extra={"endpoint": "/health"})
+    finally:
+        request_id_var.reset(token)
+        shutdown_logging()
+
+    entry = json.loads(stream.getvalue().strip())
+    assert entry["request_id"] == "req-123"
+    assert entry["endpoint"] == "/health"
+    assert entry["message"].startswith("x" * 20)
+    assert "truncated 80 chars" in entry["message"]
+
+
+def test_repeated_call_site_is_rate_limited():
+    sampler = SamplingFilter(burst=3, interval=60)
+    record = logging.LogRecord("test", logging.WARNING, "prompt_security.py", 10, "blocked", None, None)
+    passed = sum(sampler.filter(record) for _ in range(10))
+    assert passed == 3
+
+    critical = logging.LogRecord("test", logging.CRITICAL, "main.py", 1, "down", None, None)
+    assert all(sampler.filter(critical) for _ in range(10))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = metrics.counter("log_records_dropped_total")
+    for _ in range(3):
+        handler.emit(logging.LogRecord("test", logging.INFO, "x.py", 1, "msg", None, None))
+    assert metrics.counter("log_records_dropped_total") == before + 2
+
+
+def test_shutdown_stops_the_writer_while_the_queue_is_full():
+    writing, released = threading.Event(), threading.Event()
+
+    class BlockedStream(io.StringIO):
+        def write(self, text):
+            writing.set()
+            released.wait(5)
+            return super().write(text)
+
+    stream = BlockedStream()
+    listener = setup_logging(level="INFO", stream=stream, queue_size=2, burst=100)
+    logging.getLogger("test").info("record 0")
+    assert writing.wait(5)
+    # The writer is stuck on record 0; fill the queue behind it
+    for i in range(1, 5):
+        logging.getLogger("test").info(f"record {i}")
+    assert listener.queue.full()
+
+    threading.Timer(0.1, released.set).start()
+    shutdown_logging()
+    assert listener._thread is None and stream.getvalue().count("\n") >= 1
+
+
+def test_formatter_reports_suppressed_count():
+    record = logging.LogRecord("test", logging.INFO, "x.py", 1, "hello %s", ("vet",), None)
+    record.suppressed = 5
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello vet"
+    assert entry["suppressed"] == 5
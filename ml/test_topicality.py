@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the local topicality gate in front of upstream calls
+"""
+
+from fastapi.testclient import TestClient
+
+import main
+from medication_index import MedicationIndex
+from metrics import metrics
+from test_medication_index import COMMON, TOXIC
+from topicality import TopicalityGate
+
+
+def test_medications_are_found_in_free_text():
+    index = MedicationIndex.from_dicts(COMMON, TOXIC)
+    assert index.mentions("Can Rimadyl be given with chocolate theobromine?") == ["Carprofen", "Chocolate (Theobromine)"]
+    assert index.mentions("What about the weather?") == []
+
+
+def test_clearly_off_topic_and_junk_input_is_rejected():
+    gate = TopicalityGate(mentions=MedicationIndex.from_dicts(COMMON, TOXIC).mentions)
+    for text in ("Is Rimadyl okay with food?", "She has been vomiting since Tuesday", "is this ok"):
+        assert gate.check(text)["on_topic"], text
+    for text in ("Write me a poem about the ocean", "Should I invest in bitcoin?", "asdfghjkl", "$$$ ### @@@"):
+        assert not gate.check(text)["on_topic"], text
+    assert gate.check("")["score"] is None
+    assert not TopicalityGate(enabled=False).check("Tell me a joke")["score"]
+
+
+def test_everyday_words_in_medication_questions_are_not_rejected():
+    gate = TopicalityGate(mentions=MedicationIndex.from_dicts(COMMON, TOXIC).mentions)
+    for text in ("Can I mix it into her food?",
+                 "Can he ride in the car after taking it?",
+                 "We're going on vacation next week, can the sitter give her pills?",
+                 "Is it ok to give before her flight tomorrow?",
+                 "She gets carsick, what can I give her for the car trip?"):
+        assert gate.check(text)["on_topic"], text
+        assert gate.check(text, medications=["carprofen"])["on_topic"], text
+    # Repeated everyday words, or one clearly unrelated request, still reject with a regimen as context
+    for text in ("Recommend a hotel for my vacation in Rome", "Who won the football game last night?"):
+        assert not gate.check(text, medications=["carprofen"])["on_topic"], text
+    # Letters in other scripts are words, not junk
+    for text in ("我的狗可以吃布洛芬吗？会不会有副作用？", "¿Puedo darle ibuprofeno a mi perro?"):
+        assert gate.features(text)["junk"] == 0.0 and gate.check(text)["on_topic"], text
+    # A medication named in the request counts even when the knowledge base does not know it
+    assert gate.features("Can I give Zorbium before the flight?", ["Zorbium"])["medication"] == 1
+
+
+def test_off_topic_query_is_rejected_before_the_upstream_call(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_REQUESTS", 10 ** 6)
+    calls = []
+
+    async def upstream(prompt):
+        calls.append(prompt)
+        return "{}"
+
+    monkeypatch.setattr(main, "call_openai_api_secure", upstream)
+    rejected = metrics.counter("topicality_decisions_total", field="query", decision="reject")
+    response = TestClient(main.app).post("/analyze-medications", json={
+        "pet": {"species": "dog", "weight": 20, "weightUnit": "kg", "age": 5, "ageUnit": "years"},
+        "medications": [{"name": "carprofen", "dosage": "75 mg", "frequency": "twice daily"}],
+        "query": "Who won the football game last night?",
+    })
+
+    assert response.status_code == 400 and calls == []
+    assert metrics.counter("topicality_decisions_total", field="query", decision="reject") == rejected + 1
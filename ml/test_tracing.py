@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for W3C trace-context propagation and stage spans
+"""
+
+import asyncio
+
+import pytest
+
+from metrics import metrics
+from tracing import STAGE_INJECTION_SCAN, STAGE_UPSTREAM, Tracer, parse_traceparent
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.payloads = []
+
+    def export(self, payload):
+        self.payloads.append(payload)
+
+    @property
+    def spans(self):
+        return [span for payload in self.payloads
+                for resource in payload["resourceSpans"]
+                for scope in resource["scopeSpans"]
+                for span in scope["spans"]]
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(PARENT) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent(PARENT[:-2] + "00")[2] is False
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_request_continues_caller_trace_with_nested_stage_spans():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter=exporter, flush_interval=60)
+
+    async def handler():
+        with tracer.span(STAGE_INJECTION_SCAN):
+            pass
+        with pytest.raises(RuntimeError):
+            with tracer.span(STAGE_UPSTREAM, **{"gen_ai.request.model": "test"}):
+                await asyncio.sleep(0)
+                raise RuntimeError("upstream down")
+
+    with tracer.request_span("POST /check-drug-interactions", PARENT) as root:
+        asyncio.run(handler())
+    tracer.flush()
+
+    spans = {span["name"]: span for span in exporter.spans}
+    assert set(spans) == {"POST /check-drug-interactions", STAGE_INJECTION_SCAN, STAGE_UPSTREAM}
+    assert {span["traceId"] for span in spans.values()} == {"4bf92f3577b34da6a3ce929d0e0e4736"}
+    assert spans["POST /check-drug-interactions"]["parentSpanId"] == "00f067aa0ba902b7"
+    assert spans[STAGE_UPSTREAM]["parentSpanId"] == root.span_id
+    assert spans[STAGE_UPSTREAM]["status"] == {"code": 2, "message": "RuntimeError: upstream down"}
+    assert spans[STAGE_UPSTREAM]["attributes"] == [{"key": "gen_ai.request.model", "value": {"stringValue": "test"}}]
+
+
+def test_unsampled_or_disabled_tracing_records_only_stage_metrics():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter=exporter)
+    with tracer.request_span("GET /health", PARENT[:-2] + "00") as root:
+        with tracer.span(STAGE_INJECTION_SCAN) as span:
+            assert root is None and span is None
+    tracer.flush()
+    assert exporter.spans == []
+
+    def scans() -> int:
+        summaries = metrics.snapshot()["summaries"].get("stage_seconds", [])
+        return sum(s["count"] for s in summaries if s["labels"] == {"stage": STAGE_INJECTION_SCAN})
+
+    before = scans()
+    with Tracer().span(STAGE_INJECTION_SCAN) as span:
+        assert span is None
+    assert scans() == before + 1
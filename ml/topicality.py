@@ -0,0 +1,146 @@
+import logging
+import math
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from knowledge_store import knowledge_store
+from metrics import metrics
+from prompt_security import security_filter
+
+logger = logging.getLogger(__name__)
+
+# Clinical vocabulary pet owners use that the security whitelist does not cover
+CLINICAL_TERMS = [
+    r'\b(vomit(ing|ed|s)?|diarrh(o)?ea|letharg(y|ic)|seizures?|itch(y|ing)?|limp(ing)?|cough(ing)?|sneez(e|ing))\b',
+    r'\b(appetite|pain|arthritis|anxiety|infection|fever|allerg(y|ic)|rash|swelling|bleeding|wound)\b',
+    r'\b(kidney|liver|heart|thyroid|stomach|bladder|urinary|joints?|skin|ears?|eyes?|teeth|dental)\b',
+    r'\b(fleas?|ticks?|worms?|heartworm|parasites?|deworm(er|ing)?|vaccin(e|es|ation))\b',
+    r'\b(surgery|spay(ed)?|neuter(ed)?|sedat(e|ion|ive)|anesthe(sia|tic)|overdose|poison(ing|ed)?)\b',
+    r'\b(mg/kg|refill|missed|chew(able|ed)?|ate|eaten|swallowed|licked|weighs?)\b',
+    r'\b(crush(ed)?|split|kibble|treats?|wet\s+food|pill\s+pockets?|refrigerat(e|ed|or))\b',
+    r'\b(pills?|tablets?|capsules?|meds|carsick|motion\s+sickness|travel\s+sickness)\b',
+]
+
+# Everyday words that also come up in questions about giving a pet its
+# medication ("before her flight", "mixed into her food"); they only count
+# as off-topic evidence when several appear together
+EVERYDAY_TERMS = [
+    r'\b(travel|hotels?|flights?|vacation|holiday|restaurants?|car|phone|game|music)\b',
+    r'\b(food|cooking|weather|temperature|climate)\b',
+]
+
+# Requests that are plainly about something else (general chat, writing, code, trivia)
+OFF_TOPIC_TERMS = [
+    r'\b(poem|story|essay|song|lyrics|joke|haiku|novel|tweet|slogan)s?\b',
+    r'\b(translate|homework|resume|cover\s+letter|email|spreadsheet)\b',
+    r'\b(python|javascript|java|sql|html|compile|algorithm|database)\b',
+    r'\b(president|capital\s+of|history\s+of|who\s+won|world\s+cup|olympics)\b',
+    r'\b(laptop|netflix|engine|book\s+me|near\s+me|to\s+buy|should\s+i\s+buy)\b',
+    r'\b(stocks?|crypto|forex|mortgage|loan|tax(es)?|salary)\b',
+    *EVERYDAY_TERMS,
+]
+
+# Runs of Unicode letters and digits, so text in any script has words
+_WORD = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+# Uppercase letters in a pattern that are not part of an escape such as \S
+_LITERAL_CASE = re.compile(r"(?<!\\)[A-Z]")
+# Keyboard mash: six consonants in a row ('asdfghjkl') or one character repeated ('zzzzzz')
+_MASH = re.compile(r"[bcdfghjklmnpqrstvwxz]{6,}|(.)\1{3,}")
+# Letters and digits in any script, whitespace and ordinary punctuation (including the
+# Spanish and CJK forms); anything else counts toward junk
+_PLAIN = re.compile(r"[^\W_]|[\s.,;:!?'\"()/%&+\-¿¡，。？！、：；（）「」]")
+
+
+class TopicalityGate:
+    """
+    Cheap local check that free-text input is about a pet's medication
+    before it costs an upstream round trip.
+
+    A tiny linear model scores six features: veterinary vocabulary (the
+    security filter's whitelist plus clinical terms), medication names
+    from the knowledge base matched on 1-3 word runs or named in the
+    request itself, whether the request carries a regimen at all, clearly
+    unrelated topics (the filter's non-medical patterns plus common
+    off-topic requests), everyday words that only count from the second
+    one on, and the share of the text that looks like keyboard mash.
+    Each pattern group is one precompiled alternation. Text scoring below
+    `threshold` is rejected; with no signal either way it passes, so only
+    strong or repeated off-topic evidence, or junk, turns input away.
+    """
+
+    WEIGHTS = {"medical": 2.0, "medication": 3.0, "regimen": 1.0, "off_topic": -2.5, "everyday": -1.25,
+               "junk": -5.0}
+    BIAS = 1.0
+    # Feature counts are capped so one long text cannot outvote the others
+    CAPS = {"medical": 3, "medication": 2, "off_topic": 3, "everyday": 3}
+
+    def __init__(self, enabled: bool = True, threshold: float = 0.5, max_chars: int = 2000,
+                 mentions: Optional[Callable[[str], List[str]]] = None):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_chars = max_chars
+        self._mentions = mentions
+        self._medical = _alternation(security_filter.medical_whitelist_patterns + CLINICAL_TERMS)
+        self._off_topic = _alternation(security_filter.non_medical_patterns + OFF_TOPIC_TERMS)
+        self._everyday = _alternation(EVERYDAY_TERMS)
+
+    @classmethod
+    def from_env(cls) -> "TopicalityGate":
+        return cls(
+            enabled=os.getenv("TOPICALITY_GATE_ENABLED", "true").lower() == "true",
+            threshold=float(os.getenv("TOPICALITY_THRESHOLD", "0.5")),
+        )
+
+    def features(self, text: str, medications: Sequence[str] = ()) -> Dict[str, float]:
+        """Feature values for `text`, asked about a regimen of `medications` (names as sent)"""
+        text = text[:self.max_chars]
+        lowered = text.lower()
+        words = _WORD.findall(lowered)
+        mentioned = set((self._mentions or knowledge_store.current.suggestions.mentions)(text))
+        mentioned.update(name for name in medications if name and re.search(rf"\b{re.escape(name.lower())}\b", lowered))
+        everyday = sum(1 for _ in self._everyday.finditer(lowered))
+        strong = sum(1 for m in self._off_topic.finditer(lowered) if not self._everyday.fullmatch(m.group()))
+        gibberish = sum(1 for w in words if _MASH.search(w))
+        symbols = 1 - len(_PLAIN.findall(text)) / len(text) if text else 0.0
+        return {
+            "medical": min(sum(1 for _ in self._medical.finditer(lowered)), self.CAPS["medical"]),
+            "medication": min(len(mentioned), self.CAPS["medication"]),
+            "regimen": float(any(medications)),
+            "off_topic": min(strong, self.CAPS["off_topic"]),
+            # One everyday word is no evidence; two or more are
+            "everyday": min(everyday, self.CAPS["everyday"]) if everyday >= 2 else 0,
+            "junk": max(gibberish / len(words) if words else 1.0, symbols),
+        }
+
+    def score(self, text: str, medications: Sequence[str] = ()) -> float:
+        """Probability-like score that `text` is about veterinary medication"""
+        z = self.BIAS + sum(self.WEIGHTS[name] * value for name, value in self.features(text, medications).items())
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def check(self, text: str, field: str = "query", medications: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Decide whether `text` may go upstream; empty text (no question asked)
+        always passes. `medications` are the names in the same request, which
+        count as on-topic context.
+        """
+        if not self.enabled or not text or not text.strip():
+            return {"on_topic": True, "score": None}
+        score = self.score(text, medications)
+        on_topic = score >= self.threshold
+        metrics.inc("topicality_decisions_total", field=field, decision="accept" if on_topic else "reject")
+        metrics.observe("topicality_score", score, field=field)
+        return {"on_topic": on_topic, "score": round(score, 4)}
+
+
+def _alternation(patterns) -> "re.Pattern":
+    """
+    One regex matching any of `patterns` in lowercased text. Lowercasing the
+    text once is much cheaper than case-insensitive matching of every branch.
+    """
+    lowered = (_LITERAL_CASE.sub(lambda m: m.group().lower(), p.replace('(?i)', '')) for p in patterns)
+    return re.compile("|".join(f"(?:{p})" for p in lowered))
+
+
+# Global topicality gate (TOPICALITY_GATE_ENABLED, TOPICALITY_THRESHOLD)
+topicality_gate = TopicalityGate.from_env()
@@ -0,0 +1,265 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages. Spans with these names also feed the `stage_seconds`
+# summary, so traces and /metrics use the same vocabulary.
+STAGE_RATE_LIMIT = "rate_limit"
+STAGE_INJECTION_SCAN = "injection_scan"
+STAGE_SANITIZE = "sanitize"
+STAGE_KNOWLEDGE = "knowledge"
+STAGE_CACHE = "cache"
+STAGE_UPSTREAM = "upstream"
+STAGE_PARSE = "parse"
+STAGE_POST_FILTER = "post_filter"
+STAGES = (STAGE_RATE_LIMIT, STAGE_INJECTION_SCAN, STAGE_SANITIZE, STAGE_KNOWLEDGE,
+          STAGE_CACHE, STAGE_UPSTREAM, STAGE_PARSE, STAGE_POST_FILTER)
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None if absent/invalid"""
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if not match or match.group(1) == INVALID_TRACE_ID or match.group(2) == INVALID_SPAN_ID:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+# Span of the code currently running; children pick it up as their parent
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class FileSpanExporter:
+    """Append OTLP/JSON trace batches, one per line (readable by the collector's otlpjsonfile receiver)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: Dict[str, Any]):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+
+
+class OtlpHttpSpanExporter:
+    """POST OTLP/JSON trace batches to a local collector"""
+
+    def __init__(self, endpoint: str, timeout: float = 2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, payload: Dict[str, Any]):
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class Tracer:
+    """
+    Minimal W3C trace-context tracer.
+
+    Continues the caller's trace from a `traceparent` header, tracks the
+    active span in a context variable, and hands finished spans to a
+    background thread that exports them in batches. With no exporter
+    configured, spans are not recorded at all; stage spans still feed the
+    `stage_seconds` metric.
+    """
+
+    def __init__(self, exporter=None, service_name: str = "pawrx-ml", sample_rate: float = 1.0,
+                 batch_size: int = 256, flush_interval: float = 1.0, queue_size: int = 10000):
+        self.exporter = exporter
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=queue_size)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        kind = os.getenv("TRACING_EXPORTER", "none").lower()
+        if kind == "file":
+            exporter = FileSpanExporter(os.getenv("TRACING_FILE", "/tmp/pawrx-traces.jsonl"))
+        elif kind == "otlp":
+            exporter = OtlpHttpSpanExporter(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"))
+        else:
+            exporter = None
+        return cls(
+            exporter=exporter,
+            service_name=os.getenv("OTEL_SERVICE_NAME", "pawrx-ml"),
+            sample_rate=float(os.getenv("TRACING_SAMPLE_RATE", "1.0")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    # Spans
+
+    @contextmanager
+    def request_span(self, name: str, traceparent: Optional[str] = None, **attributes) -> Iterator[Optional[Span]]:
+        """Server span for one incoming request, continuing the caller's trace when it sent one"""
+        if not self.enabled:
+            yield None
+            return
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < self.sample_rate
+        if not sampled:
+            yield None
+            return
+        span = Span(name=name, trace_id=trace_id, span_id=os.urandom(8).hex(), parent_id=parent_id,
+                    kind="server", attributes=attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Child span of the active span; a no-op outside a sampled request"""
+        started = time.perf_counter()
+        parent = current_span.get()
+        try:
+            if parent is None:
+                yield None
+            else:
+                span = Span(name=name, trace_id=parent.trace_id, span_id=os.urandom(8).hex(),
+                            parent_id=parent.span_id, attributes=attributes)
+                with self._activate(span):
+                    yield span
+        finally:
+            if name in STAGES:
+                metrics.observe("stage_seconds", time.perf_counter() - started, stage=name)
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[Span]:
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._enqueue(span)
+
+    # Export
+
+    def _enqueue(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            metrics.inc("trace_spans_dropped_total")
+            return
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._worker.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Export everything queued so far, in batches"""
+        with self._export_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(self.otlp_payload(batch))
+            metrics.inc("trace_spans_exported_total", len(batch))
+        except Exception as e:
+            metrics.inc("trace_spans_dropped_total", len(batch))
+            logger.warning(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def otlp_payload(self, spans: List[Span]) -> Dict[str, Any]:
+        """OTLP/JSON ExportTraceServiceRequest for a batch of spans"""
+        kinds = {"internal": 1, "server": 2, "client": 3}
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "pawrx.tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": kinds[span.kind],
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }]}
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# Global tracer, configured from the environment
+tracer = Tracer.from_env()
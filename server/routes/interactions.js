@@ -5,10 +5,13 @@ const Interaction = require('../models/Interaction');
 const { protect, petOwnerOrVet } = require('../middleware/auth');
 const { petAccessLimiter } = require('../middleware/security');
 const { sendCriticalInteractionAlert } = require('../utils/email');
+const { startClientSpan, traceRequest } = require('../utils/tracing');
 const axios = require('axios');
 const fs = require('fs').promises;
 const path = require('path');
 
+router.use(traceRequest);
+
 // @desc    Check drug interactions for a pet
 // @route   POST /api/interactions/check
 // @access  Private
@@ -198,7 +201,11 @@ router.post('/ai-analysis', petAccessLimiter, protect, async (req, res) => {
       });
     }
 
-    // Call AI service
+    // Call AI service, propagating the trace so ML stages show up under this request
+    const mlSpan = startClientSpan('POST /analyze-medications', req, {
+      'http.request.method': 'POST',
+      'server.address': process.env.ML_SERVICE_URL || 'https://pawrx-ml-production.up.railway.app'
+    });
     try {
       const aiResponse = await axios.post(`${process.env.ML_SERVICE_URL || 'https://pawrx-ml-production.up.railway.app'}/analyze-medications`, {
         pet: {
@@ -212,7 +219,10 @@ router.post('/ai-analysis', petAccessLimiter, protect, async (req, res) => {
         },
         medications: medications,
         query: query || 'Analyze these medications for potential risks and interactions'
+      }, {
+        headers: { traceparent: mlSpan.traceparent }
       });
+      mlSpan.end(null, { 'http.response.status_code': aiResponse.status });
 
       res.status(200).json({
         success: true,
@@ -220,7 +230,8 @@ router.post('/ai-analysis', petAccessLimiter, protect, async (req, res) => {
       });
 
     } catch (aiError) {
-      console.error('AI service error:', aiError.message);
+      mlSpan.end(aiError, { 'http.response.status_code': aiError.response && aiError.response.status });
+      console.error('AI service error:', aiError.message, `(trace ${mlSpan.traceId})`);
       
       // Fallback to basic analysis if AI service is unavailable
       const basicAnalysis = {
@@ -0,0 +1,118 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const axios = require('axios');
+
+// W3C trace-context propagation for calls to the ML service.
+// Spans are exported the same way as the ML service's (TRACING_EXPORTER=file|otlp),
+// so one local collector or trace file holds both sides of a request.
+
+const TRACEPARENT = /^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$/;
+const SPAN_KIND_SERVER = 2;
+const SPAN_KIND_CLIENT = 3;
+
+const parseTraceparent = (header) => {
+  const match = TRACEPARENT.exec(String(header || '').trim().toLowerCase());
+  if (!match || /^0+$/.test(match[1]) || /^0+$/.test(match[2])) {
+    return null;
+  }
+  return { traceId: match[1], spanId: match[2], sampled: (parseInt(match[3], 16) & 1) === 1 };
+};
+
+const toAttribute = (key, value) => {
+  if (typeof value === 'number') {
+    return { key, value: Number.isInteger(value) ? { intValue: String(value) } : { doubleValue: value } };
+  }
+  if (typeof value === 'boolean') {
+    return { key, value: { boolValue: value } };
+  }
+  return { key, value: { stringValue: String(value) } };
+};
+
+const exportSpan = async (span) => {
+  const exporter = (process.env.TRACING_EXPORTER || 'none').toLowerCase();
+  if (exporter === 'none' || !span.sampled) {
+    return;
+  }
+
+  const payload = {
+    resourceSpans: [{
+      resource: { attributes: [toAttribute('service.name', process.env.OTEL_SERVICE_NAME || 'pawrx-server')] },
+      scopeSpans: [{
+        scope: { name: 'pawrx.tracing' },
+        spans: [{
+          traceId: span.traceId,
+          spanId: span.spanId,
+          ...(span.parentSpanId ? { parentSpanId: span.parentSpanId } : {}),
+          name: span.name,
+          kind: span.kind,
+          startTimeUnixNano: String(span.startNs),
+          endTimeUnixNano: String(span.endNs),
+          attributes: Object.entries(span.attributes)
+            .filter(([, value]) => value !== undefined && value !== null)
+            .map(([key, value]) => toAttribute(key, value)),
+          status: span.error ? { code: 2, message: span.error } : { code: 1 }
+        }]
+      }]
+    }]
+  };
+
+  try {
+    if (exporter === 'file') {
+      await fs.promises.appendFile(process.env.TRACING_FILE || '/tmp/pawrx-traces.jsonl', JSON.stringify(payload) + '\n');
+    } else if (exporter === 'otlp') {
+      const endpoint = (process.env.OTEL_EXPORTER_OTLP_ENDPOINT || 'http://localhost:4318').replace(/\/$/, '');
+      await axios.post(`${endpoint}/v1/traces`, payload, { timeout: 2000 });
+    }
+  } catch (error) {
+    console.error('Span export failed:', error.message);
+  }
+};
+
+const startSpan = (name, kind, parent, attributes) => {
+  const span = {
+    name,
+    kind,
+    attributes: { ...attributes },
+    traceId: parent ? parent.traceId : crypto.randomBytes(16).toString('hex'),
+    spanId: crypto.randomBytes(8).toString('hex'),
+    parentSpanId: parent ? parent.spanId : undefined,
+    sampled: parent ? parent.sampled : true,
+    startNs: BigInt(Date.now()) * 1000000n,
+    startHr: process.hrtime.bigint()
+  };
+
+  return {
+    traceId: span.traceId,
+    traceparent: `00-${span.traceId}-${span.spanId}-${span.sampled ? '01' : '00'}`,
+    end: (error, extraAttributes = {}) => {
+      span.endNs = span.startNs + (process.hrtime.bigint() - span.startHr);
+      span.error = error ? error.message || String(error) : undefined;
+      Object.assign(span.attributes, extraAttributes);
+      exportSpan(span);
+    }
+  };
+};
+
+// Express middleware: a server span per request, continuing the caller's trace if it sent one
+const traceRequest = (req, res, next) => {
+  const span = startSpan(`${req.method} ${req.baseUrl}${req.path}`, SPAN_KIND_SERVER,
+    parseTraceparent(req.headers.traceparent), { 'http.request.method': req.method, 'url.path': req.originalUrl });
+  req.traceSpan = span;
+  res.on('finish', () => span.end(null, { 'http.response.status_code': res.statusCode }));
+  next();
+};
+
+// Start a client span for an outgoing call under the current request's span.
+// Send `span.traceparent` with the call and call `span.end()` when it completes.
+const startClientSpan = (name, req, attributes = {}) => {
+  const parent = req && req.traceSpan
+    ? parseTraceparent(req.traceSpan.traceparent)
+    : parseTraceparent(req && req.headers && req.headers.traceparent);
+  return startSpan(name, SPAN_KIND_CLIENT, parent, attributes);
+};
+
+module.exports = {
+  parseTraceparent,
+  startClientSpan,
+  traceRequest
+};